@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+End-to-end load test for the handcuffs monitor
+Starts the stub storefront (benchmarks/stub_storefront.py) in its own process
+with thousands of synthetic SKUs, then runs the real monitor scheduler, fetch,
+parse, state store, event and email pipeline against it for a fixed time.
+Reports check throughput, time from each stock flip to its detection
+(p50/p99), request outcomes, and the monitor's memory and CPU
+
+Usage: python benchmarks/bench_load.py [--skus N] [--duration S] [--interval S] [--latency-ms MS] ...
+"""
+
+import argparse
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from stub_storefront import DEFAULTS as STUB_DEFAULTS, flip_times, sku_url
+
+STUB = os.path.join(ROOT, "benchmarks", "stub_storefront.py")
+
+
+def rss_bytes():
+    """Current resident set size, or the peak where the current one isn't available."""
+    try:
+        with open("/proc/self/statm", 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Bytes on macOS, KiB elsewhere
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def start_stub(args):
+    """Launch the storefront process and return (process, its first line: ports and start time)."""
+    argv = [sys.executable, STUB, '--skus', str(args.skus), '--seed', str(args.seed),
+            '--in-stock-ratio', str(args.in_stock_ratio), '--flips-per-hour', str(args.flips_per_hour),
+            '--duration', str(args.duration + 60), '--latency-ms', str(args.latency_ms),
+            '--error-rate', str(args.error_rate), '--rate-limit-rate', str(args.rate_limit_rate),
+            '--retry-after', str(args.retry_after)]
+    if args.no_attributes:
+        argv.append('--no-attributes')
+    if args.listing_size:
+        argv += ['--listing-size', str(args.listing_size)]
+    if args.fail_first:
+        argv += ['--fail-first', str(args.fail_first)]
+    stub = subprocess.Popen(argv, stdout=subprocess.PIPE, text=True)
+    return stub, json.loads(stub.stdout.readline())
+
+
+def write_config(directory, args, stub):
+    base = f"http://127.0.0.1:{stub['port']}"
+    config = {
+        'items': [{'name': f"SKU {sku}", 'url': sku_url(base, sku), 'product_id': sku,
+                   'interval_seconds': args.interval}
+                  for sku in range(args.skus)],
+        'schedule': {'interval_hours': args.interval / 3600, 'jitter_seconds': args.jitter},
+        'concurrency': {'max_workers': args.workers},
+        'politeness': {'requests_per_second': args.rps, 'burst': args.rps, 'max_in_flight': args.workers,
+                       'cooldown_seconds': 10, 'max_backoff_seconds': 10},
+        'email': {'smtp_server': "127.0.0.1", 'smtp_port': stub['smtp_port'], 'starttls': False,
+                  'sender_email': "monitor@localhost", 'sender_password': "",
+                  'recipient_email': "alerts@localhost", 'coalesce_seconds': 1},
+        'state': {'database': os.path.join(directory, "state.db")},
+        'events': {'outbox': os.path.join(directory, "events.jsonl")},
+        'metrics': {'summary_file': ""},
+        'control': {'socket': ""},
+        'memory': {'rss_budget_mb': args.rss_budget_mb or None},
+    }
+    config['fetch'] = {'probe': args.probe}
+    if args.drain_bytes is not None:
+        config['fetch']['drain_bytes'] = args.drain_bytes
+    if args.catalog != 'none':
+        config['catalog'] = {'enabled': True, 'interval_seconds': args.catalog_interval or args.interval,
+                             'covered_interval_seconds': args.covered_interval,
+                             # Every page of the listing, plus the sitemap index
+                             'max_pages': -(-args.skus // (args.listing_size or STUB_DEFAULTS['listing_size'])) + 1}
+        if args.catalog == 'listing':
+            config['catalog']['pages'] = [f"{base}/catalog/"]
+        else:
+            config['catalog']['sitemaps'] = True
+    path = os.path.join(directory, "config.json")
+    with open(path, 'w') as f:
+        json.dump(config, f)
+    return path
+
+
+def collect_transitions(subscriber, received):
+    """Timestamp every transition event the moment the monitor publishes it."""
+    while True:
+        event = subscriber.get()
+        if event is None:
+            return
+        if event['type'] == 'transition':
+            received.append((time.time(), event['item'], event['current']['in_stock'], event['previous']['in_stock']))
+
+
+def detection_delays(received, args, started):
+    """Seconds from each detected flip to its transition event, the flips that happened, and the
+    transitions no flip explains (a change from an unknown status, or to the state the SKU already had).
+    """
+    schedules = [flip_times(args.seed, sku, args.flips_per_hour, args.duration + 60, args.in_stock_ratio)
+                 for sku in range(args.skus)]
+    delays, spurious = [], 0
+    for detected_at, name, in_stock, previous in received:
+        initially, times = schedules[int(name.split()[-1])]
+        elapsed = detected_at - started
+        # The latest flip before detection that left the SKU in the reported state
+        for index in range(len(times) - 1, -1, -1):
+            if times[index] <= elapsed and initially ^ (index % 2 == 0) == in_stock:
+                delays.append(elapsed - times[index])
+                break
+        else:
+            spurious += 1
+            continue
+        if previous is None:
+            spurious += 1
+    flips = sum(1 for _, times in schedules for moment in times if moment <= args.duration)
+    return delays, flips, spurious
+
+
+def stub_stats(stub):
+    with urllib.request.urlopen(f"http://127.0.0.1:{stub['port']}/__stats", timeout=5) as response:
+        return json.load(response)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the monitor against a local stub storefront")
+    parser.add_argument('--skus', type=int, default=2000, help="synthetic products to monitor")
+    parser.add_argument('--duration', type=float, default=60, help="seconds to run the monitor")
+    parser.add_argument('--interval', type=float, default=15, help="poll interval per SKU in seconds")
+    parser.add_argument('--jitter', type=float, default=0, help="poll jitter per SKU in seconds")
+    parser.add_argument('--workers', type=int, default=32, help="concurrent fetches (concurrency.max_workers)")
+    parser.add_argument('--rps', type=float, default=1000, help="politeness requests per second for the stub host")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--in-stock-ratio', type=float, default=0.2)
+    parser.add_argument('--flips-per-hour', type=float, default=6, help="mean stock flips per SKU per hour")
+    parser.add_argument('--latency-ms', type=float, default=50, help="mean stub response delay")
+    parser.add_argument('--error-rate', type=float, default=0.005, help="share of 500 answers")
+    parser.add_argument('--rate-limit-rate', type=float, default=0.001, help="share of 429 answers")
+    parser.add_argument('--retry-after', type=int, default=1)
+    parser.add_argument('--drain-bytes', type=int, default=None,
+                        help="fetch.drain_bytes for the monitor (0 closes every abandoned connection)")
+    parser.add_argument('--probe', choices=('html', 'json'), default='html',
+                        help="fetch.probe: product pages or the product-attributes endpoint")
+    parser.add_argument('--fail-first', type=int, default=0,
+                        help="stub answers each SKU's first N requests with 500, so first checks fail")
+    parser.add_argument('--no-attributes', action='store_true',
+                        help="make the stub's product-attributes endpoint answer 404, to exercise the fallback")
+    parser.add_argument('--catalog', choices=('none', 'listing', 'sitemap'), default='none',
+                        help="scan the stub's listing pages or sitemap and check only the products that changed")
+    parser.add_argument('--catalog-interval', type=float, default=0,
+                        help="seconds between catalog scans (default: --interval)")
+    parser.add_argument('--covered-interval', type=float, default=3600,
+                        help="poll interval for products a recent catalog scan has seen")
+    parser.add_argument('--listing-size', type=int, default=0, help="products per stub listing page")
+    parser.add_argument('--max-p99', type=float, default=0,
+                        help="fail if p99 time-to-detection exceeds this many seconds")
+    parser.add_argument('--rss-budget-mb', type=float, default=0,
+                        help="run the monitor with memory.rss_budget_mb set, to exercise load shedding")
+    parser.add_argument('--max-rss-mb', type=float, default=0, help="fail if peak RSS exceeds this many MiB")
+    parser.add_argument('--json', metavar='PATH', help="also write the report as JSON")
+    args = parser.parse_args()
+
+    stub, info = start_stub(args)
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            from monitor_log import setup_logging
+            from simple_handcuffs_monitor import SimpleHandcuffsMonitor
+
+            pipeline = setup_logging({'file': os.path.join(directory, "monitor.log"), 'console': False})
+            monitor = SimpleHandcuffsMonitor(write_config(directory, args, info))
+            received = []
+            subscriber = monitor.events.subscribe()
+            collector = threading.Thread(target=collect_transitions, args=(subscriber, received), daemon=True)
+            collector.start()
+
+            rss_start, cpu_start, wall_start = rss_bytes(), cpu_seconds(), time.monotonic()
+            rss_peak = rss_start
+            monitor.schedule_items(monitor.config['items'])
+            loop = threading.Thread(target=monitor.run_loop, name="run-loop")
+            loop.start()
+            deadline = wall_start + args.duration
+            while time.monotonic() < deadline:
+                time.sleep(min(1.0, max(0.0, deadline - time.monotonic())))
+                rss_peak = max(rss_peak, rss_bytes())
+            monitor.scheduler.stop()
+            # The batch in progress finishes and is written before the loop returns
+            loop.join()
+            wall = time.monotonic() - wall_start
+            cpu = cpu_seconds() - cpu_start
+            rss_end = rss_bytes()
+            summary = monitor.metrics.summary()
+            monitor.shutdown()
+            collector.join(5)
+            pipeline.stop()
+        stats = stub_stats(info)
+    finally:
+        stub.terminate()
+        stub.wait()
+
+    results = {}
+    for counts in summary['checks'].values():
+        for result, count in counts.items():
+            results[result] = results.get(result, 0) + count
+    checks = sum(results.values())
+    delays, flips, spurious = detection_delays(received, args, info['started'])
+    phases = summary['phases']
+    report = {
+        'skus': args.skus,
+        'wall_seconds': wall,
+        'checks': checks,
+        'checks_per_second': checks / wall,
+        'results': results,
+        'stub_responses': stats['status'],
+        'connections': stats['connections'],
+        'requests_by_kind': stats['kinds'],
+        'bytes_served': stats['bytes'],
+        'bytes_read': sum(summary['bytes_fetched'].values()),
+        'flips': flips,
+        'transitions_detected': len(received),
+        'spurious_transitions': spurious,
+        'detection_p50_seconds': percentile(delays, 0.5),
+        'detection_p99_seconds': percentile(delays, 0.99),
+        'detection_mean_seconds': statistics.mean(delays) if delays else None,
+        'emails': stats['emails'],
+        'fetch_p50_seconds': phases['connect']['p50_seconds'],
+        'fetch_p99_seconds': phases['connect']['p99_seconds'],
+        'cpu_seconds': cpu,
+        'cpu_percent': 100 * cpu / wall,
+        'rss_start_mb': rss_start / 2 ** 20,
+        'rss_end_mb': rss_end / 2 ** 20,
+        'rss_peak_mb': rss_peak / 2 ** 20,
+    }
+
+    def seconds(value):
+        return "n/a" if value is None else f"{value:.2f} s"
+
+    catalog = "" if args.catalog == 'none' else f", {args.catalog} catalog scan"
+    print(f"SKUs {args.skus}, {args.probe} probe{catalog}, interval {args.interval:g} s, {args.workers} workers, "
+          f"stub latency {args.latency_ms:g} ms, {args.error_rate:.1%} errors, {args.rate_limit_rate:.1%} 429s")
+    print(f"checks            {checks} in {wall:.1f} s ({report['checks_per_second']:.0f}/s, "
+          f"{args.skus / args.interval:.0f}/s scheduled)")
+    print(f"results           {', '.join(f'{name} {count}' for name, count in sorted(results.items()))}")
+    print(f"stub responses    {', '.join(f'{code}: {count}' for code, count in sorted(stats['status'].items()))}")
+    print(f"connections       {stats['connections']} opened for {stats['requests']} request(s)")
+    print(f"requests by kind  {', '.join(f'{kind} {count}' for kind, count in sorted(stats['kinds'].items()))}")
+    print(f"bytes             {report['bytes_read'] / 2 ** 20:.1f} MiB read of "
+          f"{report['bytes_served'] / 2 ** 20:.1f} MiB served")
+    print(f"fetch to headers  p50 {seconds(report['fetch_p50_seconds'])}, p99 {seconds(report['fetch_p99_seconds'])}")
+    print(f"flips             {flips} scheduled, {len(received)} transitions detected "
+          f"({spurious} spurious), {stats['emails']} email(s)")
+    print(f"time to detection p50 {seconds(report['detection_p50_seconds'])}, "
+          f"p99 {seconds(report['detection_p99_seconds'])}, mean {seconds(report['detection_mean_seconds'])}")
+    print(f"cpu               {cpu:.1f} s ({report['cpu_percent']:.0f}% of one core)")
+    print(f"rss               {report['rss_start_mb']:.0f} MiB at start, {report['rss_end_mb']:.0f} MiB at end, "
+          f"{report['rss_peak_mb']:.0f} MiB peak")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    failures = []
+    if spurious:
+        failures.append(f"{spurious} transition(s) no stock flip explains")
+    if args.max_p99 and (report['detection_p99_seconds'] or 0) > args.max_p99:
+        failures.append(f"p99 time to detection {report['detection_p99_seconds']:.2f} s (limit {args.max_p99:g} s)")
+    if args.max_rss_mb and report['rss_peak_mb'] > args.max_rss_mb:
+        failures.append(f"peak RSS {report['rss_peak_mb']:.0f} MiB (limit {args.max_rss_mb:g} MiB)")
+    if failures:
+        print()
+        for failure in failures:
+            print(f"❌ {failure}")
+        return 1
+    print("✅ Load test within limits")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Offline parser benchmark for the handcuffs monitor
+Runs every stock detection path over the recorded product pages and
+product-attributes responses in benchmarks/fixtures, reports latency,
+allocations and throughput per page, and fails if any path disagrees with
+the expected verdict
+
+Usage: python benchmarks/bench_parser.py [--repeat N] [--gate RATIO]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stock_parser import (detect_stock, detect_stock_attributes, detect_stock_streaming, parse_with_soup,
+                          product_attributes)
+from stock_selectors import SelectorEngine, parse_with_selectors
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+CHUNK_SIZE = 16384
+SELECTORS = [SelectorEngine().for_item({})]
+
+
+def soup_path(content):
+    return parse_with_soup(content)
+
+
+def selectors_path(content):
+    return parse_with_selectors(content, SELECTORS)[0]
+
+
+def bcdata_path(content):
+    detection = detect_stock(content, selector_sets=SELECTORS)
+    return detection.in_stock, detection.message
+
+
+def streaming_path(content):
+    chunks = (content[i:i + CHUNK_SIZE] for i in range(0, len(content), CHUNK_SIZE))
+    detection = detect_stock_streaming(chunks, selector_sets=SELECTORS)
+    return detection.in_stock, detection.message
+
+
+def attributes_path(content):
+    detection = detect_stock_attributes(product_attributes(content))
+    return detection.in_stock, detection.message
+
+
+# (name, function, pages it applies to). The selector engine is the fallback
+# for pages without BCData, so it is only measured on those. Endpoint
+# responses are JSON, not pages, and only go through the attributes path.
+PATHS = [
+    ('soup', soup_path, 'pages'),
+    ('selectors', selectors_path, 'no_bcdata'),
+    ('bcdata', bcdata_path, 'pages'),
+    ('streaming', streaming_path, 'pages'),
+    ('attributes', attributes_path, 'json'),
+]
+
+
+def applies_to(applies, page):
+    if page.endswith('.json'):
+        return applies == 'json'
+    if applies == 'no_bcdata':
+        return not page.startswith('bcdata_')
+    return applies == 'pages'
+
+
+def load_fixtures():
+    with open(os.path.join(FIXTURES_DIR, "expected.json"), 'r') as f:
+        expected = json.load(f)
+    fixtures = []
+    for name in sorted(expected):
+        with open(os.path.join(FIXTURES_DIR, name), 'rb') as f:
+            fixtures.append((name, f.read(), expected[name]))
+    return fixtures
+
+
+def measure(func, content, repeat):
+    """Return (verdict, median seconds, peak bytes, net new blocks) for one path on one page."""
+    verdict = func(content)
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(content)
+        timings.append(time.perf_counter() - started)
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    func(content)
+    after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    blocks = sum(stat.count_diff for stat in after.compare_to(before, 'filename') if stat.count_diff > 0)
+    return verdict, statistics.median(timings), peak, blocks
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark stock detection paths on recorded pages")
+    parser.add_argument('--repeat', type=int, default=20, help="timed runs per path and page")
+    parser.add_argument('--gate', type=float, default=0,
+                        help="fail unless the bcdata path is at least RATIO times faster than soup on BCData pages")
+    args = parser.parse_args()
+
+    fixtures = load_fixtures()
+    failures = []
+    totals = {name: [0.0, 0, 0] for name, _, _ in PATHS}
+    speedups = []
+
+    print(f"{'page':44} {'path':10} {'median ms':>10} {'peak KiB':>9} {'net blk':>7} {'pages/s':>9} {'MB/s':>8}  verdict")
+    for page, content, expected in fixtures:
+        medians = {}
+        for name, func, applies in PATHS:
+            if not applies_to(applies, page):
+                continue
+            verdict, median, peak, blocks = measure(func, content, args.repeat)
+            medians[name] = median
+            totals[name][0] += median
+            totals[name][1] += len(content)
+            totals[name][2] += 1
+            print(f"{page:44} {name:10} {median * 1000:10.3f} {peak / 1024:9.1f} {blocks:7d} "
+                  f"{1 / median:9.0f} {len(content) / median / 1e6:8.1f}  {verdict[0]}")
+            if [verdict[0], verdict[1]] != [expected['in_stock'], expected['message']]:
+                failures.append(f"{page}: {name} returned {verdict!r}, expected {expected!r}")
+        if page.startswith('bcdata_'):
+            speedups.append(medians['soup'] / medians['bcdata'])
+
+    print()
+    for name, (seconds, size, pages) in totals.items():
+        print(f"{name:10} total {seconds * 1000:8.3f} ms for {pages} pages "
+              f"({pages / seconds:.0f} pages/s, {size / seconds / 1e6:.1f} MB/s)")
+    if speedups:
+        print(f"bcdata vs soup on BCData pages: {min(speedups):.0f}x-{max(speedups):.0f}x faster")
+
+    if args.gate and speedups and min(speedups) < args.gate:
+        failures.append(f"bcdata path only {min(speedups):.1f}x faster than soup (gate {args.gate:g}x)")
+
+    if failures:
+        print()
+        for failure in failures:
+            print(f"❌ {failure}")
+        return 1
+    print("✅ All paths agree on every page")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
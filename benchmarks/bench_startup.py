@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Startup benchmark for the handcuffs monitor
+Times a bare import of the monitor module against an empty interpreter,
+lists the slowest imports, checks that the heavy dependencies stay unloaded
+until they are needed, and times a full --once run against the recorded
+product pages served from a local HTTP server
+
+Usage: python benchmarks/bench_startup.py [--repeat N] [--budget-ms MS]
+"""
+
+import argparse
+import functools
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES_DIR = os.path.join(ROOT, "benchmarks", "fixtures")
+
+# Only loaded once a page is fetched, a fallback parse runs or an alert is sent
+LAZY_MODULES = ('requests', 'lxml', 'cssselect', 'smtplib', 'email.mime.text', 'dotenv', 'http.server')
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class QuietServer(ThreadingHTTPServer):
+    def handle_error(self, request, client_address):
+        # The monitor closes a connection as soon as it has its verdict, mid-response
+        if not isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            super().handle_error(request, client_address)
+
+
+def time_command(argv, repeat, **kwargs):
+    """Median wall time of running argv, plus the last exit status."""
+    timings = []
+    status = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        status = subprocess.run(argv, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, **kwargs).returncode
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings), status
+
+
+def slowest_imports(limit):
+    """Top cumulative entries from -X importtime for the monitor module."""
+    output = subprocess.run([sys.executable, "-X", "importtime", "-c", "import simple_handcuffs_monitor"],
+                            cwd=ROOT, capture_output=True, text=True).stderr
+    rows = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative), name.strip()))
+    return sorted(rows, reverse=True)[:limit]
+
+
+def loaded_lazy_modules():
+    """Names from LAZY_MODULES that importing the monitor pulls in anyway."""
+    code = ("import json, sys, simple_handcuffs_monitor; "
+            f"print(json.dumps([m for m in {LAZY_MODULES!r} if m in sys.modules]))")
+    output = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True).stdout
+    return json.loads(output)
+
+
+def write_config(directory, port):
+    items = [{"name": page, "url": f"http://127.0.0.1:{port}/{page}", "color": "n/a"}
+             for page in sorted(os.listdir(FIXTURES_DIR)) if page.endswith(".html")]
+    config = {
+        "items": items,
+        "email": {},
+        "state": {"database": os.path.join(directory, "state.db")},
+        "metrics": {"summary_file": ""},
+        "politeness": {"requests_per_second": 100, "burst": 100},
+    }
+    path = os.path.join(directory, "config.json")
+    with open(path, "w") as f:
+        json.dump(config, f)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark monitor startup and a single --once sweep")
+    parser.add_argument('--repeat', type=int, default=5, help="timed runs per measurement")
+    parser.add_argument('--budget-ms', type=float, default=0,
+                        help="fail if importing the monitor costs more than MS over a bare interpreter")
+    args = parser.parse_args()
+
+    failures = []
+    baseline, _ = time_command([sys.executable, "-c", "pass"], args.repeat, cwd=ROOT)
+    imported, _ = time_command([sys.executable, "-c", "import simple_handcuffs_monitor"], args.repeat, cwd=ROOT)
+    import_cost = (imported - baseline) * 1000
+    print(f"interpreter           {baseline * 1000:8.1f} ms")
+    print(f"import monitor        {imported * 1000:8.1f} ms  (+{import_cost:.1f} ms)")
+
+    print("\nslowest imports (cumulative):")
+    for cumulative, name in slowest_imports(8):
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
+
+    loaded = loaded_lazy_modules()
+    if loaded:
+        failures.append(f"importing the monitor loads {', '.join(loaded)}")
+
+    server = QuietServer(("127.0.0.1", 0), functools.partial(QuietHandler, directory=FIXTURES_DIR))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            config = write_config(directory, server.server_address[1])
+            once, status = time_command([sys.executable, os.path.join(ROOT, "simple_handcuffs_monitor.py"),
+                                         "--once", "--config", config], args.repeat, cwd=directory)
+    finally:
+        server.shutdown()
+    print(f"\n--once over fixtures  {once * 1000:8.1f} ms  (exit {status})")
+    if status != 0:
+        failures.append(f"--once exited {status}, expected 0 (fixtures include in-stock pages)")
+
+    if args.budget_ms and import_cost > args.budget_ms:
+        failures.append(f"import costs {import_cost:.1f} ms (budget {args.budget_ms:g} ms)")
+
+    if failures:
+        print()
+        for failure in failures:
+            print(f"❌ {failure}")
+        return 1
+    print("✅ Startup within budget")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+"""
+Stub BigCommerce storefront for load-testing the handcuffs monitor
+Serves BCData product pages, the product-attributes JSON endpoint
+(product ID = SKU number), paginated category listings (/catalog/) and an
+XML sitemap (/xmlsitemap.php) for any number of synthetic SKUs from a local
+port, with configurable latency, server errors, 429 answers and stock flips,
+plus an SMTP sink that counts the alert emails it receives. Flips follow a
+seeded schedule (flip_times), so a driver in another process can work out
+exactly when each SKU changed without asking the server
+
+Usage: python benchmarks/stub_storefront.py [--skus N] [--port PORT] [--latency-ms MS] ...
+"""
+
+import argparse
+import bisect
+import json
+import os
+import random
+import re
+import socketserver
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+TEMPLATE_PAGE = os.path.join(FIXTURES_DIR, "bcdata_instock_true.html")
+TEMPLATE_ATTRIBUTES = os.path.join(FIXTURES_DIR, "product_attributes_instock_true.json")
+BCDATA_PATTERN = re.compile(rb"var BCData = (\{.*?\});")
+SKU_PATH = re.compile(r"^/products/sku-(\d+)/$")
+ATTRIBUTES_PATH = re.compile(r"^/remote/v1/product-attributes/(\d+)$")
+LISTING_PATH = re.compile(r"^/catalog/(?:\?page=(\d+))?$")
+SITEMAP_PATH = re.compile(r"^/xmlsitemap\.php(?:\?type=products&page=(\d+))?$")
+
+DEFAULTS = {
+    'skus': 1000,
+    'seed': 1,
+    # Share of SKUs in stock at the start
+    'in_stock_ratio': 0.2,
+    'flips_per_hour': 2.0,
+    # Horizon of the precomputed flip schedule
+    'duration_seconds': 3600,
+    # Mean of the exponentially distributed response delay
+    'latency_ms': 50.0,
+    'error_rate': 0.0,
+    'rate_limit_rate': 0.0,
+    'retry_after_seconds': 1,
+    # Requests per SKU answered 500 before its first real answer, so first checks fail
+    'fail_first': 0,
+    # Answer the product-attributes endpoint; when False it returns 404 so clients fall back to pages
+    'attributes': True,
+    # Product cards per listing page and URLs per product sitemap page
+    'listing_size': 50,
+}
+
+
+def sku_url(base, sku):
+    return f"{base}/products/sku-{sku}/"
+
+
+def flip_times(seed, sku, flips_per_hour, duration, in_stock_ratio):
+    """Seconds after the start at which a SKU's stock flips, and whether it starts in stock.
+
+    Returns (initially_in_stock, sorted offsets). Depends only on its
+    arguments, so the server and a driver computing it separately agree.
+    """
+    rng = random.Random(f"{seed}:{sku}")
+    initially = rng.random() < in_stock_ratio
+    times = []
+    if flips_per_hour > 0:
+        rate = flips_per_hour / 3600
+        moment = rng.expovariate(rate)
+        while moment < duration:
+            times.append(moment)
+            moment += rng.expovariate(rate)
+    return initially, times
+
+
+def stock_at(initially, times, elapsed):
+    """(in_stock, flips so far) for a SKU at `elapsed` seconds after the start."""
+    flips = bisect.bisect_right(times, elapsed)
+    return initially ^ (flips % 2 == 1), flips
+
+
+class Storefront:
+    """Page rendering, flip schedules and request counters shared by the handler threads."""
+
+    def __init__(self, config=None):
+        self.config = dict(DEFAULTS)
+        self.config.update(config or {})
+        with open(TEMPLATE_PAGE, 'rb') as f:
+            page = f.read()
+        match = BCDATA_PATTERN.search(page)
+        self.head, self.tail = page[:match.start(1)], page[match.end(1):]
+        self.bcdata = json.loads(match.group(1))
+        with open(TEMPLATE_ATTRIBUTES, 'rb') as f:
+            self.attributes_template = json.load(f)
+        self.schedules = [flip_times(self.config['seed'], sku, self.config['flips_per_hour'],
+                                     self.config['duration_seconds'], self.config['in_stock_ratio'])
+                          for sku in range(self.config['skus'])]
+        self.started = time.time()
+        self.rng = random.Random(self.config['seed'])
+        self.lock = threading.Lock()
+        self.answered = {}
+        self.stats = {'requests': 0, 'connections': 0, 'bytes': 0, 'status': {}, 'kinds': {}, 'emails': 0}
+
+    def count(self, status, size=0, kind=None):
+        with self.lock:
+            self.stats['requests'] += 1
+            self.stats['bytes'] += size
+            self.stats['status'][str(status)] = self.stats['status'].get(str(status), 0) + 1
+            if kind is not None:
+                self.stats['kinds'][kind] = self.stats['kinds'].get(kind, 0) + 1
+
+    def draw(self):
+        """Response delay and injected failure (None, 500 or 429) for one request."""
+        with self.lock:
+            latency = self.rng.expovariate(1000 / self.config['latency_ms']) if self.config['latency_ms'] else 0
+            roll = self.rng.random()
+        if roll < self.config['error_rate']:
+            return latency, 500
+        if roll < self.config['error_rate'] + self.config['rate_limit_rate']:
+            return latency, 429
+        return latency, None
+
+    def fails_first(self, sku):
+        """True while a SKU is still within its fail_first requests."""
+        with self.lock:
+            answered = self.answered.get(sku, 0)
+            self.answered[sku] = answered + 1
+        return answered < self.config['fail_first']
+
+    def stock_attributes(self, sku):
+        """(product_attributes fields for a SKU's current stock, flips so far)."""
+        initially, times = self.schedules[sku]
+        in_stock, flips = stock_at(initially, times, time.time() - self.started)
+        return {'sku': f"STUB{sku:06d}", 'instock': in_stock, 'purchasable': in_stock,
+                'stock_message': None if in_stock else "Out of stock"}, flips
+
+    def product(self, sku):
+        """(page bytes, etag) for a SKU as it stands right now."""
+        fields, flips = self.stock_attributes(sku)
+        attributes = dict(self.bcdata['product_attributes'], **fields)
+        body = self.head + json.dumps({'product_attributes': attributes}).encode() + self.tail
+        return body, f'"{sku}-{flips}"'
+
+    def listing(self, page):
+        """Category page `page` (from 1): a product card per SKU, and rel="next" while more pages follow."""
+        size = self.config['listing_size']
+        skus = range((page - 1) * size, min(page * size, self.config['skus']))
+        pages = -(-self.config['skus'] // size)
+        next_link = f'<link rel="next" href="/catalog/?page={page + 1}">' if page < pages else ""
+        cards = []
+        for sku in skus:
+            fields, _ = self.stock_attributes(sku)
+            if fields['instock']:
+                button = (f'<a href="/cart.php?action=add&amp;product_id={sku}" data-button-type="add-cart" '
+                          f'class="button button--small card-figcaption-button">Add to Cart</a>')
+            else:
+                button = '<span class="button button--small card-figcaption-button out-of-stock">Out of stock</span>'
+            cards.append(
+                f'<li class="product"><article class="card" data-product-id="{sku}">'
+                f'<figure class="card-figure"><a href="/products/sku-{sku}/" class="card-figure__link"></a>'
+                f'<figcaption class="card-figcaption"><div class="card-figcaption-body">{button}</div></figcaption>'
+                f'</figure><div class="card-body"><h3 class="card-title"><a href="/products/sku-{sku}/">SKU {sku}</a>'
+                f'</h3><div class="card-text" data-test-info-type="price"><span data-product-price-without-tax '
+                f'class="price price--withoutTax">$65.60</span></div></div></article></li>')
+        return (f'<!DOCTYPE html><html><head><title>Catalog - page {page}</title>{next_link}</head><body>'
+                f'<main class="page"><ul class="productGrid">{"".join(cards)}</ul></main></body></html>').encode()
+
+    def sitemap(self, base, page=None):
+        """Sitemap index without a page, else the product URLs of that page with their last flip as lastmod."""
+        size = self.config['listing_size']
+        if page is None:
+            pages = -(-self.config['skus'] // size)
+            entries = "".join(f"<sitemap><loc>{base}/xmlsitemap.php?type=products&amp;page={number}</loc></sitemap>"
+                              for number in range(1, pages + 1))
+            return (f'<?xml version="1.0" encoding="UTF-8"?><sitemapindex '
+                    f'xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{entries}</sitemapindex>').encode()
+        urls = []
+        elapsed = time.time() - self.started
+        for sku in range((page - 1) * size, min(page * size, self.config['skus'])):
+            _, times = self.schedules[sku]
+            _, flips = stock_at(False, times, elapsed)
+            changed = self.started + (times[flips - 1] if flips else 0)
+            lastmod = datetime.fromtimestamp(changed, timezone.utc).isoformat(timespec='seconds')
+            urls.append(f"<url><loc>{sku_url(base, sku)}</loc><lastmod>{lastmod}</lastmod></url>")
+        return (f'<?xml version="1.0" encoding="UTF-8"?><urlset '
+                f'xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{"".join(urls)}</urlset>').encode()
+
+    def attributes(self, sku):
+        """Product-attributes endpoint response for a SKU as it stands right now."""
+        fields, _ = self.stock_attributes(sku)
+        data = dict(self.attributes_template['data'], **fields)
+        return json.dumps(dict(self.attributes_template, data=data)).encode()
+
+
+def make_handler(store):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def setup(self):
+            super().setup()
+            # One handler per TCP connection, so this counts how often clients reconnect
+            with store.lock:
+                store.stats['connections'] += 1
+
+        def do_GET(self):
+            if self.path == '/__stats':
+                with store.lock:
+                    stats = json.dumps(store.stats).encode()
+                self.respond(200, stats, count=False)
+                return
+            listing = LISTING_PATH.match(self.path)
+            sitemap = SITEMAP_PATH.match(self.path)
+            if listing is not None or sitemap is not None:
+                if self.injected_failure():
+                    return
+                if listing is not None:
+                    self.respond(200, store.listing(int(listing.group(1) or 1)),
+                                 {'Content-Type': 'text/html; charset=UTF-8'}, kind='listing')
+                else:
+                    page = sitemap.group(1)
+                    # Sitemaps carry absolute URLs
+                    base = f"http://{self.headers.get('Host')}"
+                    self.respond(200, store.sitemap(base, int(page) if page else None),
+                                 {'Content-Type': 'application/xml'}, kind='sitemap')
+                return
+            match = SKU_PATH.match(self.path)
+            if match is None or int(match.group(1)) >= store.config['skus']:
+                self.respond(404, b"not found")
+                return
+
+            if self.injected_failure(int(match.group(1))):
+                return
+            body, etag = store.product(int(match.group(1)))
+            if self.headers.get('If-None-Match') == etag:
+                self.respond(304, b"", {'ETag': etag}, kind='product')
+            else:
+                self.respond(200, body, {'ETag': etag, 'Content-Type': 'text/html; charset=UTF-8'}, kind='product')
+
+        def do_POST(self):
+            # Read the form (option selections are ignored) so the connection stays usable
+            self.rfile.read(int(self.headers.get('Content-Length') or 0))
+            match = ATTRIBUTES_PATH.match(self.path)
+            if match is None or not store.config['attributes'] or int(match.group(1)) >= store.config['skus']:
+                self.respond(404, b"not found")
+                return
+            if self.injected_failure(int(match.group(1))):
+                return
+            self.respond(200, store.attributes(int(match.group(1))), {'Content-Type': 'application/json'},
+                         kind='attributes')
+
+        def injected_failure(self, sku=None):
+            """Wait out the drawn latency and send an injected 429 or 500; True when one was sent."""
+            latency, failure = store.draw()
+            if sku is not None and store.fails_first(sku):
+                failure = 500
+            time.sleep(latency)
+            if failure == 429:
+                self.respond(429, b"slow down", {'Retry-After': str(store.config['retry_after_seconds'])})
+            elif failure == 500:
+                self.respond(500, b"internal error")
+            return failure is not None
+
+        def respond(self, status, body, headers=None, count=True, kind=None):
+            if count:
+                store.count(status, len(body), kind)
+            try:
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            except (BrokenPipeError, ConnectionResetError):
+                # The monitor hangs up as soon as it has read BCData
+                self.close_connection = True
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+class StorefrontServer(ThreadingHTTPServer):
+    # Room for a whole worker pool connecting at once
+    request_queue_size = 256
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Hang-ups mid-body are expected; anything else is worth a traceback
+        if not isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            super().handle_error(request, client_address)
+
+
+class SmtpSink(socketserver.StreamRequestHandler):
+    """Just enough SMTP to accept and count messages, without TLS or auth."""
+
+    def handle(self):
+        self.reply(220, "stub ESMTP")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode('ascii', 'replace').strip().split(' ', 1)[0].upper()
+            if command == 'DATA':
+                self.reply(354, "end with .")
+                while self.rfile.readline() not in (b".\r\n", b".\n", b""):
+                    pass
+                with self.server.store.lock:
+                    self.server.store.stats['emails'] += 1
+                self.reply(250, "queued")
+            elif command == 'QUIT':
+                self.reply(221, "bye")
+                return
+            else:
+                self.reply(250, "ok")
+
+    def reply(self, code, text):
+        self.wfile.write(f"{code} {text}\r\n".encode())
+
+
+def serve(store, port=0, smtp_port=0, host="127.0.0.1"):
+    """Start the HTTP storefront and SMTP sink on background threads; return both servers."""
+    http = StorefrontServer((host, port), make_handler(store))
+    smtp = socketserver.ThreadingTCPServer((host, smtp_port), SmtpSink)
+    smtp.daemon_threads = True
+    smtp.store = store
+    for server in (http, smtp):
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    return http, smtp
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve synthetic BCData product pages for load tests")
+    parser.add_argument('--skus', type=int, default=DEFAULTS['skus'])
+    parser.add_argument('--port', type=int, default=0, help="HTTP port (0 picks a free one)")
+    parser.add_argument('--smtp-port', type=int, default=0, help="SMTP sink port (0 picks a free one)")
+    parser.add_argument('--seed', type=int, default=DEFAULTS['seed'])
+    parser.add_argument('--in-stock-ratio', type=float, default=DEFAULTS['in_stock_ratio'],
+                        help="share of SKUs in stock at the start")
+    parser.add_argument('--flips-per-hour', type=float, default=DEFAULTS['flips_per_hour'],
+                        help="mean stock flips per SKU per hour")
+    parser.add_argument('--duration', type=float, default=DEFAULTS['duration_seconds'],
+                        help="seconds of flip schedule to generate")
+    parser.add_argument('--latency-ms', type=float, default=DEFAULTS['latency_ms'], help="mean response delay")
+    parser.add_argument('--error-rate', type=float, default=DEFAULTS['error_rate'], help="share of 500 answers")
+    parser.add_argument('--rate-limit-rate', type=float, default=DEFAULTS['rate_limit_rate'],
+                        help="share of 429 answers")
+    parser.add_argument('--retry-after', type=int, default=DEFAULTS['retry_after_seconds'],
+                        help="Retry-After sent with each 429")
+    parser.add_argument('--fail-first', type=int, default=DEFAULTS['fail_first'],
+                        help="answer each SKU's first N product requests with 500")
+    parser.add_argument('--no-attributes', action='store_true',
+                        help="answer the product-attributes endpoint with 404")
+    parser.add_argument('--listing-size', type=int, default=DEFAULTS['listing_size'],
+                        help="products per listing and sitemap page")
+    args = parser.parse_args()
+
+    store = Storefront({
+        'skus': args.skus, 'seed': args.seed, 'in_stock_ratio': args.in_stock_ratio,
+        'flips_per_hour': args.flips_per_hour,
+        'duration_seconds': args.duration, 'latency_ms': args.latency_ms, 'error_rate': args.error_rate,
+        'rate_limit_rate': args.rate_limit_rate, 'retry_after_seconds': args.retry_after,
+        'attributes': not args.no_attributes, 'listing_size': args.listing_size, 'fail_first': args.fail_first,
+    })
+    http, smtp = serve(store, args.port, args.smtp_port)
+    # First line is for drivers: where to connect and when the flip schedule started
+    print(json.dumps({'port': http.server_address[1], 'smtp_port': smtp.server_address[1],
+                      'started': store.started}), flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        http.shutdown()
+        smtp.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
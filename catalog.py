@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Catalog scanning for the handcuffs monitor
+Category, brand and search listing pages show a stock badge and price for
+dozens of products at once, and the store's XML sitemap gives a lastmod
+date for every product. Both are read with streaming lxml parsers, one
+chunk at a time, and each product found becomes a ListingEntry. The monitor
+compares entries with the previous scan and only checks a product page when
+its entry changed
+"""
+
+import re
+from datetime import datetime, timedelta
+from urllib.parse import urljoin, urlsplit
+
+DEFAULTS = {
+    # Listing pages (category, brand or search results); pagination is followed
+    'pages': [],
+    # Sitemap URLs, or true for /xmlsitemap.php on every host in the item list
+    'sitemaps': [],
+    'interval_seconds': 300,
+    # Poll interval for products a recent scan has seen; they are checked sooner when their entry changes
+    'covered_interval_seconds': 21600,
+    # Pages read per listing or sitemap in one scan, pagination and sitemap index entries included
+    'max_pages': 20,
+    'chunk_size': 16384,
+    # Product cards on a listing page and the fields inside each one (Cornerstone theme markup)
+    'card': "article.card",
+    'link': ".card-title a",
+    'price': "[data-product-price-without-tax], [data-product-price-with-tax], .price--withoutTax",
+    'in_stock': "[data-button-type='add-cart'], .card-figcaption-button[href*='action=add']",
+    'out_of_stock': ".out-of-stock, .sold-out, .card-badge--out-of-stock, [data-stock='0']",
+}
+
+SITEMAP_NS = "{http://www.sitemaps.org/schemas/sitemap/0.9}"
+PRICE_PATTERN = re.compile(r"\d[\d,]*(?:\.\d+)?")
+
+
+class ListingEntry:
+    """What one listing page or sitemap says about a product."""
+
+    __slots__ = ('url', 'product_id', 'name', 'in_stock', 'price', 'lastmod', 'seen_at')
+
+    def __init__(self, url, product_id=None, name=None, in_stock=None, price=None, lastmod=None, seen_at=None):
+        self.url = url
+        self.product_id = product_id
+        self.name = name
+        self.in_stock = in_stock
+        self.price = price
+        self.lastmod = lastmod
+        self.seen_at = seen_at
+
+    def same_listing(self, other):
+        """True when other (or None) shows the same stock badge, price and lastmod."""
+        return other is not None and ((self.in_stock, self.price, self.lastmod)
+                                      == (other.in_stock, other.price, other.lastmod))
+
+    def __repr__(self):
+        return (f"ListingEntry(url={self.url!r}, product_id={self.product_id!r}, in_stock={self.in_stock!r}, "
+                f"price={self.price!r}, lastmod={self.lastmod!r})")
+
+
+def merge_entry(previous, entry, kind):
+    """entry, with the fields its kind of source doesn't show carried over from previous."""
+    if previous is not None:
+        if kind == 'sitemap':
+            entry.product_id, entry.name = previous.product_id, previous.name
+            entry.in_stock, entry.price = previous.in_stock, previous.price
+        else:
+            entry.lastmod = previous.lastmod
+    return entry
+
+
+def normalize_url(url):
+    """Product URL without query, fragment or trailing slash, so listing links match item URLs."""
+    parts = urlsplit(url)
+    return f"{parts.scheme.lower()}://{parts.netloc.lower()}{parts.path.rstrip('/')}"
+
+
+def parse_price(text):
+    """First number in a price label such as '$1,065.60' or '$60.00 - $70.00'."""
+    match = PRICE_PATTERN.search(text or "")
+    return float(match.group(0).replace(',', '')) if match else None
+
+
+def sitemap_urls(items):
+    """The conventional BigCommerce sitemap of every host in the item list."""
+    hosts = dict.fromkeys(f"{urlsplit(item['url']).scheme}://{urlsplit(item['url']).netloc}" for item in items)
+    return [f"{host}/xmlsitemap.php" for host in hosts]
+
+
+class CardSelectors:
+    """The catalog's card and field selectors compiled to XPath, once, on first use."""
+
+    def __init__(self, config):
+        self.config = config
+        self.compiled = None
+
+    def compile(self):
+        if self.compiled is None:
+            from cssselect import HTMLTranslator
+            from lxml import etree
+
+            from stock_selectors import translate_selector_list
+
+            translator = HTMLTranslator()
+
+            def xpath(css, prefix='descendant-or-self::'):
+                return etree.XPath(translate_selector_list(css, translator, prefix) or '/..')
+
+            self.compiled = {
+                # Tests whether the element just closed is itself a card
+                'card': xpath(self.config['card'], 'self::'),
+                'link': xpath(self.config['link']),
+                'price': xpath(self.config['price']),
+                'in_stock': xpath(self.config['in_stock']),
+                'out_of_stock': xpath(self.config['out_of_stock']),
+                'product_id': etree.XPath("descendant-or-self::*[@data-product-id][1]/@data-product-id"),
+            }
+        return self.compiled
+
+
+class ListingParser:
+    """Streaming product-card extractor for listing pages.
+
+    Each card is read as soon as its closing tag arrives and then dropped
+    from the tree, so memory stays flat however long the page is.
+    """
+
+    def __init__(self, page_url, selectors):
+        from lxml import etree
+
+        self.page_url = page_url
+        self.xpaths = selectors.compile()
+        self.parser = etree.HTMLPullParser(events=('end',))
+        self.follow = []
+
+    def feed(self, chunk):
+        """Add a chunk of the page; return the entries for cards it completed."""
+        self.parser.feed(chunk)
+        return self.read_events()
+
+    def close(self):
+        """Finish the page; return the last entries."""
+        try:
+            self.parser.close()
+        except Exception:
+            # Truncated markup still yields the cards read so far
+            pass
+        return self.read_events()
+
+    def read_events(self):
+        entries = []
+        for _, element in self.parser.read_events():
+            if element.tag in ('link', 'a') and 'next' in (element.get('rel') or '').split() and element.get('href'):
+                # rel="next" pagination, in the head or the pagination list
+                self.follow.append(urljoin(self.page_url, element.get('href')))
+            elif self.xpaths['card'](element):
+                entry = self.read_card(element)
+                if entry is not None:
+                    entries.append(entry)
+                element.clear()
+                while element.getprevious() is not None:
+                    del element.getparent()[0]
+        return entries
+
+    def read_card(self, card):
+        links = self.xpaths['link'](card)
+        if not links or not links[0].get('href'):
+            return None
+        in_stock = None
+        if self.xpaths['out_of_stock'](card):
+            in_stock = False
+        elif self.xpaths['in_stock'](card):
+            in_stock = True
+        prices = self.xpaths['price'](card)
+        product_id = self.xpaths['product_id'](card)
+        return ListingEntry(normalize_url(urljoin(self.page_url, links[0].get('href'))),
+                            str(product_id[0]) if product_id else None,
+                            "".join(links[0].itertext()).strip() or None, in_stock,
+                            parse_price("".join(prices[0].itertext())) if prices else None)
+
+
+class SitemapParser:
+    """Streaming reader for sitemaps and sitemap indexes.
+
+    Product URLs become entries with their lastmod; the sitemaps an index
+    points at are queued in follow.
+    """
+
+    def __init__(self, page_url):
+        from lxml import etree
+
+        self.page_url = page_url
+        self.parser = etree.XMLPullParser(events=('end',))
+        self.follow = []
+
+    def feed(self, chunk):
+        self.parser.feed(chunk)
+        return self.read_events()
+
+    def close(self):
+        try:
+            self.parser.close()
+        except Exception:
+            pass
+        return self.read_events()
+
+    def read_events(self):
+        entries = []
+        for _, element in self.parser.read_events():
+            if element.tag == SITEMAP_NS + 'url':
+                loc = element.findtext(SITEMAP_NS + 'loc')
+                lastmod = (element.findtext(SITEMAP_NS + 'lastmod') or "").strip()
+                if loc:
+                    entries.append(ListingEntry(normalize_url(urljoin(self.page_url, loc.strip())),
+                                                lastmod=lastmod or None))
+            elif element.tag == SITEMAP_NS + 'sitemap':
+                loc = element.findtext(SITEMAP_NS + 'loc')
+                if loc:
+                    self.follow.append(urljoin(self.page_url, loc.strip()))
+            else:
+                continue
+            element.clear()
+            while element.getprevious() is not None:
+                del element.getparent()[0]
+        return entries
+
+
+class Catalog:
+    """Listing sources to scan and the mapping from listing entries to items."""
+
+    def __init__(self, config=None):
+        self.config = dict(DEFAULTS)
+        self.config.update(config or {})
+        self.selectors = CardSelectors(self.config)
+        self.by_url = {}
+        self.by_product_id = {}
+
+    def jobs(self, items):
+        """Scheduler entries for every listing page and sitemap, polled like items."""
+        sitemaps = self.config['sitemaps']
+        if sitemaps is True:
+            sitemaps = sitemap_urls(items)
+        sources = [("Listing", url, 'html') for url in self.config['pages']]
+        sources += [("Sitemap", url, 'sitemap') for url in sitemaps or ()]
+        return [{'name': name, 'url': url, 'listing': kind, 'interval_seconds': self.config['interval_seconds'],
+                 'adaptive': False} for name, url, kind in sources]
+
+    def parser(self, job, url):
+        """A streaming parser for one page of a listing job."""
+        if job['listing'] == 'sitemap':
+            return SitemapParser(url)
+        return ListingParser(url, self.selectors)
+
+    def index(self, items):
+        """Map product URLs and IDs to the items watching them."""
+        self.by_url = {}
+        self.by_product_id = {}
+        for item in items:
+            self.by_url.setdefault(normalize_url(item['url']), []).append(item)
+            if item.get('product_id') is not None:
+                self.by_product_id.setdefault(str(item['product_id']), []).append(item)
+
+    def items_for(self, entry):
+        """Items a listing entry is about, matched by URL or by product ID."""
+        items = self.by_url.get(entry.url)
+        if items is None and entry.product_id is not None:
+            items = self.by_product_id.get(entry.product_id)
+        return items or []
+
+    def fresh(self, entry, now):
+        """True when a scan saw the entry recently enough to stand in for page checks."""
+        if entry is None or entry.seen_at is None:
+            return False
+        window = timedelta(seconds=2 * self.config['interval_seconds'])
+        return datetime.fromisoformat(entry.seen_at) >= now - window
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Control socket for the handcuffs monitor
+The running monitor listens on a local Unix-domain socket. A client sends one
+JSON line such as {"command": "check-now", "args": ["Blue"]} and gets one JSON
+line back. The management scripts use this instead of pgrep/pkill
+
+Usage: python control.py status | check-now <item> | reload | stop | profile on|off|dump [--socket PATH]
+"""
+
+import json
+import logging
+import os
+import socket
+import socketserver
+import sys
+import threading
+
+SOCKET_PATH = "monitor.sock"
+COMMANDS = ('status', 'check-now', 'reload', 'stop', 'profile')
+
+log = logging.getLogger("handcuffs.control")
+
+
+class ControlUnavailable(Exception):
+    """Raised when no monitor is listening on the control socket."""
+
+
+class ControlHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        line = self.rfile.readline()
+        try:
+            request = json.loads(line)
+            response = self.server.dispatch(request.get('command'), request.get('args') or [])
+        except ValueError as e:
+            response = {'ok': False, 'error': f"Bad request: {e}"}
+        except Exception as e:
+            log.exception(f"Control command failed: {e}")
+            response = {'ok': False, 'error': str(e)}
+        self.wfile.write(json.dumps(response, default=str).encode() + b'\n')
+
+
+class ControlServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Serves control commands for a monitor on a background thread.
+
+    handlers maps each command name to a callable taking the command's
+    arguments and returning a JSON-serialisable dict.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, path, handlers):
+        self.path = path
+        self.handlers = handlers
+        if os.path.exists(path):
+            try:
+                send_command('status', path=path, timeout=1)
+            except ControlUnavailable:
+                # Left behind by a monitor that didn't shut down cleanly
+                os.unlink(path)
+            else:
+                raise RuntimeError(f"another monitor is already listening on {path}")
+        super().__init__(path, ControlHandler)
+        os.chmod(path, 0o600)
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, name="control", daemon=True)
+        self.thread.start()
+        log.info(f"🎛 Control socket at {self.path}")
+
+    def dispatch(self, command, args):
+        handler = self.handlers.get(command)
+        if handler is None:
+            return {'ok': False, 'error': f"Unknown command {command!r}; expected one of {', '.join(COMMANDS)}"}
+        return {'ok': True, **handler(*args)}
+
+    def close(self):
+        """Stop serving and remove the socket file."""
+        if self.thread is not None:
+            self.shutdown()
+        self.server_close()
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def send_command(command, *args, path=SOCKET_PATH, timeout=10):
+    """Send one command to the running monitor and return its response dict."""
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(path)
+            sock.sendall(json.dumps({'command': command, 'args': list(args)}).encode() + b'\n')
+            with sock.makefile('rb') as reply:
+                line = reply.readline()
+    except (FileNotFoundError, ConnectionRefusedError) as e:
+        raise ControlUnavailable(f"monitor is not running ({path}: {e.strerror})")
+    if not line:
+        raise ControlUnavailable(f"monitor closed the connection on {path}")
+    return json.loads(line)
+
+
+def format_status(response):
+    """Lines describing each item in a status response."""
+    rss = f", RSS {response['rss'] / 2 ** 20:.0f} MiB" if response.get('rss') else ""
+    lines = [f"Monitor pid {response['pid']}, {len(response['items'])} item(s){rss}"]
+    for item in response['items']:
+        if item['in_stock'] is None:
+            verdict = "unknown"
+        else:
+            verdict = "IN STOCK" if item['in_stock'] else "out of stock"
+        due = "checking" if item['next_due_seconds'] is None else f"due in {item['next_due_seconds']:.0f}s"
+        latency = "-" if item['latency_ms'] is None else f"{item['latency_ms']:.0f} ms"
+        lines.append(f"  {item['name']}: {verdict}, {due}, last check {latency}: {item['message']}")
+    return lines
+
+
+def main():
+    args = sys.argv[1:]
+    path = SOCKET_PATH
+    if '--socket' in args:
+        index = args.index('--socket')
+        path = args[index + 1]
+        del args[index:index + 2]
+    if not args or args[0] not in COMMANDS:
+        print(__doc__.strip().splitlines()[-1])
+        return 1
+
+    try:
+        response = send_command(args[0], *args[1:], path=path)
+    except ControlUnavailable as e:
+        print(f"❌ {e}")
+        return 1
+    if not response.get('ok'):
+        print(f"❌ {response.get('error')}")
+        return 1
+
+    if args[0] == 'status':
+        for line in format_status(response):
+            print(line)
+    elif args[0] == 'check-now':
+        print(f"⏩ Checking {', '.join(response['items'])} now")
+    elif args[0] == 'reload':
+        for key in response['added']:
+            print(f"➕ {key}")
+        for key in response['removed']:
+            print(f"➖ {key}")
+        for key in response['updated']:
+            print(f"✏️ {key}")
+        print(f"🔄 Reloaded: {len(response['added'])} added, {len(response['removed'])} removed, "
+              f"{len(response['updated'])} updated, {response['unchanged']} unchanged")
+    elif args[0] == 'stop':
+        print("🛑 Monitor is stopping")
+    elif args[0] == 'profile':
+        if 'profile' in response:
+            from memory import format_profile
+            for line in format_profile(response['profile']) or ["No phases profiled yet"]:
+                print(line)
+        elif 'workers' in response:
+            print(f"🔬 Sent to {response['workers']} worker(s); their profiles are written to the log")
+        print(f"🔬 Allocation profiling is {'on' if response['profiling'] else 'off'}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
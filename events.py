@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Stock transition event stream for the handcuffs monitor
+Every status change is published the moment it is decided: fanned out to
+Server-Sent Events subscribers on a local HTTP port and appended to a JSONL
+outbox that webhook relays can tail. Reconnecting subscribers resume from
+Last-Event-ID out of a short in-memory backlog
+"""
+
+import json
+import logging
+import os
+import queue
+import socket
+import threading
+from collections import deque
+from urllib.parse import parse_qs, urlsplit
+
+from monitor_log import tail
+
+log = logging.getLogger("handcuffs.events")
+
+DEFAULTS = {
+    'outbox': "events.jsonl",
+    'port': None,
+    'host': "127.0.0.1",
+    'backlog': 256,
+    # A subscriber this far behind is disconnected rather than buffered forever
+    'max_pending': 1000,
+    'keepalive_seconds': 15,
+}
+
+
+def format_sse(event):
+    """One event in text/event-stream framing."""
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n".encode()
+
+
+class EventHub:
+    """Fan-out of transition events to SSE subscribers and the JSONL outbox."""
+
+    def __init__(self, config=None):
+        self.config = dict(DEFAULTS)
+        self.config.update(config or {})
+        self.lock = threading.Lock()
+        self.subscribers = set()
+        self.backlog = deque(maxlen=self.config['backlog'])
+        self.server = None
+        self.outbox = None
+        self.last_id = 0
+        if self.config['outbox']:
+            self.last_id = self.last_outbox_id(self.config['outbox'])
+            self.outbox = open(self.config['outbox'], 'a', encoding='utf-8')
+
+    @staticmethod
+    def last_outbox_id(path):
+        """Id of the last event in an existing outbox, so ids keep increasing across restarts."""
+        if not os.path.exists(path):
+            return 0
+        for line in reversed(tail(path, 5)):
+            try:
+                return int(json.loads(line)['id'])
+            except (ValueError, KeyError, TypeError):
+                continue
+        return 0
+
+    def publish(self, event):
+        """Number an event, hand it to every subscriber, then append it to the outbox."""
+        with self.lock:
+            self.last_id += 1
+            event = {'id': self.last_id, **event}
+            self.backlog.append(event)
+            for subscriber in list(self.subscribers):
+                if subscriber.qsize() >= self.config['max_pending']:
+                    self.subscribers.discard(subscriber)
+                    subscriber.put(None)
+                    log.warning("⚠️ Dropped a slow event subscriber")
+                else:
+                    subscriber.put(event)
+            if self.outbox is not None:
+                self.outbox.write(json.dumps(event, default=str) + "\n")
+                self.outbox.flush()
+        return event
+
+    def subscribe(self, last_id=None):
+        """A queue that receives every event after last_id that is still in the backlog, then new ones."""
+        subscriber = queue.SimpleQueue()
+        with self.lock:
+            if last_id is not None:
+                for event in self.backlog:
+                    if event['id'] > last_id:
+                        subscriber.put(event)
+            self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            self.subscribers.discard(subscriber)
+
+    def serve(self, port, host="127.0.0.1"):
+        """Serve GET /events as Server-Sent Events from a background thread."""
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        hub = self
+        keepalive = self.config['keepalive_seconds']
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlsplit(self.path)
+                if url.path != '/events':
+                    self.send_error(404)
+                    return
+                params = parse_qs(url.query)
+                last_id = self.headers.get('Last-Event-ID') or params.get('since', [None])[0]
+                try:
+                    last_id = int(last_id) if last_id is not None else None
+                except ValueError:
+                    last_id = None
+                items = set(params.get('item', []))
+
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Cache-Control', 'no-cache')
+                self.end_headers()
+                # Push each event out immediately instead of waiting to fill a segment
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                subscriber = hub.subscribe(last_id)
+                try:
+                    self.wfile.write(b"retry: 1000\n\n")
+                    while True:
+                        try:
+                            event = subscriber.get(timeout=keepalive)
+                        except queue.Empty:
+                            self.wfile.write(b": keepalive\n\n")
+                            continue
+                        if event is None:
+                            break
+                        if items and event['item'] not in items and event['key'] not in items:
+                            continue
+                        self.wfile.write(format_sse(event))
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+                finally:
+                    hub.unsubscribe(subscriber)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, name="events", daemon=True).start()
+        return self.server
+
+    def close(self):
+        """End every subscription, stop the server and close the outbox."""
+        with self.lock:
+            for subscriber in self.subscribers:
+                subscriber.put(None)
+            self.subscribers = set()
+            if self.outbox is not None:
+                self.outbox.close()
+                self.outbox = None
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
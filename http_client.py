@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+Pooled HTTP client for the handcuffs monitor
+One long-lived client per monitor keeps connections to each storefront host
+open between checks, so repeated polls skip the TCP and TLS handshakes, and
+the client resolves host names once per DNS cache period. With httpx and h2
+installed, fetch.http2 multiplexes every check to a host over a single
+HTTP/2 connection instead
+"""
+
+import logging
+import socket
+import threading
+import time
+from contextlib import contextmanager
+
+log = logging.getLogger("handcuffs.http")
+
+DEFAULTS = {
+    'timeout': 15,
+    # Hosts kept with open connections
+    'pool_connections': 10,
+    # Open connections kept per host; None means concurrency.max_workers
+    'pool_maxsize': None,
+    # Seconds a resolved address is reused; 0 resolves on every new connection
+    'dns_cache_seconds': 300,
+    # A streamed body abandoned with at most this many bytes left on the wire (by
+    # Content-Length) is read to the end, so the connection goes back to the pool;
+    # with more left, or no Content-Length, the connection is closed at once
+    'drain_bytes': 65536,
+    # Use httpx with HTTP/2 when httpx and h2 are installed
+    'http2': False,
+}
+
+# Sent with every request; built once for the client's lifetime
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.5',
+    'Accept-Encoding': 'gzip, deflate',
+    'Upgrade-Insecure-Requests': '1',
+}
+
+
+class DnsCache:
+    """Addresses of the hosts one client connects to, kept for a fixed time.
+
+    Only that client's connections look host names up here; the rest of
+    the process resolves as usual. Failed lookups are never cached.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = {}
+
+    def addresses(self, host, port):
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get((host, port))
+        if entry is not None and entry[0] > now:
+            return entry[1]
+        found = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        addresses = list(dict.fromkeys(info[4][0] for info in found))
+        with self.lock:
+            self.entries[(host, port)] = (now + self.ttl, addresses)
+        return addresses
+
+
+class CachedDnsConnection:
+    """urllib3 connection mixin that connects to the addresses in its client's DnsCache.
+
+    Only the socket goes to the cached address; the Host header, SNI and
+    certificate checks still use the host name.
+    """
+
+    dns_cache = None
+
+    def _new_conn(self):
+        from urllib3.exceptions import ConnectTimeoutError
+
+        host = self._dns_host
+        try:
+            addresses = self.dns_cache.addresses(host, self.port)
+        except OSError:
+            # urllib3 resolves it again and raises its usual error
+            return super()._new_conn()
+        error = None
+        try:
+            for address in addresses:
+                self._dns_host = address
+                try:
+                    return super()._new_conn()
+                except ConnectTimeoutError as e:
+                    # Also covers NewConnectionError; try the next address
+                    error = e
+        finally:
+            self._dns_host = host
+        raise error
+
+
+def cached_dns_pools(dns_cache):
+    """urllib3 pool classes, by scheme, whose connections resolve through dns_cache."""
+    from urllib3.connection import HTTPConnection, HTTPSConnection
+    from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+    pools = {}
+    for scheme, pool, connection in (('http', HTTPConnectionPool, HTTPConnection),
+                                     ('https', HTTPSConnectionPool, HTTPSConnection)):
+        cls = type(f"CachedDns{connection.__name__}", (CachedDnsConnection, connection), {'dns_cache': dns_cache})
+        pools[scheme] = type(f"CachedDns{pool.__name__}", (pool,), {'ConnectionCls': cls})
+    return pools
+
+
+class CachedDnsBackend:
+    """httpcore network backend that connects to the addresses in a DnsCache."""
+
+    def __init__(self, dns_cache):
+        import httpcore
+
+        self.dns_cache = dns_cache
+        self.backend = httpcore.SyncBackend()
+        self.connect_error = httpcore.ConnectError
+
+    def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+        try:
+            addresses = self.dns_cache.addresses(host, port)
+        except OSError:
+            return self.backend.connect_tcp(host, port, timeout, local_address, socket_options)
+        error = None
+        for address in addresses:
+            try:
+                return self.backend.connect_tcp(address, port, timeout, local_address, socket_options)
+            except self.connect_error as e:
+                error = e
+        raise error
+
+    def connect_unix_socket(self, path, timeout=None, socket_options=None):
+        return self.backend.connect_unix_socket(path, timeout, socket_options)
+
+    def sleep(self, seconds):
+        self.backend.sleep(seconds)
+
+
+def http2_available():
+    try:
+        import h2  # noqa: F401
+        import httpx  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class Response:
+    """The parts of a response the monitor uses, the same for either backend."""
+
+    __slots__ = ('response', 'status_code', 'headers', 'chunks', 'iter_size', 'wire_bytes', 'reuse', 'drained')
+
+    def __init__(self, response, iter_size, wire_bytes, reuse):
+        self.response = response
+        self.status_code = response.status_code
+        self.headers = response.headers
+        self.chunks = None
+        self.iter_size = iter_size
+        # Body bytes taken off the connection so far, before decompression
+        self.wire_bytes = wire_bytes
+        self.reuse = reuse
+        # Decoded bytes read by release() rather than by the caller
+        self.drained = 0
+
+    def iter_chunks(self, chunk_size):
+        """Decoded body chunks; the same iterator is carried on when the body is drained."""
+        if self.chunks is None:
+            self.chunks = iter(self.iter_size(chunk_size))
+        return self.chunks
+
+    def read(self):
+        return b"".join(self.iter_chunks(65536))
+
+    def raise_for_status(self):
+        self.response.raise_for_status()
+
+    def remaining(self):
+        """Body bytes still on the wire, or None when there is no Content-Length."""
+        length = self.headers.get('Content-Length')
+        if length is None or not length.strip().isdigit():
+            return None
+        return max(0, int(length) - self.wire_bytes())
+
+    def release(self, drain_bytes):
+        """Finish the body if at most drain_bytes are left, so the connection can be reused, then close."""
+        remaining = self.remaining() if self.reuse and drain_bytes else None
+        if remaining is not None and remaining <= drain_bytes:
+            try:
+                for chunk in self.iter_chunks(min(drain_bytes, 65536) or 1):
+                    self.drained += len(chunk)
+            except Exception:
+                # The connection is closed below either way
+                pass
+        self.response.close()
+
+
+class HttpClient:
+    """Long-lived HTTP client shared by every check of one monitor."""
+
+    def __init__(self, config=None, pool_size=4, on_drain=None):
+        self.config = dict(DEFAULTS)
+        self.config.update(config or {})
+        # Called with (url, bytes) for body bytes read only to keep a connection
+        self.on_drain = on_drain
+        self.pool_size = max(1, self.config['pool_maxsize'] or pool_size)
+        ttl = self.config['dns_cache_seconds']
+        self.dns_cache = DnsCache(ttl) if ttl else None
+        self.http2 = False
+        if self.config['http2']:
+            if http2_available():
+                self.http2 = True
+            else:
+                log.warning("⚠️ fetch.http2 needs httpx and h2 (pip install 'httpx[http2]'); using HTTP/1.1")
+        if self.http2:
+            self.client = self.httpx_client()
+            self.network_errors = (self.httpx.HTTPError, self.httpx.StreamError)
+        else:
+            self.client = self.requests_session()
+            self.network_errors = (self.requests.RequestException,)
+
+    def requests_session(self):
+        import http.cookiejar
+
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.requests = requests
+        session = requests.Session()
+        session.headers.clear()
+        session.headers.update(HEADERS)
+        # Each check stays stateless, as it was with one-off requests
+        session.cookies.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+        adapter = HTTPAdapter(pool_connections=self.config['pool_connections'], pool_maxsize=self.pool_size,
+                              max_retries=0)
+        if self.dns_cache is not None:
+            adapter.poolmanager.pool_classes_by_scheme = cached_dns_pools(self.dns_cache)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def httpx_client(self):
+        import httpx
+
+        self.httpx = httpx
+        limits = httpx.Limits(max_connections=None,
+                              max_keepalive_connections=self.config['pool_connections'] * self.pool_size)
+        transport = httpx.HTTPTransport(http2=True, limits=limits)
+        if self.dns_cache is not None:
+            # HTTPTransport takes no network backend, so it is set on its connection pool
+            transport._pool._network_backend = CachedDnsBackend(self.dns_cache)
+        return httpx.Client(headers=HEADERS, timeout=self.config['timeout'], follow_redirects=True,
+                            transport=transport)
+
+    @contextmanager
+    def request(self, method, url, headers=None, data=None):
+        """Send a request and yield a Response once its headers are in; the body is read on demand.
+
+        headers are added to the client's fixed headers for this request only,
+        and data is sent form-encoded. Bytes read only to keep the connection
+        are reported to on_drain.
+        """
+        if self.http2:
+            with self.client.stream(method, url, headers=headers, data=data) as response:
+                # An abandoned HTTP/2 stream is reset without closing the connection
+                wrapped = Response(response, response.iter_bytes, lambda: response.num_bytes_downloaded,
+                                   response.http_version != "HTTP/2")
+                try:
+                    yield wrapped
+                finally:
+                    self.release(url, wrapped)
+        else:
+            response = self.client.request(method, url, headers=headers, data=data,
+                                           timeout=self.config['timeout'], stream=True)
+            wrapped = Response(response, response.iter_content, response.raw.tell, True)
+            try:
+                yield wrapped
+            finally:
+                self.release(url, wrapped)
+
+    def release(self, url, response):
+        response.release(self.config['drain_bytes'])
+        if response.drained and self.on_drain is not None:
+            self.on_drain(url, response.drained)
+
+    def get(self, url, headers=None):
+        return self.request('GET', url, headers)
+
+    def post(self, url, data, headers=None):
+        return self.request('POST', url, headers, data)
+
+    def close(self):
+        self.client.close()
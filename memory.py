@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+Memory budget and allocation profiling for the handcuffs monitor
+MemoryGuard compares the process's resident set size with a configured
+budget; over budget, the monitor first collects garbage and hands freed
+heap back to the OS, and then sheds work by deferring checks until memory
+falls. AllocationProfiler can be switched on at runtime and attributes
+tracemalloc allocations to each check phase
+"""
+
+import gc
+import logging
+import os
+import sys
+import threading
+import tracemalloc
+from contextlib import contextmanager
+
+log = logging.getLogger("handcuffs.memory")
+
+DEFAULTS = {
+    # Resident set size the daemon should stay under; None disables the guard
+    'rss_budget_mb': None,
+    # Checks run per batch while over budget; None means concurrency.max_workers
+    'shed_batch': None,
+    'defer_seconds': 60,
+    # Start with allocation profiling on
+    'profile': False,
+    'profile_top': 10,
+    'profile_frames': 1,
+}
+
+
+def current_rss():
+    """Resident set size of this process in bytes, or None when it can't be read.
+
+    Reads /proc on Linux and uses psutil elsewhere when it is installed.
+    """
+    try:
+        with open("/proc/self/statm", 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.Process().memory_info().rss
+
+
+def release_heap():
+    """Ask the C allocator to return free heap pages to the OS (glibc only)."""
+    if not sys.platform.startswith('linux'):
+        return
+    try:
+        import ctypes
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+
+class MemoryGuard:
+    """RSS budget check with garbage collection before anything is shed."""
+
+    def __init__(self, config=None):
+        self.config = dict(DEFAULTS)
+        self.config.update(config or {})
+        budget = self.config['rss_budget_mb']
+        self.budget = budget * 2 ** 20 if budget else None
+        self.shedding = False
+        if self.budget is not None and current_rss() is None:
+            log.warning("⚠️ memory.rss_budget_mb is set but RSS can't be read here (install psutil); "
+                        "the budget is not enforced")
+            self.budget = None
+
+    def over_budget(self):
+        """True when RSS stays above the budget even after a full collection."""
+        if self.budget is None:
+            return False
+        rss = current_rss()
+        if rss > self.budget:
+            gc.collect()
+            release_heap()
+            rss = current_rss()
+        over = rss > self.budget
+        if over != self.shedding:
+            self.shedding = over
+            if over:
+                log.warning(f"⚠️ RSS {rss / 2 ** 20:.0f} MiB is over the {self.budget / 2 ** 20:.0f} MiB budget, "
+                            f"shedding checks", extra={'event': 'memory_shed', 'rss': rss})
+            else:
+                log.info(f"✅ RSS {rss / 2 ** 20:.0f} MiB is back under budget",
+                         extra={'event': 'memory_recovered', 'rss': rss})
+        return over
+
+
+class AllocationProfiler:
+    """Net allocations per check phase, from tracemalloc snapshots taken around each phase.
+
+    While profiling, phases run one at a time so that each snapshot
+    difference belongs to a single phase. That slows checks down, so it is
+    meant to be switched on for a while and then off again.
+    """
+
+    # Lines kept per phase between dumps
+    MAX_LINES = 500
+
+    def __init__(self, top=10, frames=1):
+        self.top = top
+        self.frames = frames
+        self.active = False
+        self.started_tracing = False
+        self.lock = threading.Lock()
+        self.phase_lock = threading.Lock()
+        self.local = threading.local()
+        self.phases = {}
+
+    def start(self):
+        with self.lock:
+            if self.active:
+                return
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(self.frames)
+                self.started_tracing = True
+            self.phases = {}
+            self.active = True
+        log.info("🔬 Allocation profiling on", extra={'event': 'profile_on'})
+
+    def stop(self):
+        """Stop profiling and return the final dump."""
+        report = self.dump()
+        with self.lock:
+            self.active = False
+            if self.started_tracing:
+                tracemalloc.stop()
+                self.started_tracing = False
+        log.info("🔬 Allocation profiling off", extra={'event': 'profile_off'})
+        return report
+
+    @contextmanager
+    def phase(self, name):
+        """Attribute allocations made inside the block to a phase (a no-op unless profiling)."""
+        if not self.active or getattr(self.local, 'inside', False):
+            # Nested phases are counted as part of the outer one
+            yield
+            return
+        with self.phase_lock:
+            self.local.inside = True
+            before = tracemalloc.take_snapshot()
+            try:
+                yield
+            finally:
+                after = tracemalloc.take_snapshot()
+                self.local.inside = False
+                self.record(name, after.compare_to(before, 'lineno'))
+
+    def record(self, name, differences):
+        with self.lock:
+            if not self.active:
+                return
+            phase = self.phases.setdefault(name, {'calls': 0, 'net_bytes': 0, 'lines': {}})
+            phase['calls'] += 1
+            for stat in differences:
+                frame = stat.traceback[0]
+                if frame.filename in (__file__, tracemalloc.__file__):
+                    continue
+                phase['net_bytes'] += stat.size_diff
+                where = f"{frame.filename}:{frame.lineno}"
+                line = phase['lines'].setdefault(where, [0, 0])
+                line[0] += stat.size_diff
+                line[1] += stat.count_diff
+            if len(phase['lines']) > self.MAX_LINES:
+                kept = sorted(phase['lines'].items(), key=lambda entry: -abs(entry[1][0]))[:self.MAX_LINES // 2]
+                phase['lines'] = dict(kept)
+
+    def dump(self):
+        """Top allocating lines per phase since profiling started, also written to the log."""
+        with self.lock:
+            report = {}
+            for name, phase in self.phases.items():
+                top = sorted(phase['lines'].items(), key=lambda entry: -entry[1][0])[:self.top]
+                report[name] = {
+                    'calls': phase['calls'],
+                    'net_bytes': phase['net_bytes'],
+                    'top': [{'where': where, 'bytes': size, 'blocks': count} for where, (size, count) in top],
+                }
+        log.info("🔬 Allocation profile", extra={'event': 'profile_dump', 'profile': report})
+        return report
+
+
+def format_profile(report):
+    """Lines describing a profile dump, largest allocators first in each phase."""
+    lines = []
+    for name, phase in sorted(report.items()):
+        lines.append(f"{name}: {phase['calls']} call(s), net {phase['net_bytes'] / 1024:+.1f} KiB")
+        for entry in phase['top']:
+            lines.append(f"  {entry['bytes'] / 1024:+10.1f} KiB {entry['blocks']:+7d} blk  {entry['where']}")
+    return lines
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+In-memory metrics for the handcuffs monitor
+Per-phase latency histograms plus per-page byte and per-item status-change counters,
+served in Prometheus text format and dumped as a JSON summary at shutdown
+"""
+
+import json
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+PHASES = ('connect', 'download', 'parse', 'decision', 'state_write', 'notify')
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class Histogram:
+    """Fixed-bucket latency histogram."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def state(self):
+        """(counts, count, sum, max) as plain values, for take_delta."""
+        return list(self.counts), self.count, self.sum, self.max
+
+    def merge(self, counts, count, total, maximum):
+        """Add another histogram's observations over the same buckets."""
+        self.counts = [a + b for a, b in zip(self.counts, counts)]
+        self.count += count
+        self.sum += total
+        self.max = max(self.max, maximum)
+
+    def quantile(self, q):
+        """Upper bucket bound holding the q-th quantile (approximate)."""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return self.max
+
+
+class Metrics:
+    """Thread-safe registry of phase histograms and per-item counters."""
+
+    def __init__(self, profiler=None):
+        self.lock = threading.Lock()
+        # Optional AllocationProfiler that also sees every timed phase
+        self.profiler = profiler
+        self.histograms = {phase: Histogram() for phase in PHASES}
+        self.bytes_fetched = {}
+        self.status_changes = {}
+        self.checks = {}
+        self.started = time.time()
+        self.server = None
+        # Totals as of the last take_delta
+        self.reported = {'histograms': {}, 'bytes_fetched': {}, 'status_changes': {}, 'checks': {}}
+
+    def observe(self, phase, seconds):
+        with self.lock:
+            histogram = self.histograms.get(phase)
+            if histogram is None:
+                histogram = self.histograms[phase] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def phase(self, name):
+        """Time a block of code as one observation of a phase."""
+        started = time.perf_counter()
+        try:
+            with self.profiler.phase(name) if self.profiler is not None else nullcontext():
+                yield
+        finally:
+            self.observe(name, time.perf_counter() - started)
+
+    def add_bytes(self, url, count):
+        with self.lock:
+            self.bytes_fetched[url] = self.bytes_fetched.get(url, 0) + count
+
+    def count_check(self, item_name, result):
+        with self.lock:
+            key = (item_name, result)
+            self.checks[key] = self.checks.get(key, 0) + 1
+
+    def count_status_change(self, item_name):
+        with self.lock:
+            self.status_changes[item_name] = self.status_changes.get(item_name, 0) + 1
+
+    def take_delta(self):
+        """Everything recorded since the last call, as plain dicts for merge(); None if nothing was.
+
+        A worker process sends these with its sweep results so the
+        coordinator's metrics cover every check.
+        """
+        with self.lock:
+            current = {
+                'histograms': {phase: histogram.state() for phase, histogram in self.histograms.items()},
+                'bytes_fetched': dict(self.bytes_fetched),
+                'status_changes': dict(self.status_changes),
+                'checks': dict(self.checks),
+            }
+            reported, self.reported = self.reported, current
+        delta = {'histograms': {}}
+        for phase, (counts, count, total, maximum) in current['histograms'].items():
+            before = reported['histograms'].get(phase)
+            if before is not None:
+                if count == before[1]:
+                    continue
+                counts = [a - b for a, b in zip(counts, before[0])]
+                count, total = count - before[1], total - before[2]
+            elif not count:
+                continue
+            delta['histograms'][phase] = (counts, count, total, maximum)
+        for name in ('bytes_fetched', 'status_changes', 'checks'):
+            before = reported[name]
+            delta[name] = {key: value - before.get(key, 0) for key, value in current[name].items()
+                           if value != before.get(key, 0)}
+        return delta if any(delta.values()) else None
+
+    def merge(self, delta):
+        """Add a delta from another process's take_delta."""
+        with self.lock:
+            for phase, state in delta['histograms'].items():
+                histogram = self.histograms.get(phase)
+                if histogram is None:
+                    histogram = self.histograms[phase] = Histogram()
+                histogram.merge(*state)
+            for name in ('bytes_fetched', 'status_changes', 'checks'):
+                counters = getattr(self, name)
+                for key, value in delta[name].items():
+                    counters[key] = counters.get(key, 0) + value
+
+    def render_prometheus(self):
+        """Current metrics in Prometheus text exposition format."""
+        lines = [
+            "# HELP monitor_phase_seconds Time spent in each check phase.",
+            "# TYPE monitor_phase_seconds histogram",
+        ]
+        with self.lock:
+            for phase, histogram in self.histograms.items():
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f'monitor_phase_seconds_bucket{{phase="{phase}",le="{bound}"}} {cumulative}')
+                lines.append(f'monitor_phase_seconds_bucket{{phase="{phase}",le="+Inf"}} {histogram.count}')
+                lines.append(f'monitor_phase_seconds_sum{{phase="{phase}"}} {histogram.sum:.6f}')
+                lines.append(f'monitor_phase_seconds_count{{phase="{phase}"}} {histogram.count}')
+
+            lines.append("# HELP monitor_bytes_fetched_total Response body bytes read per page.")
+            lines.append("# TYPE monitor_bytes_fetched_total counter")
+            for url, count in self.bytes_fetched.items():
+                lines.append(f'monitor_bytes_fetched_total{{url="{escape_label(url)}"}} {count}')
+
+            lines.append("# HELP monitor_status_changes_total Stock status changes per item.")
+            lines.append("# TYPE monitor_status_changes_total counter")
+            for item_name, count in self.status_changes.items():
+                lines.append(f'monitor_status_changes_total{{item="{escape_label(item_name)}"}} {count}')
+
+            lines.append("# HELP monitor_checks_total Checks per item by result.")
+            lines.append("# TYPE monitor_checks_total counter")
+            for (item_name, result), count in self.checks.items():
+                lines.append(f'monitor_checks_total{{item="{escape_label(item_name)}",result="{result}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """Plain dict summary: per-phase count/mean/p50/p99/max and the counters."""
+        with self.lock:
+            phases = {}
+            for phase, histogram in self.histograms.items():
+                phases[phase] = {
+                    'count': histogram.count,
+                    'mean_seconds': histogram.sum / histogram.count if histogram.count else 0.0,
+                    'p50_seconds': histogram.quantile(0.5),
+                    'p99_seconds': histogram.quantile(0.99),
+                    'max_seconds': histogram.max,
+                }
+            checks = {}
+            for (item_name, result), count in self.checks.items():
+                checks.setdefault(item_name, {})[result] = count
+            return {
+                'uptime_seconds': time.time() - self.started,
+                'phases': phases,
+                'bytes_fetched': dict(self.bytes_fetched),
+                'status_changes': dict(self.status_changes),
+                'checks': checks,
+            }
+
+    def write_summary(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.summary(), f, indent=2)
+
+    def serve(self, port, host="127.0.0.1"):
+        """Expose /metrics on a local HTTP port from a background thread."""
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = metrics.render_prometheus().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, name="metrics", daemon=True).start()
+        return self.server
+
+    def close(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class TimedChunks:
+    """Wrap a chunk iterator, timing the waits on the network and counting bytes."""
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.seconds = 0.0
+        self.bytes = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            chunk = next(self.chunks)
+        finally:
+            self.seconds += time.perf_counter() - started
+        self.bytes += len(chunk)
+        return chunk
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Logging pipeline for the handcuffs monitor
+Records are handed to a queue by the threads that log them and written by one
+listener thread: JSON lines to a size-rotated log file, plus plain messages on
+the console when it is a terminal. tail() reads the end of the log by seeking
+backward, so it costs the same however large the file has grown
+
+Usage: python monitor_log.py tail [lines] [log_file]
+"""
+
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+from datetime import datetime
+
+DEFAULTS = {
+    'file': "handcuffs_monitor.log",
+    'level': "INFO",
+    'max_bytes': 5 * 1024 * 1024,
+    'backup_count': 5,
+    # None means "only when stdout is a terminal"
+    'console': None,
+}
+
+# Attributes every LogRecord has; anything else was passed through extra=
+STANDARD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message and any extra= fields."""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in STANDARD_ATTRIBUTES and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class LogPipeline:
+    """Queue listener feeding the file and console handlers."""
+
+    def __init__(self, handlers):
+        self.handlers = handlers
+        self.listeners = []
+
+    def listen(self, log_queue):
+        """Drain another queue (e.g. one shared with worker processes) into the same handlers."""
+        listener = logging.handlers.QueueListener(log_queue, *self.handlers, respect_handler_level=True)
+        listener.start()
+        self.listeners.append(listener)
+
+    def stop(self):
+        """Flush every queued record and close the handlers."""
+        for listener in self.listeners:
+            listener.stop()
+        self.listeners = []
+        for handler in self.handlers:
+            handler.close()
+
+
+def logging_config(config_file):
+    """The logging section of config_file, or {} when it can't be read."""
+    try:
+        with open(config_file, 'r') as f:
+            return json.load(f).get('logging') or {}
+    except (OSError, ValueError):
+        return {}
+
+
+def setup_logging(config=None, log_queue=None):
+    """Route the root logger through a queue and return the LogPipeline.
+
+    With log_queue (a worker process), records are only put on that queue and
+    the parent process writes them; no pipeline is returned.
+    """
+    settings = dict(DEFAULTS)
+    settings.update(config or {})
+    root = logging.getLogger()
+    root.setLevel(settings['level'])
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+
+    if log_queue is not None:
+        root.addHandler(logging.handlers.QueueHandler(log_queue))
+        return None
+
+    file_handler = logging.handlers.RotatingFileHandler(
+        settings['file'], maxBytes=settings['max_bytes'], backupCount=settings['backup_count'],
+        encoding='utf-8')
+    file_handler.setFormatter(JsonFormatter())
+    handlers = [file_handler]
+    console = settings['console']
+    if console is None:
+        console = sys.stdout.isatty()
+    if console:
+        console_handler = logging.StreamHandler(sys.stdout)
+        console_handler.setFormatter(logging.Formatter("%(message)s"))
+        handlers.append(console_handler)
+
+    pipeline = LogPipeline(handlers)
+    local_queue = queue.SimpleQueue()
+    root.addHandler(logging.handlers.QueueHandler(local_queue))
+    pipeline.listen(local_queue)
+    return pipeline
+
+
+def tail(path, lines=5, block_size=4096):
+    """Return the last `lines` lines of a file, reading backward from the end."""
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        data = b''
+        # One extra newline so the first kept line is complete
+        while position > 0 and data.count(b'\n') <= lines:
+            step = min(block_size, position)
+            position -= step
+            f.seek(position)
+            data = f.read(step) + data
+    return [line.decode('utf-8', 'replace') for line in data.splitlines()[-lines:]] if lines > 0 else []
+
+
+def render(line):
+    """A log line as 'time level message', or unchanged if it isn't JSON."""
+    try:
+        entry = json.loads(line)
+        return f"{entry['ts']} {entry['level']:7} {entry['msg']}"
+    except (ValueError, KeyError, TypeError):
+        return line.strip()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != 'tail':
+        print("Usage: python monitor_log.py tail [lines] [log_file]")
+        sys.exit(1)
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    path = sys.argv[3] if len(sys.argv) > 3 else DEFAULTS['file']
+    for line in tail(path, count):
+        print(render(line))
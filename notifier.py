@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+Asynchronous email notifications for the handcuffs monitor
+Alerts are queued and sent by a background worker that keeps one
+authenticated SMTP session open, folds alerts arriving close together into a
+single digest email and retries failed sends with backoff
+"""
+
+import logging
+import queue
+import threading
+import time
+from datetime import datetime
+
+log = logging.getLogger("handcuffs.notifier")
+
+STOP = object()
+SMTP_TIMEOUT = 30
+
+
+class Alert:
+    """One stock alert waiting to be emailed."""
+
+    __slots__ = ('item', 'subject', 'message', 'created')
+
+    def __init__(self, item, subject, message):
+        self.item = item
+        self.subject = subject
+        self.message = message
+        self.created = datetime.now()
+
+
+class NotificationDispatcher:
+    """Queue of alerts drained by a single background SMTP worker."""
+
+    def __init__(self, email_config):
+        self.email_config = email_config
+        self.coalesce_seconds = float(email_config.get('coalesce_seconds', 5))
+        self.max_retries = int(email_config.get('max_retries', 5))
+        self.retry_delay = float(email_config.get('retry_delay_seconds', 2))
+        self.idle_timeout = float(email_config.get('idle_timeout_seconds', 60))
+        self.queue = queue.Queue()
+        self.server = None
+        self.thread = None
+        self.lock = threading.Lock()
+        # Alerts the worker has taken off the queue and not yet delivered
+        self.batch = []
+
+    def start(self):
+        """Start the background worker if it isn't running yet."""
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name="notifier", daemon=True)
+                self.thread.start()
+
+    def notify(self, item, subject, message):
+        """Queue an alert. Never blocks on SMTP."""
+        self.start()
+        self.queue.put(Alert(item, subject, message))
+
+    def stop(self, timeout=None):
+        """Flush queued alerts and stop the worker.
+
+        By default this waits long enough for every retry of the last batch
+        (plus one SMTP timeout); alerts still undelivered after timeout are
+        logged, since the daemon worker dies with the process.
+        """
+        if self.thread is None or not self.thread.is_alive():
+            return
+        if timeout is None:
+            timeout = self.coalesce_seconds + self.retry_delay * (2 ** self.max_retries - 1) + SMTP_TIMEOUT
+        self.queue.put(STOP)
+        self.thread.join(timeout)
+        if self.thread.is_alive():
+            undelivered = list(self.batch)
+            while True:
+                try:
+                    alert = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if alert is not STOP:
+                    undelivered.append(alert)
+            self.log_undelivered(undelivered, f"still pending after {timeout:g}s at shutdown")
+
+    def run(self):
+        """Worker loop: wait for an alert, gather the burst, send it as one email."""
+        stopping = False
+        while not stopping:
+            try:
+                first = self.queue.get(timeout=self.idle_timeout)
+            except queue.Empty:
+                self.disconnect()
+                continue
+            if first is STOP:
+                break
+
+            batch = [first]
+            deadline = time.monotonic() + self.coalesce_seconds
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    alert = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if alert is STOP:
+                    stopping = True
+                    break
+                batch.append(alert)
+
+            self.batch = batch
+            self.send_with_retry(batch)
+            self.batch = []
+        self.disconnect()
+
+    def send_with_retry(self, batch):
+        """Send a batch, reconnecting and backing off between failed attempts."""
+        msg = self.build_message(batch)
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.send(msg)
+                names = ", ".join(alert.item['name'] for alert in batch)
+                log.info(f"📧 Notification sent for {names}", extra={'event': 'notification_sent', 'alerts': len(batch)})
+                return True
+            except Exception as e:
+                self.disconnect()
+                if attempt == self.max_retries:
+                    self.log_undelivered(batch, f"failed after {attempt + 1} attempts: {str(e)}")
+                    return False
+                delay = self.retry_delay * (2 ** attempt)
+                log.warning(f"⚠️ Error sending notification ({str(e)}), retrying in {delay:g}s")
+                time.sleep(delay)
+
+    def log_undelivered(self, alerts, reason):
+        """Log alerts that will never be emailed, so they can be followed up by hand."""
+        if not alerts:
+            return
+        for alert in alerts:
+            log.error(f"❌ Notification not delivered ({reason}): {alert.item['name']}: {alert.subject}",
+                      extra={'event': 'notification_lost', 'item': alert.item['name'], 'url': alert.item.get('url')})
+
+    def send(self, msg):
+        """Send one message over the pooled SMTP session."""
+        server = self.connect()
+        server.sendmail(self.email_config['sender_email'], self.email_config['recipient_email'], msg.as_string())
+
+    def connect(self):
+        """Return the open SMTP session, opening and authenticating one if needed."""
+        import smtplib
+
+        if self.server is not None:
+            try:
+                if self.server.noop()[0] == 250:
+                    return self.server
+            except smtplib.SMTPException:
+                pass
+            except OSError:
+                pass
+            self.disconnect()
+
+        config = self.email_config
+        server = smtplib.SMTP(config['smtp_server'], config['smtp_port'], timeout=SMTP_TIMEOUT)
+        if config.get('starttls', True):
+            server.starttls()
+        if config.get('sender_password'):
+            server.login(config['sender_email'], config['sender_password'])
+        self.server = server
+        return server
+
+    def disconnect(self):
+        """Close the SMTP session, ignoring errors from a dead connection."""
+        if self.server is None:
+            return
+        try:
+            self.server.quit()
+        except Exception:
+            pass
+        self.server = None
+
+    def build_message(self, batch):
+        """One alert becomes a regular email; several become a digest."""
+        from email.mime.text import MIMEText
+        from email.mime.multipart import MIMEMultipart
+
+        config = self.email_config
+        msg = MIMEMultipart()
+        msg['From'] = config['sender_email']
+        msg['To'] = config['recipient_email']
+
+        if len(batch) == 1:
+            alert = batch[0]
+            msg['Subject'] = f"🔗 ASP Handcuffs Alert: {alert.subject}"
+            body = f"""
+            🎉 ASP HANDCUFFS COLOR VARIANTS ALERT! 🎉
+            
+            Item: {alert.item['name']}
+            URL: {alert.item['url']}
+            Status: {alert.message}
+            Time: {alert.created.strftime('%Y-%m-%d %H:%M:%S')}
+            
+            {alert.item['name']} color variants are now available!
+            
+            🛒 Quick Link: {alert.item['url']}
+            
+            Check the website to see which colors (Blue, Gray, Pink, Yellow) are in stock!
+            """
+        else:
+            msg['Subject'] = f"🔗 ASP Handcuffs Alert: {len(batch)} items changed"
+            entries = "\n".join(
+                f"""
+            Item: {alert.item['name']}
+            Status: {alert.message}
+            Time: {alert.created.strftime('%Y-%m-%d %H:%M:%S')}
+            🛒 Quick Link: {alert.item['url']}
+            """ for alert in batch)
+            body = f"""
+            🎉 ASP HANDCUFFS COLOR VARIANTS ALERT! 🎉
+            {entries}
+            """
+
+        msg.attach(MIMEText(body, 'plain'))
+        return msg
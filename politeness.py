@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""
+Per-host politeness for the handcuffs monitor
+A token bucket caps requests per second and in-flight requests for each host,
+429/503 answers back the host off (honoring Retry-After), and a circuit
+breaker pauses a failing host until a single probe request succeeds
+"""
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+
+log = logging.getLogger("handcuffs.politeness")
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+DEFAULTS = {
+    'requests_per_second': 1.0,
+    'burst': 2,
+    'max_in_flight': 2,
+    'failure_threshold': 5,
+    'cooldown_seconds': 300,
+    'max_backoff_seconds': 900,
+}
+
+# A host backed off for no longer than this (or one token interval) is waited for, not skipped
+MAX_WAIT_SECONDS = 1.0
+
+
+class HostUnavailable(Exception):
+    """Raised instead of sending a request while a host is paused."""
+
+    def __init__(self, host, retry_in):
+        super().__init__(f"{host} paused for {retry_in:.0f}s")
+        self.host = host
+        self.retry_in = retry_in
+
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date)."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    from email.utils import parsedate_to_datetime
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+class HostPolicy:
+    """Token bucket, in-flight cap, adaptive backoff and circuit breaker for one host."""
+
+    def __init__(self, host, settings):
+        self.host = host
+        self.max_rate = float(settings['requests_per_second'])
+        self.rate = self.max_rate
+        self.burst = float(settings['burst'])
+        self.failure_threshold = int(settings['failure_threshold'])
+        self.base_cooldown = float(settings['cooldown_seconds'])
+        self.max_backoff = float(settings['max_backoff_seconds'])
+        self.slots = threading.BoundedSemaphore(int(settings['max_in_flight']))
+        self.lock = threading.Lock()
+        self.tokens = self.burst
+        self.refilled = time.monotonic()
+        self.blocked_until = 0.0
+        self.backoff = 0.0
+        self.failures = 0
+        self.state = CLOSED
+        self.cooldown = self.base_cooldown
+        self.opened_at = 0.0
+        self.probing = False
+
+    def retry_in(self):
+        """Seconds until this host accepts requests again (0 if it does now)."""
+        with self.lock:
+            now = time.monotonic()
+            wait = max(0.0, self.blocked_until - now)
+            if self.state == OPEN:
+                wait = max(wait, self.opened_at + self.cooldown - now)
+            return wait
+
+    def acquire(self):
+        """Wait for a token and an in-flight slot, or raise HostUnavailable.
+
+        Waiting is only ever for about one token interval (at least a
+        second): a host backed off for longer raises instead, so the caller's
+        thread and slot go to other hosts in the meantime.
+        """
+        probe = False
+        with self.lock:
+            now = time.monotonic()
+            if self.state == OPEN:
+                if now < self.opened_at + self.cooldown:
+                    raise HostUnavailable(self.host, self.opened_at + self.cooldown - now)
+                self.state = HALF_OPEN
+                self.probing = False
+            if self.blocked_until - now > self.max_wait():
+                raise HostUnavailable(self.host, self.blocked_until - now)
+            if self.state == HALF_OPEN:
+                if self.probing:
+                    raise HostUnavailable(self.host, self.cooldown)
+                # Exactly one probe goes through; everyone else waits for its verdict
+                self.probing = probe = True
+
+        self.slots.acquire()
+        try:
+            while True:
+                with self.lock:
+                    now = time.monotonic()
+                    self.tokens = min(self.burst, self.tokens + (now - self.refilled) * self.rate)
+                    self.refilled = now
+                    wait = self.blocked_until - now
+                    if wait > self.max_wait():
+                        # Backed off by another request while this one waited for its slot
+                        raise HostUnavailable(self.host, wait)
+                    if wait <= 0 and self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    if wait <= 0:
+                        wait = (1 - self.tokens) / self.rate
+                time.sleep(wait)
+        except BaseException:
+            self.slots.release()
+            if probe:
+                # The probe never went out; let the next request make it
+                with self.lock:
+                    self.probing = False
+            raise
+
+    def max_wait(self):
+        """Longest backoff acquire sleeps through rather than raising HostUnavailable (call with lock held)."""
+        return max(MAX_WAIT_SECONDS, 1 / self.rate)
+
+    def release(self):
+        self.slots.release()
+
+    def record_response(self, status_code, retry_after=None):
+        """Adapt to a response: back off on 429/503, recover gradually on success."""
+        if status_code in (429, 503):
+            with self.lock:
+                self.backoff = min(self.max_backoff, max(1.0, self.backoff * 2 or 1.0 / self.rate))
+                # Retry-After counts, but no more than the longest backoff of our own
+                delay = min(self.max_backoff, max(self.backoff, parse_retry_after(retry_after) or 0.0))
+                self.blocked_until = max(self.blocked_until, time.monotonic() + delay)
+                # Multiplicative decrease of the request rate
+                self.rate = max(self.max_rate / 16, self.rate / 2)
+            self.record_failure()
+        elif status_code >= 500:
+            self.record_failure()
+        else:
+            self.record_success()
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.backoff = 0.0
+            # Additive increase back towards the configured rate
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 8)
+            if self.state != CLOSED:
+                log.info(f"✅ {self.host} recovered, resuming requests", extra={'event': 'host_recovered', 'host': self.host})
+            self.state = CLOSED
+            self.cooldown = self.base_cooldown
+            self.probing = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == HALF_OPEN:
+                # Probe failed: stay paused, and for longer
+                self.cooldown = min(self.max_backoff, self.cooldown * 2)
+                self.trip()
+            elif self.state == CLOSED and self.failures >= self.failure_threshold:
+                self.trip()
+
+    def trip(self):
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self.probing = False
+        log.warning(f"⛔ {self.host} failing, pausing requests for {self.cooldown:.0f}s",
+                    extra={'event': 'host_paused', 'host': self.host})
+
+
+def share_limits(settings, share):
+    """A host's rate, burst and in-flight limits cut to this process's share of them.
+
+    Each process keeps at least one token and one request in flight, so with
+    more processes than max_in_flight the total can still exceed it.
+    """
+    if share >= 1:
+        return settings
+    settings = dict(settings)
+    settings['requests_per_second'] = float(settings['requests_per_second']) * share
+    settings['burst'] = max(1.0, float(settings['burst']) * share)
+    settings['max_in_flight'] = max(1, int(int(settings['max_in_flight']) * share))
+    return settings
+
+
+class Politeness:
+    """Registry of HostPolicy objects keyed by host name.
+
+    share is the part of each host's limits this process may use, 1/N when
+    N worker processes poll the same hosts.
+    """
+
+    def __init__(self, config=None, share=1.0):
+        config = config or {}
+        self.defaults = dict(DEFAULTS)
+        self.defaults.update({k: v for k, v in config.items() if k in DEFAULTS})
+        self.overrides = config.get('hosts', {})
+        self.share = share
+        self.hosts = {}
+        self.lock = threading.Lock()
+
+    def policy(self, url):
+        host = urlsplit(url).netloc
+        with self.lock:
+            policy = self.hosts.get(host)
+            if policy is None:
+                settings = dict(self.defaults)
+                settings.update(self.overrides.get(host, {}))
+                policy = self.hosts[host] = HostPolicy(host, share_limits(settings, self.share))
+            return policy
+
+    @contextmanager
+    def request(self, url):
+        """Hold a token and an in-flight slot for url's host around one request.
+
+        An exception escaping the block (a network error) counts as a failure
+        unless record_response was already called for it.
+        """
+        policy = self.policy(url)
+        policy.acquire()
+        handle = RequestHandle(policy)
+        try:
+            yield handle
+        except BaseException:
+            if not handle.recorded:
+                policy.record_failure()
+            raise
+        else:
+            if not handle.recorded:
+                policy.record_success()
+        finally:
+            policy.release()
+
+
+class RequestHandle:
+    """Lets the caller report the response it got while holding the slot."""
+
+    def __init__(self, policy):
+        self.policy = policy
+        self.recorded = False
+
+    def record_response(self, response):
+        self.recorded = True
+        self.policy.record_response(response.status_code, response.headers.get('Retry-After'))
@@ -7,7 +7,10 @@ echo "======================================"
 
 # Stop the monitor process
 echo "🛑 Stopping monitor process..."
-pkill -f simple_handcuffs_monitor.py
+pid=$(python3 control.py status 2>/dev/null | sed -n 's/^Monitor pid \([0-9]*\).*/\1/p')
+python3 control.py stop
+# Give it time to flush state before the files below are removed: wait for the process to exit
+for i in $(seq 240); do [ -n "$pid" ] && kill -0 "$pid" 2>/dev/null || break; sleep 0.5; done
 
 # Unload LaunchAgent
 echo "🛑 Unloading LaunchAgent..."
@@ -19,7 +22,8 @@ rm -f ~/Library/LaunchAgents/com.handcuffs.monitor.plist
 
 # Clean up log files
 echo "🧹 Cleaning up log files..."
-rm -f handcuffs_monitor.log handcuffs_monitor_error.log previous_status.json
+rm -f handcuffs_monitor.log handcuffs_monitor.log.* handcuffs_monitor_error.log previous_status.json monitor_state.db monitor_state.db-wal monitor_state.db-shm metrics_summary.json monitor.sock events.jsonl
+rm -rf snapshots
 
 echo "✅ Quick stop complete!"
 echo "📄 Monitor files remain (delete manually if desired):"
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Restock-likelihood model for the handcuffs monitor
+Learns from the observation history when each item tends to come back in
+stock: by hour of the week (weekday and hour of day) and by how long it has
+been sold out. The monitor then spaces an item's polls so the expected number
+of polls per hour follows that likelihood, scaled so the weighted total fits a
+global request budget
+
+Usage: python restock_model.py [config.json]
+"""
+
+import sys
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+
+HOURS_PER_WEEK = 168
+WEEKDAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+# Sold-out spell durations kept per item and pooled; older ones age out so memory stays flat
+SPELLS_KEPT = 100
+POOLED_SPELLS_KEPT = 2000
+
+DEFAULTS = {
+    'enabled': False,
+    # Requests per hour across all items; None spends what uniform polling would
+    'budget_per_hour': None,
+    'min_interval_seconds': 300,
+    # Default: four times the item's configured interval
+    'max_interval_seconds': None,
+    'min_weight': 0.25,
+    'max_weight': 8.0,
+    # How many restocks' worth of evidence the pooled prior counts as
+    'prior_strength': 5.0,
+    # Width of the "restocks within the next ..." window for the time-since-sellout term
+    'spell_window_seconds': 6 * 3600,
+    # Fewer completed sold-out spells than this and time since sellout is ignored
+    'min_spells': 3,
+}
+
+
+def hour_of_week(when):
+    return when.weekday() * 24 + when.hour
+
+
+def smoothed(counts, hour):
+    """Count at an hour of the week, blended with its neighbours (restocks at 8:55 and 9:05 are one window)."""
+    return 0.25 * counts[hour - 1] + 0.5 * counts[hour] + 0.25 * counts[(hour + 1) % HOURS_PER_WEEK]
+
+
+class ItemHistory:
+    """Restock evidence for one item."""
+
+    def __init__(self):
+        self.restocks = [0] * HOURS_PER_WEEK
+        self.total = 0
+        # Durations in seconds of sold-out spells that began with an observed sellout
+        self.spells = deque(maxlen=SPELLS_KEPT)
+        self.in_stock = None
+        self.out_since = None
+        self.spell_observed = False
+
+
+class RestockModel:
+    """Per-item restock likelihood with a prior pooled across all items."""
+
+    def __init__(self, config=None):
+        self.config = dict(DEFAULTS)
+        self.config.update(config or {})
+        self.items = {}
+        self.pooled = [0] * HOURS_PER_WEEK
+        self.pooled_total = 0
+        self.pooled_spells = deque(maxlen=POOLED_SPELLS_KEPT)
+        self.lock = threading.Lock()
+
+    def load(self, transitions):
+        """Replay (item_key, observed_at, in_stock) verdict changes from the state store."""
+        for key, observed_at, in_stock in transitions:
+            self.observe(key, in_stock, datetime.fromisoformat(observed_at))
+
+    def observe(self, key, in_stock, when):
+        """Feed one verdict; only changes from the previous one carry information."""
+        if in_stock is None:
+            return
+        with self.lock:
+            history = self.items.setdefault(key, ItemHistory())
+            if history.in_stock is False and in_stock:
+                hour = hour_of_week(when)
+                history.restocks[hour] += 1
+                history.total += 1
+                self.pooled[hour] += 1
+                self.pooled_total += 1
+                if history.spell_observed:
+                    duration = (when - history.out_since).total_seconds()
+                    history.spells.append(duration)
+                    self.pooled_spells.append(duration)
+            elif not in_stock and history.in_stock is not False:
+                history.out_since = when
+                # A first-ever verdict of "out" didn't see the sellout, so the spell length is unknown
+                history.spell_observed = history.in_stock is True
+            history.in_stock = in_stock
+
+    def hour_weight(self, history, hour):
+        """Restock likelihood at an hour of the week relative to uniform (1.0 = average)."""
+        prior = (smoothed(self.pooled, hour) + 1) / (self.pooled_total + HOURS_PER_WEEK)
+        strength = self.config['prior_strength']
+        return (smoothed(history.restocks, hour) + strength * prior) / (history.total + strength) * HOURS_PER_WEEK
+
+    def spell_weight(self, history, elapsed):
+        """Hazard of a restock soon, given `elapsed` seconds sold out, relative to a memoryless guess."""
+        spells = history.spells if len(history.spells) >= self.config['min_spells'] else self.pooled_spells
+        if len(spells) < self.config['min_spells']:
+            return 1.0
+        window = self.config['spell_window_seconds']
+        at_risk = [d for d in spells if d >= elapsed]
+        if not at_risk:
+            # Longer than anything seen before: no evidence either way
+            return 1.0
+        hazard = sum(1 for d in at_risk if d < elapsed + window) / len(at_risk)
+        baseline = min(1.0, window * len(spells) / sum(spells))
+        ratio = hazard / baseline
+        # Shrink toward 1 when few spells lasted this long
+        shrink = len(at_risk) / (len(at_risk) + self.config['prior_strength'])
+        return 1 + (ratio - 1) * shrink
+
+    def weight(self, key, when):
+        """Polling weight for an item at a moment; 1.0 means its configured rate."""
+        with self.lock:
+            history = self.items.get(key)
+            if history is None or history.in_stock is not False:
+                # Unknown or in stock: nothing to predict
+                return 1.0
+            weight = self.hour_weight(history, hour_of_week(when))
+            if history.out_since is not None:
+                weight *= self.spell_weight(history, (when - history.out_since).total_seconds())
+        return min(self.config['max_weight'], max(self.config['min_weight'], weight))
+
+    def next_interval(self, key, base_interval, now, scale=1.0):
+        """Seconds until the next poll.
+
+        The poll rate at any moment is scale * weight / base_interval. The next
+        poll is placed where the expected number of polls since now reaches
+        one, so a likely window coming up soon pulls the next poll into it.
+        """
+        min_interval = min(self.config['min_interval_seconds'], base_interval)
+        max_interval = self.config['max_interval_seconds'] or base_interval * 4
+        remaining = 1.0
+        elapsed = 0.0
+        moment = now
+        while elapsed < max_interval:
+            boundary = moment.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+            step = (boundary - moment).total_seconds()
+            rate = scale * self.weight(key, moment) / base_interval
+            if rate * step >= remaining:
+                elapsed += remaining / rate
+                break
+            remaining -= rate * step
+            elapsed += step
+            moment = boundary
+        return min(max_interval, max(min_interval, elapsed))
+
+    def top_windows(self, key, count=3):
+        """The hours of the week with the highest restock likelihood for an item."""
+        with self.lock:
+            history = self.items.get(key) or ItemHistory()
+            weights = [(self.hour_weight(history, hour), hour) for hour in range(HOURS_PER_WEEK)]
+        return [(f"{WEEKDAYS[hour // 24]} {hour % 24:02d}:00", weight)
+                for weight, hour in sorted(weights, reverse=True)[:count]]
+
+
+def budget_scale(config, weighted, fixed_per_hour=0.0):
+    """Factor applied to every adaptive item's rate so the total stays within budget_per_hour.
+
+    weighted holds (weight now, base interval) for each adaptive item, and
+    fixed_per_hour the polls of items on a fixed interval, which the scale
+    doesn't touch. Without a budget the adaptive items together spend what
+    uniform polling of them would. min and max_interval_seconds still bound
+    each item, so a budget below what max_interval_seconds allows can't be met.
+    """
+    demand = sum(3600 * weight / interval for weight, interval in weighted)
+    if not demand:
+        return 1.0
+    budget = config.get('budget_per_hour')
+    if budget:
+        available = max(0.0, budget - fixed_per_hour)
+    else:
+        available = sum(3600 / interval for _, interval in weighted)
+    return available / demand
+
+
+def main():
+    import json
+
+    from simple_handcuffs_monitor import configured_interval, item_key
+    from state_store import StateStore
+
+    config_file = sys.argv[1] if len(sys.argv) > 1 else "config.json"
+    with open(config_file, 'r') as f:
+        config = json.load(f)
+    store = StateStore(config.get('state', {}).get('database', "monitor_state.db"))
+    model = RestockModel(config.get('adaptive'))
+    model.load(store.verdict_transitions())
+    store.close()
+
+    now = datetime.now()
+    intervals = {item_key(item): configured_interval(item, config['schedule']) for item in config['items']}
+    weighted = [(model.weight(item_key(item), now), intervals[item_key(item)])
+                for item in config['items'] if item.get('adaptive', True)]
+    fixed = sum(3600 / intervals[item_key(item)] for item in config['items'] if not item.get('adaptive', True))
+    scale = budget_scale(model.config, weighted, fixed)
+
+    print(f"Pooled restocks: {model.pooled_total}, sold-out spells: {len(model.pooled_spells)}, budget scale {scale:.2f}")
+    for item in config['items']:
+        key = item_key(item)
+        history = model.items.get(key) or ItemHistory()
+        windows = ", ".join(f"{label} x{weight:.1f}" for label, weight in model.top_windows(key))
+        interval = model.next_interval(key, intervals[key], now, scale)
+        print(f"{item['name']}: {history.total} restock(s), weight now {model.weight(key, now):.2f}, "
+              f"next poll in {interval / 60:.0f} min (configured {intervals[key] / 60:.0f} min)")
+        print(f"   likeliest: {windows}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
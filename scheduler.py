@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Adaptive scheduler for the handcuffs monitor
+Keeps a heap of next-due times so every item can have its own interval and
+jitter, and sleeps exactly until the next item is due
+"""
+
+import heapq
+import itertools
+import random
+import threading
+import time
+
+
+class Scheduler:
+    """Priority-queue scheduler keyed by item."""
+
+    def __init__(self):
+        self.heap = []
+        self.jobs = {}
+        self.counter = itertools.count()
+        self.condition = threading.Condition()
+        self.stopped = False
+        self.woken = False
+
+    def add(self, key, item, interval, jitter=0, delay=0):
+        """Schedule an item (or update an existing one) to run after delay seconds.
+
+        An existing item keeps its pending due time, unless its interval got
+        shorter: then it is due no later than one new interval after its last run.
+        """
+        with self.condition:
+            job = self.jobs.get(key)
+            if job is not None:
+                shorter = interval < job['interval']
+                job['item'] = item
+                job['interval'] = interval
+                job['jitter'] = jitter
+                if shorter and 'due' in job and 'ran' in job and job['ran'] + interval < job['due']:
+                    self._push(key, job['ran'] + interval)
+                    self.condition.notify()
+                return
+            self.jobs[key] = {'item': item, 'interval': interval, 'jitter': jitter}
+            self._push(key, time.monotonic() + delay)
+            self.condition.notify()
+
+    def remove(self, key):
+        """Stop scheduling an item. Its heap entry is discarded lazily."""
+        with self.condition:
+            self.jobs.pop(key, None)
+            self.condition.notify()
+
+    def reschedule(self, key, interval=None):
+        """Queue an item's next run one interval (plus jitter) from now.
+
+        interval overrides the item's configured interval for this run only.
+        """
+        with self.condition:
+            job = self.jobs.get(key)
+            if job is None:
+                return
+            delay = job['interval'] if interval is None else interval
+            if job['jitter']:
+                delay += random.uniform(-job['jitter'], job['jitter'])
+            if job.pop('rerun', False):
+                # run_now arrived while this run was in progress
+                delay = 0
+            self._push(key, time.monotonic() + max(0, delay))
+            self.condition.notify()
+
+    def reschedule_in(self, key, delay):
+        """Queue an item's next run after an explicit delay, without jitter."""
+        with self.condition:
+            job = self.jobs.get(key)
+            if job is None:
+                return
+            if job.pop('rerun', False):
+                delay = 0
+            self._push(key, time.monotonic() + max(0, delay))
+            self.condition.notify()
+
+    def run_now(self, key):
+        """Move an item to the front of the queue.
+
+        An item whose run is in progress is marked to run again as soon as
+        that run is rescheduled.
+        """
+        with self.condition:
+            job = self.jobs.get(key)
+            if job is None:
+                return False
+            if 'due' not in job:
+                job['rerun'] = True
+                return True
+            self._push(key, time.monotonic())
+            self.condition.notify()
+            return True
+
+    def next_due(self, key):
+        """Seconds until an item is due, or None if it isn't scheduled."""
+        with self.condition:
+            job = self.jobs.get(key)
+            if job is None or 'due' not in job:
+                return None
+            return max(0, job['due'] - time.monotonic())
+
+    def wait_for_due(self):
+        """Block until at least one item is due and return the due items.
+
+        Returns None once the scheduler is stopped, and an empty list when
+        wake() was called with nothing due.
+        """
+        with self.condition:
+            while not self.stopped:
+                if self.woken:
+                    self.woken = False
+                    return []
+                self._drop_stale()
+                now = time.monotonic()
+                if self.heap and self.heap[0][0] <= now:
+                    due = []
+                    while self.heap and self.heap[0][0] <= now:
+                        _, seq, key = heapq.heappop(self.heap)
+                        job = self.jobs.get(key)
+                        if job is not None and job.get('seq') == seq:
+                            job.pop('due', None)
+                            job['ran'] = now
+                            due.append(job['item'])
+                    if due:
+                        return due
+                    continue
+                timeout = self.heap[0][0] - now if self.heap else None
+                self.condition.wait(timeout)
+            return None
+
+    def wake(self):
+        """Wake the waiting loop so it re-reads the queue and any flags set for it."""
+        with self.condition:
+            self.woken = True
+            self.condition.notify_all()
+
+    def stop(self):
+        """Stop the scheduler and release anyone waiting on it."""
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+
+    def _push(self, key, due):
+        seq = next(self.counter)
+        job = self.jobs[key]
+        job['seq'] = seq
+        job['due'] = due
+        heapq.heappush(self.heap, (due, seq, key))
+
+    def _drop_stale(self):
+        # Removed or rescheduled items leave old entries behind
+        while self.heap:
+            _, seq, key = self.heap[0]
+            job = self.jobs.get(key)
+            if job is not None and job.get('seq') == seq:
+                break
+            heapq.heappop(self.heap)
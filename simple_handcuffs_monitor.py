@@ -1,320 +1,1156 @@
 #!/usr/bin/env python3
 """
-Simple monitor for ASP Identifier Ultra Plus Chain Handcuffs - Pink variant
+Simple monitor for ASP Identifier Ultra Plus handcuffs color variants
 Uses requests instead of Selenium to avoid ChromeDriver issues
 """
 
-import requests
-import schedule
+import argparse
+import signal
 import time
 import json
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+import logging
 from datetime import datetime
-from bs4 import BeautifulSoup
 import os
 import sys
-from dotenv import load_dotenv
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin
 
-# Load environment variables
-load_dotenv()
+from catalog import Catalog, merge_entry, normalize_url
+from events import EventHub
+from http_client import HttpClient
+from memory import AllocationProfiler, MemoryGuard, current_rss
+from metrics import Metrics, TimedChunks
+from monitor_log import logging_config, setup_logging
+from politeness import HostUnavailable, Politeness
+from restock_model import RestockModel, budget_scale
+from scheduler import Scheduler
+from state_store import StateStore
+from stock_parser import (Detection, detect_stock, detect_stock_attributes, detect_stock_streaming,
+                          diff_variants, product_attributes, variant_stock)
+from stock_selectors import SelectorEngine
+
+log = logging.getLogger("handcuffs.monitor")
+
+# Failed checks (other than on a paused host) are retried after this, doubling with each failure in a row
+MIN_RETRY_SECONDS = 30
+
+# The storefront's own endpoint for product option changes; answers with BCData's product_attributes
+PROBE_PATH = "/remote/v1/product-attributes/{product_id}"
+PROBE_HEADERS = {'Accept': 'application/json', 'X-Requested-With': 'XMLHttpRequest'}
+
+def item_key(item):
+    """Key an item's status is stored under."""
+    return f"{item['name']}_{item['url']}"
+
+def configured_interval(item, schedule):
+    """An item's configured polling interval in seconds (per-item override or global default)."""
+    if 'interval_seconds' in item:
+        return float(item['interval_seconds'])
+    return float(item.get('interval_hours', schedule['interval_hours'])) * 3600
+
+def variant_names(item):
+    """Display names for an item's variant IDs, when variant_ids maps IDs to names."""
+    variant_ids = item.get('variant_ids')
+    if isinstance(variant_ids, dict):
+        return {str(variant_id): name for variant_id, name in variant_ids.items()}
+    return {}
+
+def evaluate_item(item, detection, selector_engine):
+    """Apply an item's variant and price predicates to a parsed page.
+    
+    Items without variant_ids or max_price take the page verdict as is.
+    """
+    record = detection.record
+    if detection.unchanged or detection.in_stock is None:
+        return detection.in_stock, detection.message
+    if record is None:
+        # No BCData: use the verdict from this item's own selectors
+        selectors = selector_engine.for_item(item)
+        return detection.verdicts.get(selectors, (detection.in_stock, detection.message))
+    
+    in_stock, message = detection.in_stock, detection.message
+    variant_ids = [str(v) for v in item.get('variant_ids', [])]
+    if variant_ids:
+        offered = set(record.available_variant_values) | set(record.in_stock_attributes)
+        available = [v for v in variant_ids if v in offered]
+        if available:
+            in_stock, message = True, f"Watched variants are available: {available}"
+        else:
+            in_stock, message = False, f"Watched variants are unavailable: {variant_ids}"
+    
+    max_price = item.get('max_price')
+    if in_stock and max_price is not None and record.price is not None and record.price > max_price:
+        in_stock, message = False, f"{message} but price ${record.price:.2f} is above ${max_price:.2f}"
+    return in_stock, message
 
 class SimpleHandcuffsMonitor:
-    def __init__(self, config_file="config.json"):
+    # Part of each host's politeness limits this process uses
+    politeness_share = 1.0
+    
+    def __init__(self, config_file="config.json", one_shot=False):
         """Initialize the simple handcuffs monitor."""
         self.config_file = config_file
+        self.one_shot = one_shot
+        self.selector_engine = SelectorEngine()
         self.config = self.load_config()
         self.previous_status = {}
+        self.status_lock = threading.Lock()
+        self.validators = {}
+        # Per-variant stock from the last sweep: {item_key: {variant_id: VariantStock}}
+        self.variant_status = {}
+        self.dirty_status = set()
+        self.dirty_variants = set()
+        # Latest catalog listing entry per product URL: {url: ListingEntry}
+        self.listing_entries = {}
+        # Product ID to listing URL, for items matched by product_id
+        self.listing_ids = {}
+        self.dirty_listings = set()
+        self.dirty_validators = set()
+        self.removed_validators = set()
+        self.pending_observations = []
+        self.scheduler = Scheduler()
+        self.notifier = None
+        memory_config = (self.config or {}).get('memory', {})
+        self.memory = MemoryGuard(memory_config)
+        self.profiler = AllocationProfiler(self.memory.config['profile_top'], self.memory.config['profile_frames'])
+        if self.memory.config['profile']:
+            self.profiler.start()
+        self.metrics = Metrics(self.profiler)
+        # Created on the first batch and kept, so worker threads (and their malloc arenas) are reused
+        self.pool = None
+        self.pool_size = None
+        # Shared by every check so connections, TLS sessions and DNS answers are reused
+        self.http = None
+        self.http_lock = threading.Lock()
+        self.politeness = Politeness((self.config or {}).get('politeness'), self.politeness_share)
+        self.retry_at = {}
+        # Set by SIGHUP; the run loop reloads the config
+        self.reload_requested = False
+        # Failed checks in a row per item, for the retry backoff
+        self.failures = {}
+        # Pages whose product-attributes endpoint failed: {url: monotonic time to try it again}
+        self.probe_paused = {}
+        # Latest observation per item, errors included, for the control socket's status
+        self.last_observed = {}
+        self.control = None
+        self.events = None
+        self.open_event_hub()
+        state_config = (self.config or {}).get('state', {})
+        self.store = StateStore(state_config.get('database', "monitor_state.db"))
+        self.snapshots = None
+        snapshot_config = (self.config or {}).get('snapshots', {})
+        if snapshot_config.get('enabled'):
+            from snapshot_store import SnapshotStore
+            self.snapshots = SnapshotStore(snapshot_config.get('directory', "snapshots"),
+                                           snapshot_config.get('compression', "auto"))
+        # 'bcdata' archives just the BCData JSON; 'html' the page bytes read
+        self.snapshot_capture = snapshot_config.get('content', "bcdata") if self.snapshots else None
         self.load_previous_status()
+        self.catalog = None
+        catalog_config = (self.config or {}).get('catalog', {})
+        if catalog_config.get('enabled'):
+            self.catalog = Catalog(catalog_config)
+        self.restock_model = None
+        # (monotonic expiry, factor) from budget_scale
+        self.scale_cache = None
+        adaptive_config = (self.config or {}).get('adaptive', {})
+        if adaptive_config.get('enabled'):
+            self.restock_model = RestockModel(adaptive_config)
+            self.restock_model.load(self.store.verdict_transitions())
         
     def load_config(self):
         """Load configuration from JSON file."""
         if os.path.exists(self.config_file):
             with open(self.config_file, 'r') as f:
-                return json.load(f)
+                config = json.load(f)
+            if not self.one_shot:
+                # A daemon pays the compile cost once at load; a one-shot run compiles on first use
+                self.selector_engine.compile_items(config.get('items', []))
+            return config
         else:
-            print("❌ config.json not found. Please run setup_handcuffs.py first.")
+            log.error("❌ config.json not found. Please run setup_handcuffs.py first.")
             return None
     
     def load_previous_status(self):
-        """Load previous status from file."""
-        status_file = "previous_status.json"
-        if os.path.exists(status_file):
-            with open(status_file, 'r') as f:
-                self.previous_status = json.load(f)
+        """Load previous status from the state store, importing the old JSON file once."""
+        if self.store.is_empty() and os.path.exists("previous_status.json"):
+            count = self.store.import_json("previous_status.json")
+            log.info(f"📥 Imported {count} item(s) from previous_status.json into {self.store.path}")
+        self.previous_status = self.store.load_status()
+        self.variant_status = self.store.load_variants()
+        self.listing_entries = self.store.load_listings()
+        self.listing_ids = {entry.product_id: url for url, entry in self.listing_entries.items()
+                            if entry.product_id is not None}
+        self.validators = self.store.load_validators()
+    
+    def take_pending_state(self):
+        """Hand over this sweep's status, variant and listing changes, observations and validators, and reset them."""
+        with self.status_lock:
+            statuses = {key: dict(self.previous_status[key]) for key in self.dirty_status}
+            variants = [(key, self.variant_status[key][variant_id]) for key, variant_id in self.dirty_variants]
+            listings = [self.listing_entries[url] for url in self.dirty_listings]
+            validators = {url: self.validators[url] for url in self.dirty_validators if url in self.validators}
+            removed = set(self.removed_validators)
+            observations = self.pending_observations
+            self.dirty_status = set()
+            self.dirty_variants = set()
+            self.dirty_listings = set()
+            self.dirty_validators = set()
+            self.removed_validators = set()
+            self.pending_observations = []
+        return statuses, observations, validators, removed, variants, listings
     
     def save_previous_status(self):
-        """Save current status to file."""
-        with open("previous_status.json", 'w') as f:
-            json.dump(self.previous_status, f, indent=2)
+        """Write this sweep's status, variant and listing changes, observations and validators in one batch."""
+        statuses, observations, validators, removed, variants, listings = self.take_pending_state()
+        if statuses or observations or validators or removed or variants or listings:
+            self.store.write_sweep(statuses, observations, validators, removed, variants, listings)
     
-    def check_pink_variant_availability(self):
-        """Check if the pink variant is available using requests."""
+    def fetch_page(self, url, watchers):
+        """Fetch and parse one product page on behalf of every item watching it.
+        
+        Returns a Detection. detection.unchanged is True when the page answered
+        304 or its BCData hashes to the cached value, in which case the
+        previous status of every watcher still holds and nothing was parsed.
+        """
+        started = time.monotonic()
+        http = self.http_client()
+        target = self.probe_target(url, watchers)
+        if target is not None:
+            detection = self.probe_page(url, watchers, http, *target)
+            if detection is not None:
+                detection.latency = time.monotonic() - started
+                return detection
         try:
-            print("🔍 Checking ASP Identifier Ultra Plus Chain Handcuffs - Pink availability...")
-            
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-                'Accept-Language': 'en-US,en;q=0.5',
-                'Accept-Encoding': 'gzip, deflate',
-                'Connection': 'keep-alive',
-                'Upgrade-Insecure-Requests': '1',
-            }
+            fetch_config = self.config.get('fetch', {})
             
-            url = "https://www.handcuffwarehouse.com/asp-identifier-ultra-plus-chain-handcuffs/"
-            response = requests.get(url, headers=headers, timeout=15)
-            response.raise_for_status()
+            # Validators are only usable once every watcher has a status to fall back on
+            with self.status_lock:
+                has_status = all(item_key(item) in self.previous_status for item in watchers)
+                cached = self.validators.get(url, {}) if has_status else {}
+            headers = {}
+            if cached.get('etag'):
+                headers['If-None-Match'] = cached['etag']
+            if cached.get('last_modified'):
+                headers['If-Modified-Since'] = cached['last_modified']
+            known_hash = cached.get('content_hash')
+            selector_sets = list(dict.fromkeys(self.selector_engine.for_item(item) for item in watchers))
             
-            soup = BeautifulSoup(response.content, 'html.parser')
+            with self.politeness.request(url) as host:
+                request_started = time.perf_counter()
+                with http.get(url, headers) as response:
+                    # DNS, connect, TLS and time to first byte up to the response headers
+                    self.metrics.observe('connect', time.perf_counter() - request_started)
+                    host.record_response(response)
+                    if response.status_code == 304:
+                        detection = Detection(unchanged=True)
+                    elif fetch_config.get('stream', True):
+                        # Read the body in chunks and stop as soon as BCData gives a verdict
+                        response.raise_for_status()
+                        chunks = TimedChunks(response.iter_chunks(fetch_config.get('chunk_size', 16384)))
+                        detect_started = time.perf_counter()
+                        detection = detect_stock_streaming(chunks, known_hash, selector_sets, self.snapshot_capture)
+                        self.metrics.observe('download', chunks.seconds)
+                        self.metrics.observe('parse', time.perf_counter() - detect_started - chunks.seconds)
+                    else:
+                        response.raise_for_status()
+                        download_started = time.perf_counter()
+                        content = response.read()
+                        self.metrics.observe('download', time.perf_counter() - download_started)
+                        with self.metrics.phase('parse'):
+                            detection = detect_stock(content, known_hash, selector_sets, self.snapshot_capture)
             
-            # Look for the BCData JavaScript object which contains stock information
-            scripts = soup.find_all('script')
-            bcdata_found = False
-            available_variants = []
-            
-            for script in scripts:
-                if script.string and 'BCData' in script.string:
-                    script_content = script.string
-                    print("✅ Found BCData script")
-                    
-                    # Extract available_modifier_values and available_variant_values
-                    if '"available_modifier_values":[' in script_content:
-                        # Parse the available modifier values
-                        start = script_content.find('"available_modifier_values":[')
-                        end = script_content.find(']', start)
-                        if end > start:
-                            modifier_section = script_content[start:end+1]
-                            print(f"📋 Modifier values: {modifier_section}")
-                            
-                            # Check if there are any available variants
-                            if '[]' in modifier_section or 'available_modifier_values":[]' in modifier_section:
-                                print("⚠️ No available modifier values found, checking other indicators...")
-                                # Don't return False yet, check other indicators
-                            else:
-                                # Extract the actual values
-                                import re
-                                values_match = re.search(r'"available_modifier_values":\[(.*?)\]', script_content)
-                                if values_match:
-                                    values_str = values_match.group(1)
-                                    if values_str.strip():
-                                        available_variants = [v.strip('"') for v in values_str.split(',') if v.strip()]
-                                        print(f"✅ Available variants: {available_variants}")
-                                    else:
-                                        print("⚠️ No available variants in modifier values, checking other indicators...")
-                                else:
-                                    print("⚠️ Could not parse modifier values, checking other indicators...")
-                    
-                    # Also check available_variant_values
-                    if '"available_variant_values":[' in script_content:
-                        start = script_content.find('"available_variant_values":[')
-                        end = script_content.find(']', start)
-                        if end > start:
-                            variant_section = script_content[start:end+1]
-                            print(f"📋 Variant values: {variant_section}")
-                            
-                            # Check if there are available variants
-                            if '[]' not in variant_section:
-                                import re
-                                values_match = re.search(r'"available_variant_values":\[(.*?)\]', script_content)
-                                if values_match:
-                                    values_str = values_match.group(1)
-                                    if values_str.strip():
-                                        available_variants = [v.strip('"') for v in values_str.split(',') if v.strip()]
-                                        print(f"✅ Available variants from variant_values: {available_variants}")
-                                        return True, f"Color variants are available: {available_variants}"
-                    
-                    # Show the full BCData for debugging
-                    print("🔍 Full BCData excerpt:")
-                    bcdata_start = script_content.find('var BCData = {')
-                    if bcdata_start != -1:
-                        bcdata_end = script_content.find('};', bcdata_start) + 2
-                        bcdata_excerpt = script_content[bcdata_start:bcdata_end]
-                        print(bcdata_excerpt[:500] + "..." if len(bcdata_excerpt) > 500 else bcdata_excerpt)
-                    
-                    # Check for positive stock indicators
-                    if '"instock":true' in script_content:
-                        print("✅ Product shows as in stock")
-                        return True, "Product is in stock"
-                    
-                    # Check for negative stock indicators
-                    if '"instock":false' in script_content:
-                        print("❌ Product shows as not in stock")
-                        return False, "Product is not in stock"
-                    
-                    # Check purchasing message
-                    if '"purchasing_message":"The selected product combination is currently unavailable."' in script_content:
-                        print("❌ Product combination unavailable")
-                        return False, "Selected product combination is currently unavailable"
-                    
-                    bcdata_found = True
-                    break
-            
-            if not bcdata_found:
-                print("⚠️ BCData not found, falling back to HTML parsing...")
-            
-            # Fallback: Look for color options in HTML
-            color_options = soup.find_all('option', string=lambda text: text and any(color in text.lower() for color in ['blue', 'gray', 'pink', 'yellow']))
-            if color_options:
-                available_colors = [option.get_text().strip() for option in color_options if option.get_text().strip()]
-                print(f"✅ Found color options in HTML: {available_colors}")
-                return True, f"Color variants are available: {available_colors}"
-            
-            # Look for out of stock indicators in HTML
-            out_of_stock_indicators = [
-                "out of stock",
-                "sold out", 
-                "unavailable",
-                "backorder",
-                "preorder",
-                "currently unavailable"
-            ]
-            
-            page_text = soup.get_text().lower()
-            for indicator in out_of_stock_indicators:
-                if indicator in page_text:
-                    print(f"❌ Found out of stock indicator: '{indicator}'")
-                    return False, f"Product shows as {indicator}"
-            
-            # If we found available variants, check if any are available
-            if available_variants:
-                # Any color variant is available - send notification!
-                return True, f"Color variants are now available: {available_variants}"
-            else:
-                return False, "No color variants are currently available"
-            
-            # If we get here and no variants were found, assume out of stock
-            return False, "No color variants are currently available"
+            self.metrics.add_bytes(url, detection.bytes_read)
+            if response.status_code != 304:
+                self.update_validators(url, response.headers, detection.content_hash)
+            if detection.snapshot is not None:
+                self.archive_snapshot(url, detection)
                 
-        except requests.RequestException as e:
-            return None, f"Network error: {str(e)}"
+        except HostUnavailable as e:
+            detection = Detection(None, f"Host paused: {str(e)}")
+            detection.retry_in = e.retry_in
+        except http.network_errors as e:
+            detection = Detection(None, f"Network error: {str(e)}")
         except Exception as e:
-            return None, f"Error checking availability: {str(e)}"
+            detection = Detection(None, f"Error checking availability: {str(e)}")
+        detection.latency = time.monotonic() - started
+        return detection
+    
+    def probe_target(self, url, watchers):
+        """(endpoint, product ID, option ID, option values) when a page is checked through its JSON endpoint.
+        
+        Returns None for pages fetched as HTML: the probe is off, no watcher
+        has a product_id, or the endpoint failed recently.
+        """
+        default = self.config.get('fetch', {}).get('probe', "html")
+        probing = [item for item in watchers if item.get('probe', default) == "json" and item.get('product_id')]
+        if not probing:
+            return None
+        with self.status_lock:
+            if self.probe_paused.get(url, 0) > time.monotonic():
+                return None
+        product_id = probing[0]['product_id']
+        option_id = next((item['option_id'] for item in probing if item.get('option_id') is not None), None)
+        values = []
+        if option_id is not None:
+            # Each watched value of the option is queried as its own selection
+            values = list(dict.fromkeys(str(v) for item in watchers for v in item.get('variant_ids', [])))
+        return urljoin(url, PROBE_PATH.format(product_id=product_id)), product_id, option_id, values
     
-    def check_item_stock(self):
-        """Check stock for the ASP handcuffs."""
-        item = self.config["items"][0]  # We're only monitoring one item
+    def probe_page(self, url, watchers, http, endpoint, product_id, option_id, values):
+        """Check a product through the storefront's product-attributes endpoint.
+        
+        The JSON is a small fraction of the page and goes through the same
+        verdict logic as BCData. Returns a Detection, or None when the
+        endpoint failed and the page should be fetched instead.
+        """
+        with self.status_lock:
+            has_status = all(item_key(item) in self.previous_status for item in watchers)
+            known_hash = self.validators.get(url, {}).get('content_hash') if has_status else None
+        selections = [{}] + [{f"attribute[{option_id}]": value} for value in values]
+        responses = []
+        bytes_read = 0
+        failure = None
+        # Transient failures fall back for this check only; a missing or broken endpoint for a while
+        broken = True
+        try:
+            for selection in selections:
+                form = {'action': 'add', 'product_id': product_id, 'qty[]': 1, **selection}
+                with self.politeness.request(endpoint) as host:
+                    request_started = time.perf_counter()
+                    with http.post(endpoint, form, PROBE_HEADERS) as response:
+                        self.metrics.observe('connect', time.perf_counter() - request_started)
+                        host.record_response(response)
+                        if response.status_code in (429, 503):
+                            # The host is shedding load; fetching the page instead would only add to it
+                            return Detection(None, f"Network error: {response.status_code} from {endpoint}")
+                        if response.status_code != 200:
+                            failure = f"HTTP {response.status_code}"
+                            broken = response.status_code < 500
+                            break
+                        download_started = time.perf_counter()
+                        payload = response.read()
+                        self.metrics.observe('download', time.perf_counter() - download_started)
+                bytes_read += len(payload)
+                attributes = product_attributes(payload)
+                if attributes is None:
+                    failure = "no product attributes in the response"
+                    break
+                responses.append(attributes)
+        except HostUnavailable as e:
+            detection = Detection(None, f"Host paused: {str(e)}")
+            detection.retry_in = e.retry_in
+            return detection
+        except http.network_errors as e:
+            failure = str(e)
+            broken = False
         
-        print(f"\n{'='*60}")
-        print(f"🔗 ASP Handcuffs Stock Check - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-        print(f"{'='*60}")
-        print(f"Item: {item['name']}")
-        print(f"URL: {item['url']}")
+        detection = None
+        if failure is None:
+            parse_started = time.perf_counter()
+            option_stock = None
+            if values:
+                # With an option value selected, instock is the stock of that selection
+                option_stock = {value: attributes.get('instock') is True
+                                for value, attributes in zip(values, responses[1:])}
+            detection = detect_stock_attributes(responses[0], option_stock, known_hash, self.snapshot_capture,
+                                                bytes_read)
+            self.metrics.observe('parse', time.perf_counter() - parse_started)
+            if detection is None:
+                failure = "no stock verdict in the product attributes"
+        self.metrics.add_bytes(url, bytes_read)
+        if failure is not None:
+            retry_seconds = self.config.get('fetch', {}).get('probe_retry_seconds', 3600)
+            if broken:
+                with self.status_lock:
+                    self.probe_paused[url] = time.monotonic() + retry_seconds
+            log.warning(f"⚠️ Product attributes for {url} failed ({failure}); fetching the page instead"
+                        + (f" for the next {retry_seconds:g}s" if broken else ""),
+                        extra={'event': 'probe_fallback', 'url': url, 'failure': failure})
+            return None
         
-        in_stock, message = self.check_pink_variant_availability()
+        self.update_validators(url, {}, detection.content_hash)
+        if detection.snapshot is not None:
+            self.archive_snapshot(url, detection)
+        return detection
+    
+    def archive_snapshot(self, url, detection):
+        """Store the page snapshot behind a detection; identical snapshots are stored once."""
+        kind, content = detection.snapshot
+        detection.snapshot = None
+        try:
+            detection.snapshot_id = self.snapshots.put(content, kind)
+        except OSError as e:
+            log.warning(f"⚠️ Could not archive snapshot of {url}: {e}")
+    
+    def update_validators(self, url, response_headers, content_hash):
+        """Remember ETag, Last-Modified and BCData hash for the next conditional GET."""
+        validators = {
+            'etag': response_headers.get('ETag'),
+            'last_modified': response_headers.get('Last-Modified'),
+            'content_hash': content_hash,
+        }
+        with self.status_lock:
+            self.validators[url] = {k: v for k, v in validators.items() if v}
+            self.dirty_validators.add(url)
+    
+    def check_item_availability(self, item):
+        """Fetch an item's page and return (detection, in_stock, message) for it."""
+        detection = self.fetch_page(item['url'], [item])
+        in_stock, message = self.evaluate_watcher(item, detection)
+        return detection, in_stock, message
+    
+    def evaluate_watcher(self, item, detection):
+        """Apply an item's variant and price predicates to a parsed page."""
+        return evaluate_item(item, detection, self.selector_engine)
+    
+    def check_page(self, url, watchers):
+        """Fetch a page once and update every item watching it."""
+        with self.profiler.phase('fetch'):
+            detection = self.fetch_page(url, watchers)
+        results = {}
+        for item in watchers:
+            in_stock, message = self.evaluate_watcher(item, detection)
+            results[item_key(item)] = self.check_item_stock(item, detection, in_stock, message)
+        return results
+    
+    def check_item_stock(self, item, detection=None, in_stock=None, message=None):
+        """Check stock for a single item and record any status change.
         
-        print(f"Status: {message}")
+        When a detection is passed in (a page shared by several items) it is
+        used instead of fetching the page again.
+        """
+        if detection is None:
+            detection, in_stock, message = self.check_item_availability(item)
+        unchanged = detection.unchanged
         
-        # Check if status changed
-        item_key = f"{item['name']}_{item['url']}"
-        previous_status = self.previous_status.get(item_key, None)
+        with self.metrics.phase('decision'):
+            # Check if status changed
+            key = item_key(item)
+            with self.status_lock:
+                # A copy: update_status below changes the stored dict in place
+                previous_status = dict(self.previous_status[key]) if key in self.previous_status else None
+            
+            if unchanged:
+                # Nothing new on the page, so skip the decision logic entirely
+                in_stock, message = previous_status['in_stock'], previous_status['message']
+            elif in_stock is None:
+                # Don't let a later 304 or hash match resurrect this failed check
+                with self.status_lock:
+                    if self.validators.pop(item['url'], None) is not None:
+                        self.removed_validators.add(item['url'])
+            
+            record = detection.record
+            self.record_observation(key, in_stock, message, record, detection.latency, detection.snapshot_id)
+            variant_changes = []
+            if record is not None and not unchanged and in_stock is not None:
+                variant_changes = self.update_variants(key, item, record)
+            
+            if unchanged:
+                result = 'unchanged'
+            elif in_stock is None:
+                result = 'error'
+            else:
+                result = 'in_stock' if in_stock else 'out_of_stock'
+            self.metrics.count_check(item['name'], result)
+            
+            # A failed check says nothing about stock: it never counts as a change, and a
+            # status stored by one (in_stock None) is no baseline to compare against
+            known = previous_status is not None and previous_status['in_stock'] is not None
+            changed = known and not unchanged and in_stock is not None and previous_status['in_stock'] != in_stock
+            # Watched variants that came back while the item as a whole stayed in stock
+            restocked = [] if changed or not in_stock else [
+                variant for before, variant in variant_changes
+                if variant.in_stock and (before is None or not before.in_stock) and self.watches(item, variant)]
+            if in_stock is None and not unchanged:
+                self.retry_at[key] = self.retry_delay(key, detection.retry_in or
+                                                      self.politeness.policy(item['url']).retry_in())
+            else:
+                self.failures.pop(key, None)
+            if in_stock is not None and (not known or changed):
+                self.update_status(key, {
+                    'in_stock': in_stock,
+                    'message': message,
+                    'last_checked': datetime.now().isoformat()
+                })
+            elif previous_status is not None:
+                self.update_status(key, {'last_checked': datetime.now().isoformat()})
         
-        if previous_status is None:
-            # First time checking
-            self.previous_status[item_key] = {
-                'in_stock': in_stock,
-                'message': message,
-                'last_checked': datetime.now().isoformat()
-            }
-            print(f"📋 First check: {message}")
-        elif previous_status['in_stock'] != in_stock:
+        fields = {'event': 'check', 'item': key, 'result': result, 'in_stock': in_stock,
+                  'latency_ms': round(detection.latency * 1000, 1), 'bytes': detection.bytes_read}
+        if variant_changes:
+            self.publish_variant_changes(item, variant_changes, detection)
+        if not known and in_stock is not None:
+            # First successful check
+            log.info(f"📋 {item['name']}: first check: {message}", extra=fields)
+        elif changed:
             # Status changed
+            self.metrics.count_status_change(item['name'])
+            self.publish_transition(item, previous_status, in_stock, message, detection)
+            fields['event'] = 'status_change'
             if in_stock:
-                self.send_notification(item, "PINK HANDCUFFS BACK IN STOCK!", message)
-                print(f"🎉 {item['name']} is back in stock!")
+                with self.metrics.phase('notify'):
+                    self.send_notification(item, f"{item['name']} BACK IN STOCK!", message)
+                log.warning(f"🎉 {item['name']} is back in stock! {message}", extra=fields)
             else:
-                print(f"📦 {item['name']} is now out of stock")
-            
-            self.previous_status[item_key] = {
-                'in_stock': in_stock,
-                'message': message,
-                'last_checked': datetime.now().isoformat()
-            }
+                log.info(f"📦 {item['name']} is now out of stock: {message}", extra=fields)
+        elif restocked:
+            names = ", ".join(variant.name for variant in restocked)
+            fields.update(event='variant_restock', variants=[variant.variant_id for variant in restocked])
+            with self.metrics.phase('notify'):
+                self.send_notification(item, f"{item['name']} {names} BACK IN STOCK!", f"Now available: {names}")
+            log.warning(f"🎉 {item['name']}: {names} back in stock", extra=fields)
+        elif in_stock is None and not unchanged:
+            log.warning(f"⚠️ {item['name']}: {message} (keeping last known status)", extra=fields)
         else:
-            # Status unchanged
-            self.previous_status[item_key]['last_checked'] = datetime.now().isoformat()
-            print(f"Status unchanged")
+            log.info(f"🔗 {item['name']}: {message} (unchanged, {detection.latency * 1000:.0f} ms)", extra=fields)
         
-        self.save_previous_status()
-        print(f"{'='*60}\n")
-        sys.stdout.flush()
         return in_stock, message
     
+    def update_variants(self, key, item, record):
+        """Diff an item's per-variant stock against the last sweep and keep only what changed.
+        
+        Returns [(previous VariantStock or None, current)] for the changed
+        variants. The first model built for an item is a baseline and
+        reports no changes.
+        """
+        watched = [str(variant_id) for variant_id in item.get('variant_ids', [])]
+        with self.status_lock:
+            previous = self.variant_status.get(key)
+            known = [*watched, *(previous or {})]
+            current = variant_stock(record, variant_names(item), known, datetime.now().isoformat())
+            changes = diff_variants(previous or {}, current)
+            if changes:
+                stored = self.variant_status.setdefault(key, {})
+                for _, variant in changes:
+                    stored[variant.variant_id] = variant
+                    self.dirty_variants.add((key, variant.variant_id))
+        return changes if previous is not None else []
+    
+    def watches(self, item, variant):
+        """Whether an item alerts on a variant: its variant_ids, or every variant when it has none."""
+        watched = item.get('variant_ids')
+        return not watched or variant.variant_id in {str(variant_id) for variant_id in watched}
+    
+    def update_status(self, key, fields):
+        """Merge fields into an item's stored status (safe across worker threads)."""
+        with self.status_lock:
+            self.previous_status.setdefault(key, {}).update(fields)
+            self.dirty_status.add(key)
+    
+    def record_observation(self, key, in_stock, message, record, latency, snapshot=None):
+        """Queue a history row; it is written with the rest of the sweep."""
+        observation = {
+            'item_key': key,
+            'observed_at': datetime.now().isoformat(),
+            'in_stock': in_stock,
+            'message': message,
+            'variants': record.available_variant_values if record is not None else None,
+            'price': record.price if record is not None else None,
+            'latency_ms': round(latency * 1000, 1),
+            'snapshot': snapshot,
+        }
+        with self.status_lock:
+            self.pending_observations.append(observation)
+            self.last_observed[key] = observation
+        if self.restock_model is not None:
+            self.restock_model.observe(key, in_stock, datetime.fromisoformat(observation['observed_at']))
+    
+    def check_all_items(self):
+        """Check every configured item."""
+        return self.check_items(self.config["items"])
+    
+    def check_items(self, items):
+        """Check a batch of items concurrently through a bounded worker pool.
+        
+        Items sharing a URL are grouped so each page is fetched and parsed
+        once per sweep, however many items watch it.
+        """
+        max_workers = self.config.get("concurrency", {}).get("max_workers", 4)
+        pool = self.worker_pool(max_workers)
+        # Catalog listings due in this batch are scanned alongside the product pages
+        scans = [pool.submit(self.scan_listing, item) for item in items if item.get('listing')]
+        items = [item for item in items if not item.get('listing')]
+        pages = {}
+        for item in items:
+            pages.setdefault(item['url'], []).append(item)
+        
+        if items:
+            log.info(f"🔗 Checking {len(items)} item(s) on {len(pages)} page(s) with up to {max_workers} concurrent workers",
+                     extra={'event': 'sweep', 'items': len(items), 'pages': len(pages)})
+        futures = [(url, pool.submit(self.check_page, url, watchers)) for url, watchers in pages.items()]
+        
+        results = {}
+        for url, future in futures:
+            try:
+                results.update(future.result())
+            except Exception as e:
+                log.exception(f"Error checking {url}: {str(e)}", extra={'event': 'check_failed', 'url': url})
+                for item in pages[url]:
+                    results[item_key(item)] = (None, f"Error checking availability: {str(e)}")
+        for scan in scans:
+            try:
+                scan.result()
+            except Exception as e:
+                log.exception(f"Error scanning catalog: {str(e)}", extra={'event': 'catalog_failed'})
+        
+        # One write per sweep instead of one per item
+        with self.metrics.phase('state_write'):
+            self.save_previous_status()
+        return results
+    
+    def scan_listing(self, job):
+        """Read a listing page (with its pagination) or a sitemap, and bring forward checks it shows changed.
+        
+        Every product found is kept as a ListingEntry and written with the
+        sweep. A product whose stock badge, price or lastmod differs from the
+        previous scan, or that the catalog shows in a different stock state
+        than its last check, is checked right away.
+        """
+        http = self.http_client()
+        key = item_key(job)
+        queue, seen, entries, failed = [job['url']], set(), [], False
+        try:
+            while queue and len(seen) < self.catalog.config['max_pages']:
+                url = queue.pop(0)
+                if url in seen:
+                    continue
+                seen.add(url)
+                parser = self.catalog.parser(job, url)
+                with self.politeness.request(url) as host:
+                    with http.get(url) as response:
+                        host.record_response(response)
+                        response.raise_for_status()
+                        for chunk in response.iter_chunks(self.catalog.config['chunk_size']):
+                            entries.extend(parser.feed(chunk))
+                entries.extend(parser.close())
+                queue.extend(parser.follow)
+        except HostUnavailable as e:
+            self.retry_at[key] = self.retry_delay(key, e.retry_in)
+            log.warning(f"⚠️ Catalog scan of {job['url']} postponed: {e}")
+            return
+        except http.network_errors as e:
+            self.retry_at[key] = self.retry_delay(key, self.politeness.policy(job['url']).retry_in())
+            failed = True
+            log.warning(f"⚠️ Catalog scan of {job['url']} failed after {len(seen)} page(s): {e}",
+                        extra={'event': 'catalog_failed', 'url': job['url']})
+            # Entries from the pages that were read are still current
+        if not failed:
+            self.failures.pop(key, None)
+        if not failed and any(url not in seen for url in queue):
+            log.warning(f"⚠️ Catalog scan of {job['url']} stopped at catalog.max_pages "
+                        f"({self.catalog.config['max_pages']}); products on later pages keep their own cadence")
+        
+        escalated = self.record_listing(entries, job['listing'])
+        fields = {'event': 'catalog_scan', 'url': job['url'], 'pages': len(seen), 'products': len(entries)}
+        message = f"📚 {job['name']} {job['url']}: {len(entries)} product(s) on {len(seen)} page(s)"
+        if escalated is not None:
+            message += f", {len(escalated)} check(s) brought forward"
+            fields['escalated'] = escalated
+        log.info(message, extra=fields)
+    
+    def record_listing(self, entries, kind):
+        """Apply a scan's entries and bring forward the checks they call for; returns those item keys."""
+        escalated = [item_key(item) for item in self.apply_listing(entries, kind)]
+        for key in escalated:
+            self.scheduler.run_now(key)
+        return escalated
+    
+    def merge_listings(self, entries):
+        """Take listing entries another process recorded, for covered_by_catalog only."""
+        with self.status_lock:
+            for entry in entries:
+                self.listing_entries[entry.url] = entry
+                if entry.product_id is not None:
+                    self.listing_ids[entry.product_id] = entry.url
+    
+    def apply_listing(self, entries, kind):
+        """Record listing entries in bulk; return the items whose entry shows a change."""
+        seen_at = datetime.now().isoformat()
+        escalated = []
+        with self.status_lock:
+            for entry in entries:
+                entry.seen_at = seen_at
+                previous = self.listing_entries.get(entry.url)
+                # Listings and sitemaps show different fields of the same product
+                entry = merge_entry(previous, entry, kind)
+                self.listing_entries[entry.url] = entry
+                self.dirty_listings.add(entry.url)
+                if entry.product_id is not None:
+                    self.listing_ids[entry.product_id] = entry.url
+                for item in self.catalog.items_for(entry):
+                    if self.listing_changed(item, previous, entry):
+                        escalated.append(item)
+        return list({item_key(item): item for item in escalated}.values())
+    
+    def listing_changed(self, item, previous, entry):
+        """True when a listing entry calls for a check of the item (status_lock held)."""
+        if previous is not None:
+            return not entry.same_listing(previous)
+        status = self.previous_status.get(item_key(item))
+        if status is None or status['in_stock'] is None:
+            return True
+        if entry.in_stock is None or item.get('variant_ids') or item.get('max_price') is not None:
+            # The listing can't say which variants are in stock or judge the price ceiling
+            return False
+        return status['in_stock'] != entry.in_stock
+    
+    def covered_by_catalog(self, item):
+        """True when a recent catalog scan has seen the item's product.
+        
+        Items watching particular variants keep their own cadence, since a
+        listing only shows the product as a whole.
+        """
+        if item.get('listing') or item.get('variant_ids'):
+            return False
+        now = datetime.now()
+        with self.status_lock:
+            entry = self.listing_entries.get(normalize_url(item['url']))
+            if entry is None and item.get('product_id') is not None:
+                entry = self.listing_entries.get(self.listing_ids.get(str(item['product_id'])))
+        return self.catalog.fresh(entry, now)
+    
+    def worker_pool(self, max_workers):
+        """The long-lived check pool, replaced when concurrency.max_workers changes."""
+        max_workers = max(1, max_workers)
+        if self.pool is None or self.pool_size != max_workers:
+            if self.pool is not None:
+                self.pool.shutdown(wait=False)
+            self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="check")
+            self.pool_size = max_workers
+            # Connections per host follow the number of workers that may fetch at once
+            self.close_http_client()
+        return self.pool
+    
+    def http_client(self):
+        """The long-lived HTTP client, created on the first fetch."""
+        with self.http_lock:
+            if self.http is None:
+                max_workers = self.config.get("concurrency", {}).get("max_workers", 4)
+                self.http = HttpClient(self.config.get('fetch'), max_workers, on_drain=self.metrics.add_bytes)
+            return self.http
+    
+    def close_http_client(self):
+        with self.http_lock:
+            http, self.http = self.http, None
+        if http is not None:
+            http.close()
+    
+    def shed_load(self, due):
+        """Cut a batch down while memory is over budget; the rest is deferred.
+        
+        Items currently out of stock are kept first, since a restock is what
+        the monitor is waiting for.
+        """
+        if not self.memory.over_budget():
+            return due
+        limit = self.memory.config['shed_batch'] or self.config.get('concurrency', {}).get('max_workers', 4)
+        with self.status_lock:
+            due = sorted(due, key=lambda item: self.previous_status.get(item_key(item), {}).get('in_stock') is not False)
+        for item in due[limit:]:
+            self.scheduler.reschedule_in(item_key(item), self.memory.config['defer_seconds'])
+        if len(due) > limit:
+            log.warning(f"⚠️ Over the memory budget: checking {limit} item(s), deferring {len(due) - limit}",
+                        extra={'event': 'memory_shed', 'checked': limit, 'deferred': len(due) - limit})
+        return due[:limit]
+    
     def send_notification(self, item, subject, message):
-        """Send email notification."""
+        """Queue an email notification; the dispatcher sends it in the background."""
+        if self.notifier is None:
+            # The SMTP and email stack is only loaded once there is something to send
+            from notifier import NotificationDispatcher
+            self.notifier = NotificationDispatcher(self.config['email'])
+        self.notifier.notify(item, subject, message)
+    
+    def open_event_hub(self):
+        """Create the transition event hub (outbox and, once started, the SSE stream)."""
+        if self.config:
+            self.events = EventHub(self.config.get('events'))
+    
+    def publish_transition(self, item, previous_status, in_stock, message, detection):
+        """Publish a status change to event subscribers and the outbox, ahead of any email."""
+        record = detection.record
+        self.publish_event({
+            'type': 'transition',
+            'item': item['name'],
+            'key': item_key(item),
+            'url': item['url'],
+            'previous': {'in_stock': previous_status['in_stock'], 'message': previous_status['message']},
+            'current': {'in_stock': in_stock, 'message': message},
+            'variants': record.available_variant_values if record is not None else None,
+            'price': record.price if record is not None else None,
+            'snapshot': detection.snapshot_id,
+            'latency_ms': round(detection.latency * 1000, 1),
+            'detected_at': datetime.now().isoformat(),
+        })
+    
+    def publish_variant_changes(self, item, changes, detection):
+        """Publish the variants whose stock or price changed on this check."""
+        self.publish_event({
+            'type': 'variants',
+            'item': item['name'],
+            'key': item_key(item),
+            'url': item['url'],
+            'changes': [{'variant_id': variant.variant_id, 'name': variant.name,
+                         'previous': None if before is None else {'in_stock': before.in_stock, 'price': before.price},
+                         'current': {'in_stock': variant.in_stock, 'price': variant.price}}
+                        for before, variant in changes],
+            'snapshot': detection.snapshot_id,
+            'detected_at': datetime.now().isoformat(),
+        })
+    
+    def publish_event(self, event):
+        if self.events is not None:
+            self.events.publish(event)
+    
+    def start_event_stream(self):
+        """Serve /events over SSE locally if events.port is configured."""
+        port = self.config.get('events', {}).get('port')
+        if port and self.events is not None:
+            host = self.config['events'].get('host', "127.0.0.1")
+            self.events.serve(int(port), host)
+            log.info(f"📡 Transition events at http://{host}:{port}/events")
+    
+    def start_metrics_server(self):
+        """Serve /metrics locally if metrics.port is configured."""
+        port = self.config.get('metrics', {}).get('port')
+        if port:
+            self.metrics.serve(int(port), self.config['metrics'].get('host', "127.0.0.1"))
+            log.info(f"📈 Metrics at http://{self.config['metrics'].get('host', '127.0.0.1')}:{port}/metrics")
+    
+    def start_control_server(self):
+        """Listen for management commands on the control socket unless it is disabled."""
+        path = self.config.get('control', {}).get('socket', "monitor.sock")
+        if not path:
+            return
+        from control import ControlServer
         try:
-            email_config = self.config['email']
-            
-            msg = MIMEMultipart()
-            msg['From'] = email_config['sender_email']
-            msg['To'] = email_config['recipient_email']
-            msg['Subject'] = f"🔗 ASP Handcuffs Alert: {subject}"
-            
-            body = f"""
-            🎉 ASP HANDCUFFS COLOR VARIANTS ALERT! 🎉
-            
-            Item: {item['name']}
-            URL: {item['url']}
-            Status: {message}
-            Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-            
-            ASP Identifier Ultra Plus Chain Handcuffs color variants are now available!
-            Price: $65.60
-            
-            🛒 Quick Link: {item['url']}
-            
-            Check the website to see which colors (Blue, Gray, Pink, Yellow) are in stock!
-            """
-            
-            msg.attach(MIMEText(body, 'plain'))
-            
-            server = smtplib.SMTP(email_config['smtp_server'], email_config['smtp_port'])
-            server.starttls()
-            server.login(email_config['sender_email'], email_config['sender_password'])
-            text = msg.as_string()
-            server.sendmail(email_config['sender_email'], email_config['recipient_email'], text)
-            server.quit()
-            
-            print(f"📧 Notification sent for {item['name']}")
-            
-        except Exception as e:
-            print(f"Error sending notification: {str(e)}")
+            self.control = ControlServer(path, self.control_handlers())
+        except (OSError, RuntimeError) as e:
+            log.error(f"❌ Control socket unavailable: {e}")
+            return
+        self.control.start()
+    
+    def control_handlers(self):
+        return {
+            'status': self.control_status,
+            'check-now': self.control_check_now,
+            'reload': self.control_reload,
+            'stop': self.control_stop,
+            'profile': self.control_profile,
+        }
+    
+    def control_status(self):
+        """Last verdict, next due time and latency for every configured item."""
+        items = []
+        with self.status_lock:
+            for item in self.config['items']:
+                key = item_key(item)
+                status = self.previous_status.get(key, {})
+                observed = self.last_observed.get(key, {})
+                items.append({
+                    'name': item['name'],
+                    'key': key,
+                    'in_stock': status.get('in_stock'),
+                    'message': observed.get('message', status.get('message')),
+                    'last_checked': status.get('last_checked'),
+                    'latency_ms': observed.get('latency_ms'),
+                    'next_due_seconds': self.scheduler.next_due(key),
+                })
+        return {'pid': os.getpid(), 'rss': current_rss(), 'items': items}
+    
+    def matching_keys(self, name):
+        """Keys of the items with this name (or key)."""
+        return [item_key(item) for item in self.config['items'] if name in (item['name'], item_key(item))]
+    
+    def control_check_now(self, name):
+        keys = [key for key in self.matching_keys(name) if self.scheduler.run_now(key)]
+        if not keys:
+            return {'ok': False, 'error': f"No monitored item named {name!r}"}
+        return {'items': keys}
+    
+    def control_reload(self):
+        changes = self.reload_config()
+        if changes is None:
+            return {'ok': False, 'error': "Config reload failed, keeping the current configuration"}
+        return changes
+    
+    def control_stop(self):
+        # The run loop ends and main() shuts down, flushing state and notifications
+        self.scheduler.stop()
+        return {}
+    
+    def control_profile(self, action="dump"):
+        """Switch allocation profiling on or off, or dump what it has seen so far."""
+        if action == 'on':
+            self.profiler.start()
+            return {'profiling': True}
+        if action == 'off':
+            return {'profiling': False, 'profile': self.profiler.stop()}
+        if action == 'dump':
+            return {'profiling': self.profiler.active, 'profile': self.profiler.dump()}
+        return {'ok': False, 'error': f"Unknown profile action {action!r}; expected on, off or dump"}
+    
+    def shutdown(self):
+        """Stop scheduling, flush queued notifications, write metrics, close the state store, then the control socket."""
+        self.scheduler.stop()
+        if self.pool is not None:
+            self.pool.shutdown()
+        self.close_http_client()
+        if self.events is not None:
+            self.events.close()
+        if self.notifier is not None:
+            self.notifier.stop()
+        summary_file = ((self.config or {}).get('metrics', {})).get('summary_file', "metrics_summary.json")
+        if summary_file:
+            self.metrics.write_summary(summary_file)
+        self.metrics.close()
+        self.store.close()
+        # Last: stop scripts take the socket going away to mean state and emails are flushed
+        if self.control is not None:
+            self.control.close()
+    
+    def item_interval(self, item):
+        """Polling interval for an item in seconds (per-item override or global default)."""
+        return configured_interval(item, self.config['schedule'])
+    
+    def retry_delay(self, key, host_wait):
+        """Seconds until a failed check of key is retried.
+        
+        A paused or backed-off host is retried as soon as it accepts requests
+        again. Any other failure (a 404, a page that no longer parses) backs
+        off from MIN_RETRY_SECONDS, doubling with each failure in a row; the
+        run loop caps the delay at the item's interval.
+        """
+        if host_wait > 0:
+            return host_wait
+        failures = self.failures[key] = self.failures.get(key, 0) + 1
+        return MIN_RETRY_SECONDS * 2 ** min(failures - 1, 20)
+    
+    def next_interval(self, item, scale):
+        """Seconds until an item's next poll: the restock model's spacing, or the configured interval.
+        
+        Products a recent catalog scan has seen wait at least
+        catalog.covered_interval_seconds, since a change on the listing
+        brings their check forward anyway.
+        """
+        if self.restock_model is None or not item.get('adaptive', True):
+            interval = self.item_interval(item)
+        else:
+            interval = self.restock_model.next_interval(item_key(item), self.item_interval(item), datetime.now(), scale)
+        if self.catalog is not None and self.covered_by_catalog(item):
+            interval = max(interval, self.catalog.config['covered_interval_seconds'])
+        return interval
+    
+    def budget_scale(self):
+        """Rate factor that keeps adaptive polling of all items within the request budget.
+        
+        The total is measured with each item's current weight, so sold-out
+        items in their likely windows don't push it over. Weights move
+        slowly, so the factor is recomputed at most once a minute.
+        """
+        now = time.monotonic()
+        if self.scale_cache is not None and self.scale_cache[0] > now:
+            return self.scale_cache[1]
+        moment = datetime.now()
+        weighted, fixed = [], 0.0
+        for item in self.config['items']:
+            interval = self.item_interval(item)
+            if item.get('adaptive', True):
+                weighted.append((self.restock_model.weight(item_key(item), moment), interval))
+            else:
+                fixed += 3600 / interval
+        scale = budget_scale(self.restock_model.config, weighted, fixed)
+        self.scale_cache = (now + 60, scale)
+        return scale
+    
+    def item_jitter(self, item):
+        """Random spread in seconds applied to each of an item's polls."""
+        return float(item.get('jitter_seconds', self.config['schedule'].get('jitter_seconds', 0)))
+    
+    def schedule_items(self, items):
+        """Add new items to the scheduler (due immediately) and drop removed ones.
+        
+        Items already scheduled keep their pending due time unless their
+        interval got shorter (see Scheduler.add). Returns the keys
+        that were added, removed and updated, and how many were unchanged.
+        """
+        changes = {'added': [], 'removed': [], 'updated': [], 'unchanged': 0}
+        wanted = {item_key(item): item for item in items}
+        if self.catalog is not None:
+            # Listing pages and sitemaps are polled through the same scheduler
+            wanted.update((item_key(job), job) for job in self.catalog_jobs(items))
+        for key in list(self.scheduler.jobs):
+            if key not in wanted:
+                self.scheduler.remove(key)
+                changes['removed'].append(key)
+                log.info(f"➖ Stopped monitoring {key}")
+        for key, item in wanted.items():
+            job = self.scheduler.jobs.get(key)
+            if job is None:
+                changes['added'].append(key)
+                log.info(f"➕ Monitoring {item['name']} every {self.item_interval(item):g}s")
+            elif job['item'] != item:
+                changes['updated'].append(key)
+            else:
+                changes['unchanged'] += 1
+            self.scheduler.add(key, item, self.item_interval(item), self.item_jitter(item))
+        return changes
+    
+    def catalog_jobs(self, items):
+        """Index items for the catalog and return its listing and sitemap jobs."""
+        self.catalog.index(items)
+        return self.catalog.jobs(items)
+    
+    def apply_config(self, config):
+        """Switch to a new config and rebuild what was built from the old one.
+        
+        The catalog is rebuilt, and so are the politeness limits and HTTP
+        client when their sections changed. Settings read on each check
+        (schedule, fetch options, selectors) follow at once. memory,
+        adaptive, snapshots, state and email need a restart.
+        """
+        previous, self.config = self.config or {}, config
+        self.scale_cache = None
+        catalog_config = config.get('catalog', {})
+        self.catalog = Catalog(catalog_config) if catalog_config.get('enabled') else None
+        if config.get('politeness') != previous.get('politeness'):
+            # Hosts start over with fresh token buckets and closed circuits
+            self.politeness = Politeness(config.get('politeness'), self.politeness_share)
+        if config.get('fetch') != previous.get('fetch'):
+            # The next check creates a client with the new pool, DNS and drain settings
+            self.close_http_client()
+    
+    def reload_config(self):
+        """Re-read the config file and apply item changes without a restart.
+        
+        Returns the schedule changes, or None if the file couldn't be loaded.
+        """
+        config = self.load_config()
+        if not config:
+            log.error("❌ Config reload failed, keeping the current configuration")
+            return None
+        self.apply_config(config)
+        changes = self.schedule_items(config['items'])
+        self.scheduler.wake()
+        log.info(f"🔄 Configuration reloaded: {len(changes['added'])} added, {len(changes['removed'])} removed, "
+                 f"{len(changes['updated'])} updated", extra={'event': 'reload', **changes})
+        return changes
     
     def run_scheduler(self):
         """Run the scheduler to check items periodically."""
         if not self.config:
-            print("❌ Configuration not found. Please run setup_handcuffs.py first.")
-            sys.stdout.flush()
+            log.error("❌ Configuration not found. Please run setup_handcuffs.py first.")
             return
             
-        print("🔗 Starting Simple ASP Handcuffs Monitor...")
-        print(f"⏰ Checking every {self.config['schedule']['interval_hours']} hours")
-        print("Press Ctrl+C to stop")
-        sys.stdout.flush()
+        log.info("🔗 Starting Simple ASP Handcuffs Monitor...")
+        log.info(f"⏰ Default interval: {self.config['schedule']['interval_hours']} hours")
+        log.info("Press Ctrl+C to stop, send SIGHUP to reload config.json")
         
-        # Schedule the job
-        schedule.every(self.config['schedule']['interval_hours']).hours.do(self.check_item_stock)
+        self.start_metrics_server()
+        self.start_event_stream()
+        self.start_control_server()
         
-        # Run initial check
-        self.check_item_stock()
-        sys.stdout.flush()
+        # Every item is due immediately, then on its own cadence
+        self.schedule_items(self.config['items'])
+        if hasattr(signal, 'SIGHUP'):
+            # Reloading reads files and takes locks, so the run loop does it rather than the handler
+            signal.signal(signal.SIGHUP, lambda signum, frame: self.request_reload())
+        # pkill/launchctl send SIGTERM; end the loop so shutdown can flush
+        signal.signal(signal.SIGTERM, lambda signum, frame: self.scheduler.stop())
         
-        # Keep the script running
-        while True:
-            schedule.run_pending()
-            time.sleep(60)  # Check every minute
+        self.run_loop()
+    
+    def request_reload(self):
+        """Have the run loop reload the config (safe to call from a signal handler)."""
+        self.reload_requested = True
+        self.scheduler.wake()
+    
+    def run_loop(self):
+        """Check items as they fall due until the scheduler is stopped."""
+        try:
+            while True:
+                due = self.scheduler.wait_for_due()
+                if due is None:
+                    break
+                if self.reload_requested:
+                    self.reload_requested = False
+                    self.reload_config()
+                if not due:
+                    continue
+                due = self.shed_load(due)
+                self.check_items(due)
+                scale = self.budget_scale() if self.restock_model is not None else 1.0
+                for item in due:
+                    key = item_key(item)
+                    retry_in = self.retry_at.pop(key, None)
+                    if retry_in is not None:
+                        self.scheduler.reschedule_in(key, min(self.item_interval(item), retry_in))
+                    else:
+                        self.scheduler.reschedule(key, self.next_interval(item, scale))
+        finally:
+            self.scheduler.stop()
+
+def run_once(monitor):
+    """Run a single sweep and return the exit status.
+    
+    0 when at least one item is in stock, 1 when every item is out of stock,
+    2 when nothing is in stock but some checks failed (or there is no config).
+    """
+    if not monitor.config:
+        return 2
+    results = monitor.check_all_items()
+    verdicts = [in_stock for in_stock, _ in results.values()]
+    if any(verdicts):
+        return 0
+    if any(in_stock is None for in_stock in verdicts):
+        return 2
+    return 1
 
 def main():
     """Main function to run the simple handcuffs monitor."""
-    monitor = SimpleHandcuffsMonitor()
+    parser = argparse.ArgumentParser(description="Monitor product pages for stock changes")
+    parser.add_argument('--config', default="config.json", help="path to config.json")
+    parser.add_argument('--once', action='store_true',
+                        help="run a single sweep and exit: 0 = something in stock, 1 = nothing in stock, 2 = errors")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="run N worker processes, each owning a shard of the items")
+    args = parser.parse_args()
     
+    # Load environment variables
+    from dotenv import load_dotenv
+    load_dotenv()
+    
+    pipeline = setup_logging(logging_config(args.config))
     try:
-        monitor.run_scheduler()
-    except KeyboardInterrupt:
-        print("\n🔗 Simple ASP Handcuffs Monitor stopped by user")
-    except Exception as e:
-        print(f"Error running monitor: {str(e)}")
+        monitor = SimpleHandcuffsMonitor(args.config, one_shot=args.once)
+        if args.once:
+            try:
+                status = run_once(monitor)
+            finally:
+                monitor.shutdown()
+            sys.exit(status)
+        
+        workers = args.workers
+        if workers is None and monitor.config:
+            workers = monitor.config.get('concurrency', {}).get('processes', 1)
+        if workers and workers > 1:
+            from supervisor import Supervisor
+            Supervisor(monitor, workers, pipeline).run()
+            return
+        
+        try:
+            monitor.run_scheduler()
+        except KeyboardInterrupt:
+            log.info("🔗 Simple ASP Handcuffs Monitor stopped by user")
+        except Exception as e:
+            log.exception(f"Error running monitor: {str(e)}")
+        finally:
+            monitor.shutdown()
+    finally:
+        # Flush the queue before the process exits
+        pipeline.stop()
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Content-addressed snapshot archive for the handcuffs monitor
+Stores the page bytes (or just the BCData JSON) behind each verdict,
+compressed with zstd when the zstandard package is installed and gzip
+otherwise. Objects are named by the SHA-256 of their content, so a page seen
+a thousand times is stored once. The replay command re-runs stock detection
+over archived snapshots and reports verdicts that no longer match
+
+Usage: python snapshot_store.py replay [item_key] [--since ISO_DATE] [--limit N] [--config config.json]
+       python snapshot_store.py show <snapshot_id>
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import sys
+import tempfile
+
+KINDS = ('bcdata', 'html')
+SUFFIXES = {'zstd': '.zst', 'gzip': '.gz'}
+
+
+def zstd_module():
+    """The zstandard module, or None when it isn't installed."""
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return zstandard
+
+
+class SnapshotStore:
+    """Compressed, deduplicated snapshot objects under one directory.
+
+    A snapshot id is "<kind>/<sha256>", where kind is "bcdata" (the raw BCData
+    JSON) or "html" (the page bytes the monitor read).
+    """
+
+    def __init__(self, directory="snapshots", compression="auto", level=None):
+        self.directory = directory
+        if compression == 'auto':
+            compression = 'zstd' if zstd_module() is not None else 'gzip'
+        if compression == 'zstd' and zstd_module() is None:
+            raise RuntimeError("snapshot compression 'zstd' needs the zstandard package")
+        if compression not in SUFFIXES:
+            raise ValueError(f"unknown snapshot compression {compression!r}")
+        self.compression = compression
+        self.level = level
+
+    def path_for(self, snapshot_id, compression):
+        kind, digest = snapshot_id.split('/')
+        return os.path.join(self.directory, kind, digest[:2], digest + SUFFIXES[compression])
+
+    def find(self, snapshot_id):
+        """Path of a stored snapshot in whichever format it was written, or None."""
+        for compression in SUFFIXES:
+            path = self.path_for(snapshot_id, compression)
+            if os.path.exists(path):
+                return path
+        return None
+
+    def put(self, content, kind):
+        """Store content unless an identical snapshot exists; return its id."""
+        if kind not in KINDS:
+            raise ValueError(f"unknown snapshot kind {kind!r}")
+        snapshot_id = f"{kind}/{hashlib.sha256(content).hexdigest()}"
+        if self.find(snapshot_id) is not None:
+            return snapshot_id
+
+        if self.compression == 'zstd':
+            compressed = zstd_module().ZstdCompressor(level=self.level or 10).compress(content)
+        else:
+            compressed = gzip.compress(content, compresslevel=self.level or 6)
+        path = self.path_for(snapshot_id, self.compression)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write under a temporary name so readers never see a partial object
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(compressed)
+        os.replace(temp_path, path)
+        return snapshot_id
+
+    def get(self, snapshot_id):
+        """Decompressed content of a snapshot."""
+        path = self.find(snapshot_id)
+        if path is None:
+            raise KeyError(snapshot_id)
+        with open(path, 'rb') as f:
+            data = f.read()
+        if path.endswith(SUFFIXES['zstd']):
+            zstandard = zstd_module()
+            if zstandard is None:
+                raise RuntimeError(f"{path} is zstd-compressed; install zstandard to read it")
+            return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+        return gzip.decompress(data)
+
+    def page_for(self, snapshot_id):
+        """Page bytes that detection can run over; BCData snapshots are wrapped back into a script."""
+        from stock_parser import BCDATA_MARKER
+
+        content = self.get(snapshot_id)
+        if snapshot_id.startswith('bcdata/'):
+            return BCDATA_MARKER + content + b';'
+        return content
+
+
+def replay(snapshots, observations, items, selector_engine):
+    """Re-run detection for each archived observation.
+
+    Returns (mismatches, counts): mismatches lists (observation, (in_stock,
+    message)) for every observation whose replayed verdict differs from the
+    recorded one. Each snapshot is parsed once per distinct selector set.
+    """
+    from simple_handcuffs_monitor import evaluate_item
+    from stock_parser import detect_stock
+
+    detections = {}
+    mismatches = []
+    counts = {'replayed': 0, 'mismatched': 0, 'missing': 0}
+    for observation in observations:
+        snapshot_id = observation['snapshot']
+        # Items no longer in the config are replayed with the default selectors and no predicates
+        item = items.get(observation['item_key'], {})
+        selectors = selector_engine.for_item(item)
+        key = (snapshot_id, selectors)
+        if key not in detections:
+            try:
+                page = snapshots.page_for(snapshot_id)
+            except KeyError:
+                counts['missing'] += 1
+                continue
+            detections[key] = detect_stock(page, selector_sets=[selectors])
+        verdict = evaluate_item(item, detections[key], selector_engine)
+        counts['replayed'] += 1
+        if [verdict[0], verdict[1]] != [observation['in_stock'], observation['message']]:
+            counts['mismatched'] += 1
+            mismatches.append((observation, verdict))
+    return mismatches, counts
+
+
+def main():
+    args = sys.argv[1:]
+    options = {'--since': None, '--limit': None, '--config': "config.json"}
+    for option in options:
+        if option in args:
+            index = args.index(option)
+            options[option] = args[index + 1]
+            del args[index:index + 2]
+    if not args or args[0] not in ('replay', 'show') or (args[0] == 'show' and len(args) < 2):
+        for line in __doc__.strip().splitlines()[-2:]:
+            print(line)
+        return 1
+
+    config = {}
+    if os.path.exists(options['--config']):
+        with open(options['--config'], 'r') as f:
+            config = json.load(f)
+    snapshot_config = config.get('snapshots', {})
+    snapshots = SnapshotStore(snapshot_config.get('directory', "snapshots"))
+
+    if args[0] == 'show':
+        sys.stdout.buffer.write(snapshots.get(args[1]))
+        return 0
+
+    from simple_handcuffs_monitor import item_key
+    from state_store import StateStore
+    from stock_selectors import SelectorEngine
+
+    store = StateStore(config.get('state', {}).get('database', "monitor_state.db"))
+    observations = store.snapshot_observations(args[1] if len(args) > 1 else None, options['--since'],
+                                               int(options['--limit']) if options['--limit'] else None)
+    store.close()
+    items = {item_key(item): item for item in config.get('items', [])}
+
+    mismatches, counts = replay(snapshots, observations, items, SelectorEngine())
+    for observation, verdict in mismatches:
+        print(f"❌ {observation['item_key']} at {observation['observed_at']} ({observation['snapshot']})")
+        print(f"   recorded: {observation['in_stock']}, {observation['message']}")
+        print(f"   replayed: {verdict[0]}, {verdict[1]}")
+
+    print(f"🔁 Replayed {counts['replayed']} observation(s): {counts['mismatched']} changed verdict, "
+          f"{counts['missing']} snapshot(s) missing")
+    return 1 if counts['mismatched'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
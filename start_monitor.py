@@ -7,14 +7,18 @@ import os
 import subprocess
 import sys
 
+from control import ControlUnavailable, format_status, send_command
+from monitor_log import render, tail
+
 def run_background():
     """Run monitor in background using nohup."""
     print("🔄 Starting monitor in background...")
-    cmd = "nohup python simple_handcuffs_monitor.py > handcuffs_monitor.log 2>&1 &"
+    # The monitor writes and rotates handcuffs_monitor.log itself; only crashes land in the error log
+    cmd = "nohup python simple_handcuffs_monitor.py > /dev/null 2>> handcuffs_monitor_error.log &"
     subprocess.run(cmd, shell=True)
     print("✅ Monitor started in background!")
     print("📋 Log file: handcuffs_monitor.log")
-    print("🛑 To stop: pkill -f simple_handcuffs_monitor.py")
+    print("🛑 To stop: python control.py stop")
 
 def setup_launchagent():
     """Set up LaunchAgent for automatic startup."""
@@ -52,29 +56,26 @@ def show_status():
     """Show current monitor status."""
     print("📊 Checking monitor status...")
     
-    # Check if process is running
-    result = subprocess.run("pgrep -f simple_handcuffs_monitor.py", shell=True, capture_output=True)
-    if result.returncode == 0:
+    # Ask the running monitor over its control socket
+    try:
+        response = send_command('status')
         print("✅ Monitor is currently running")
-        pids = result.stdout.decode().strip().split('\n')
-        for pid in pids:
-            if pid:
-                print(f"   Process ID: {pid}")
-    else:
+        for line in format_status(response):
+            print(f"   {line}")
+    except ControlUnavailable:
         print("❌ Monitor is not currently running")
     
     # Check log file
     if os.path.exists("handcuffs_monitor.log"):
         print("📋 Log file exists: handcuffs_monitor.log")
-        # Show last few lines
+        # Show last few lines; tail() seeks from the end instead of reading the whole log
         try:
-            with open("handcuffs_monitor.log", "r") as f:
-                lines = f.readlines()
-                if lines:
-                    print("📝 Last log entries:")
-                    for line in lines[-5:]:
-                        print(f"   {line.strip()}")
-        except:
+            lines = tail("handcuffs_monitor.log", 5)
+            if lines:
+                print("📝 Last log entries:")
+                for line in lines:
+                    print(f"   {render(line)}")
+        except OSError:
             pass
     else:
         print("📋 No log file found")
@@ -102,8 +103,11 @@ def main():
             show_status()
         elif choice == "4":
             print("🛑 Stopping monitor...")
-            subprocess.run("pkill -f simple_handcuffs_monitor.py", shell=True)
-            print("✅ Monitor stopped")
+            try:
+                send_command('stop')
+                print("✅ Monitor is stopping (state and queued emails are flushed first)")
+            except ControlUnavailable:
+                print("ℹ️ No monitor process was running")
         elif choice == "5":
             print("👋 Goodbye!")
             break
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+SQLite state and history store for the handcuffs monitor
+Holds the current status per item and per variant, an append-only observation
+history (with the id of the archived page snapshot behind each verdict), the
+per-URL validator cache and the latest catalog listing entry per product,
+written once per sweep in a single transaction
+"""
+
+import json
+import os
+import sqlite3
+import sys
+import threading
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS current_status (
+    item_key TEXT PRIMARY KEY,
+    in_stock INTEGER,
+    message TEXT,
+    last_checked TEXT
+);
+CREATE TABLE IF NOT EXISTS observations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    item_key TEXT NOT NULL,
+    observed_at TEXT NOT NULL,
+    in_stock INTEGER,
+    message TEXT,
+    variants TEXT,
+    price REAL,
+    latency_ms REAL,
+    snapshot TEXT
+);
+CREATE INDEX IF NOT EXISTS observations_item_time ON observations (item_key, observed_at);
+CREATE TABLE IF NOT EXISTS variant_status (
+    item_key TEXT NOT NULL,
+    variant_id TEXT NOT NULL,
+    name TEXT,
+    in_stock INTEGER,
+    price REAL,
+    changed_at TEXT,
+    PRIMARY KEY (item_key, variant_id)
+);
+CREATE TABLE IF NOT EXISTS validators (
+    url TEXT PRIMARY KEY,
+    etag TEXT,
+    last_modified TEXT,
+    content_hash TEXT
+);
+CREATE TABLE IF NOT EXISTS listing_entries (
+    url TEXT PRIMARY KEY,
+    product_id TEXT,
+    name TEXT,
+    in_stock INTEGER,
+    price REAL,
+    lastmod TEXT,
+    seen_at TEXT
+);
+"""
+
+
+def to_db_bool(value):
+    return None if value is None else int(bool(value))
+
+
+def from_db_bool(value):
+    return None if value is None else bool(value)
+
+
+class StateStore:
+    """Current status, observation history and validators in one SQLite file."""
+
+    def __init__(self, path="monitor_state.db"):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(observations)")}
+        if 'snapshot' not in columns:
+            # Databases created before snapshots were archived
+            self.conn.execute("ALTER TABLE observations ADD COLUMN snapshot TEXT")
+        self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def load_status(self):
+        """Return {item_key: {'in_stock', 'message', 'last_checked'}}."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT item_key, in_stock, message, last_checked FROM current_status").fetchall()
+        return {key: {'in_stock': from_db_bool(in_stock), 'message': message, 'last_checked': last_checked}
+                for key, in_stock, message, last_checked in rows}
+
+    def load_variants(self):
+        """Return {item_key: {variant_id: VariantStock}}."""
+        from stock_parser import VariantStock
+
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT item_key, variant_id, name, in_stock, price, changed_at FROM variant_status").fetchall()
+        variants = {}
+        for key, variant_id, name, in_stock, price, changed_at in rows:
+            variants.setdefault(key, {})[variant_id] = VariantStock(variant_id, name, from_db_bool(in_stock),
+                                                                    price, changed_at)
+        return variants
+
+    def load_listings(self):
+        """Return {product url: ListingEntry} from the latest catalog scans."""
+        from catalog import ListingEntry
+
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT url, product_id, name, in_stock, price, lastmod, seen_at FROM listing_entries").fetchall()
+        return {url: ListingEntry(url, product_id, name, from_db_bool(in_stock), price, lastmod, seen_at)
+                for url, product_id, name, in_stock, price, lastmod, seen_at in rows}
+
+    def load_validators(self):
+        """Return {url: {'etag', 'last_modified', 'content_hash'}} without empty fields."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT url, etag, last_modified, content_hash FROM validators").fetchall()
+        validators = {}
+        for url, etag, last_modified, content_hash in rows:
+            fields = {'etag': etag, 'last_modified': last_modified, 'content_hash': content_hash}
+            validators[url] = {k: v for k, v in fields.items() if v}
+        return validators
+
+    def write_sweep(self, statuses, observations, validators, removed_validators=(), variants=(), listings=()):
+        """Write everything one sweep produced in a single transaction.
+
+        statuses maps item_key to its full status dict, observations is a list
+        of dicts with item_key/observed_at/in_stock/message/variants/price/
+        latency_ms/snapshot, validators maps url to its validator dict,
+        variants lists (item_key, VariantStock) for the variants that changed
+        and listings the ListingEntry of every product a catalog scan saw.
+        """
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT INTO current_status (item_key, in_stock, message, last_checked) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(item_key) DO UPDATE SET in_stock=excluded.in_stock, "
+                "message=excluded.message, last_checked=excluded.last_checked",
+                [(key, to_db_bool(status.get('in_stock')), status.get('message'), status.get('last_checked'))
+                 for key, status in statuses.items()])
+            self.conn.executemany(
+                "INSERT INTO observations (item_key, observed_at, in_stock, message, variants, price, latency_ms, "
+                "snapshot) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(obs['item_key'], obs['observed_at'], to_db_bool(obs.get('in_stock')), obs.get('message'),
+                  json.dumps(obs['variants']) if obs.get('variants') is not None else None,
+                  obs.get('price'), obs.get('latency_ms'), obs.get('snapshot'))
+                 for obs in observations])
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO validators (url, etag, last_modified, content_hash) VALUES (?, ?, ?, ?)",
+                [(url, v.get('etag'), v.get('last_modified'), v.get('content_hash'))
+                 for url, v in validators.items()])
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO variant_status (item_key, variant_id, name, in_stock, price, changed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(key, v.variant_id, v.name, to_db_bool(v.in_stock), v.price, v.changed_at) for key, v in variants])
+            self.conn.executemany("DELETE FROM validators WHERE url = ?",
+                                  [(url,) for url in removed_validators])
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO listing_entries (url, product_id, name, in_stock, price, lastmod, seen_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(e.url, e.product_id, e.name, to_db_bool(e.in_stock), e.price, e.lastmod, e.seen_at)
+                 for e in listings])
+
+    def history(self, item_key, limit=50):
+        """Most recent observations for an item, newest first."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT observed_at, in_stock, message, variants, price, latency_ms, snapshot FROM observations "
+                "WHERE item_key = ? ORDER BY id DESC LIMIT ?", (item_key, limit)).fetchall()
+        return [{'observed_at': observed_at, 'in_stock': from_db_bool(in_stock), 'message': message,
+                 'variants': json.loads(variants) if variants else None, 'price': price,
+                 'latency_ms': latency_ms, 'snapshot': snapshot}
+                for observed_at, in_stock, message, variants, price, latency_ms, snapshot in rows]
+
+    def verdict_transitions(self):
+        """(item_key, observed_at, in_stock) for each item's first verdict and every change, oldest first.
+
+        Errors are skipped, so a failed check between two identical verdicts
+        isn't a change.
+        """
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT item_key, observed_at, in_stock FROM ("
+                "  SELECT id, item_key, observed_at, in_stock,"
+                "         LAG(in_stock) OVER (PARTITION BY item_key ORDER BY id) AS previous"
+                "  FROM observations WHERE in_stock IS NOT NULL"
+                ") WHERE previous IS NULL OR previous != in_stock ORDER BY id").fetchall()
+        return [(key, observed_at, from_db_bool(in_stock)) for key, observed_at, in_stock in rows]
+
+    def snapshot_observations(self, item_key=None, since=None, limit=None):
+        """Observations that have an archived snapshot, oldest first, for replay."""
+        query = "SELECT item_key, observed_at, in_stock, message, snapshot FROM observations WHERE snapshot IS NOT NULL"
+        params = []
+        if item_key is not None:
+            query += " AND item_key = ?"
+            params.append(item_key)
+        if since is not None:
+            query += " AND observed_at >= ?"
+            params.append(since)
+        query += " ORDER BY id"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        with self.lock:
+            rows = self.conn.execute(query, params).fetchall()
+        return [{'item_key': key, 'observed_at': observed_at, 'in_stock': from_db_bool(in_stock),
+                 'message': message, 'snapshot': snapshot}
+                for key, observed_at, in_stock, message, snapshot in rows]
+
+    def is_empty(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM current_status").fetchone()[0] == 0
+
+    def import_json(self, status_file="previous_status.json"):
+        """One-time import of the old JSON status file. Returns the number of items imported."""
+        statuses = {}
+        if os.path.exists(status_file):
+            with open(status_file, 'r') as f:
+                statuses = json.load(f)
+        observations = [{'item_key': key, 'observed_at': status['last_checked'],
+                         'in_stock': status.get('in_stock'), 'message': status.get('message')}
+                        for key, status in statuses.items() if status.get('last_checked')]
+        self.write_sweep(statuses, observations, {})
+        return len(statuses)
+
+
+def main():
+    """Command line access to the state store: import or history."""
+    if len(sys.argv) < 2 or sys.argv[1] not in ('import', 'history'):
+        print("Usage: python state_store.py import [previous_status.json]")
+        print("       python state_store.py history <item_key> [limit]")
+        return 1
+
+    store = StateStore()
+    if sys.argv[1] == 'import':
+        status_file = sys.argv[2] if len(sys.argv) > 2 else "previous_status.json"
+        count = store.import_json(status_file)
+        print(f"✅ Imported {count} item(s) from {status_file}")
+    else:
+        limit = int(sys.argv[3]) if len(sys.argv) > 3 else 50
+        for obs in store.history(sys.argv[2], limit):
+            print(json.dumps(obs))
+    store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,401 @@
+#!/usr/bin/env python3
+"""
+Stock detection for BigCommerce product pages
+Reads the BCData JavaScript object straight from the raw page bytes and only
+falls back to an lxml parse with the item's compiled selectors when BCData is
+missing. The original BeautifulSoup path is kept for benchmarking
+"""
+
+import hashlib
+import json
+import re
+
+BCDATA_MARKER = b'var BCData = '
+BCDATA_END = b'};'
+UNAVAILABLE_MESSAGE = "The selected product combination is currently unavailable."
+
+
+class StockRecord:
+    """Stock fields pulled from BCData product_attributes."""
+
+    __slots__ = ('instock', 'available_variant_values', 'available_modifier_values', 'in_stock_attributes',
+                 'purchasing_message', 'price')
+
+    def __init__(self, instock=None, available_variant_values=(), available_modifier_values=(),
+                 purchasing_message=None, price=None, in_stock_attributes=()):
+        self.instock = instock
+        self.available_variant_values = [str(v) for v in available_variant_values]
+        self.available_modifier_values = [str(v) for v in available_modifier_values]
+        self.in_stock_attributes = [str(v) for v in in_stock_attributes]
+        self.purchasing_message = purchasing_message
+        self.price = price
+
+    @classmethod
+    def from_bcdata(cls, bcdata):
+        """Build a record from a decoded BCData object."""
+        attributes = bcdata.get('product_attributes') or {}
+        return cls(
+            instock=attributes.get('instock'),
+            available_variant_values=attributes.get('available_variant_values') or (),
+            available_modifier_values=attributes.get('available_modifier_values') or (),
+            purchasing_message=attributes.get('purchasing_message'),
+            price=extract_price(attributes.get('price')),
+            in_stock_attributes=attributes.get('in_stock_attributes') or (),
+        )
+
+    def verdict(self):
+        """Return (in_stock, message), or None when BCData alone can't decide."""
+        if self.available_variant_values:
+            return True, f"Color variants are available: {self.available_variant_values}"
+        if self.instock is True:
+            return True, "Product is in stock"
+        if self.instock is False:
+            return False, "Product is not in stock"
+        if self.purchasing_message == UNAVAILABLE_MESSAGE:
+            return False, "Selected product combination is currently unavailable"
+        return None
+
+    def __repr__(self):
+        return (f"StockRecord(instock={self.instock!r}, "
+                f"available_variant_values={self.available_variant_values!r}, "
+                f"available_modifier_values={self.available_modifier_values!r}, "
+                f"purchasing_message={self.purchasing_message!r}, price={self.price!r})")
+
+
+class VariantStock:
+    """Stock of one variant or option value of a product."""
+
+    __slots__ = ('variant_id', 'name', 'in_stock', 'price', 'changed_at')
+
+    def __init__(self, variant_id, name=None, in_stock=False, price=None, changed_at=None):
+        self.variant_id = variant_id
+        self.name = name or variant_id
+        self.in_stock = in_stock
+        self.price = price
+        self.changed_at = changed_at
+
+    def same_stock(self, other):
+        """True when other (or None) reports the same stock and price."""
+        return other is not None and (self.in_stock, self.price) == (other.in_stock, other.price)
+
+    def __repr__(self):
+        return (f"VariantStock(variant_id={self.variant_id!r}, name={self.name!r}, "
+                f"in_stock={self.in_stock!r}, price={self.price!r})")
+
+
+def variant_stock(record, names=None, known=(), changed_at=None):
+    """Per-variant stock from a StockRecord as {variant_id: VariantStock}.
+
+    A variant is in stock when BCData lists it in available_variant_values
+    or in_stock_attributes. Variants in `known` (watched, or seen on earlier
+    sweeps) that the page no longer lists are out of stock. BCData carries
+    one price for the product, so it is given to every variant in stock.
+    """
+    names = names or {}
+    offered = set(record.available_variant_values) | set(record.in_stock_attributes)
+    variant_ids = dict.fromkeys([*known, *record.available_variant_values, *record.in_stock_attributes])
+    return {variant_id: VariantStock(variant_id, names.get(variant_id), variant_id in offered,
+                                     record.price if variant_id in offered else None, changed_at)
+            for variant_id in variant_ids}
+
+
+def diff_variants(previous, current):
+    """(previous VariantStock or None, current) for every variant whose stock or price changed."""
+    return [(previous.get(variant_id), variant) for variant_id, variant in current.items()
+            if not variant.same_stock(previous.get(variant_id))]
+
+
+def extract_price(price):
+    """Pull a numeric price out of a BCData price block."""
+    if not isinstance(price, dict):
+        return None
+    for key in ('without_tax', 'with_tax'):
+        value = price.get(key)
+        if isinstance(value, dict) and value.get('value') is not None:
+            return value['value']
+    return None
+
+
+def find_bcdata(content, start=0):
+    """Locate the BCData object in raw page bytes.
+
+    Returns (decoded_object, raw_json_bytes), or (None, None) when the page has
+    no BCData or it can't be decoded.
+    """
+    marker = content.find(BCDATA_MARKER, start)
+    if marker == -1:
+        return None, None
+    json_start = marker + len(BCDATA_MARKER)
+
+    # '};' can legitimately appear inside a JSON string, so try each candidate end
+    end = content.find(BCDATA_END, json_start)
+    while end != -1:
+        raw = content[json_start:end + 1]
+        try:
+            return json.loads(raw), raw
+        except ValueError:
+            end = content.find(BCDATA_END, end + 1)
+    return None, None
+
+
+def extract_stock_record(content):
+    """Return a StockRecord parsed from raw page bytes, or None when BCData is missing."""
+    bcdata, _ = find_bcdata(content)
+    if bcdata is None:
+        return None
+    return StockRecord.from_bcdata(bcdata)
+
+
+class Detection:
+    """Outcome of running stock detection over one product page."""
+
+    __slots__ = ('in_stock', 'message', 'record', 'bytes_read', 'content_hash', 'unchanged', 'latency',
+                 'retry_in', 'verdicts', 'snapshot', 'snapshot_id')
+
+    def __init__(self, in_stock=None, message=None, record=None, bytes_read=0,
+                 content_hash=None, unchanged=False, snapshot=None):
+        self.in_stock = in_stock
+        self.message = message
+        self.record = record
+        self.bytes_read = bytes_read
+        self.content_hash = content_hash
+        self.unchanged = unchanged
+        self.latency = 0.0
+        self.retry_in = None
+        # Per-selector-set verdicts from the HTML fallback, keyed by CompiledSelectors
+        self.verdicts = {}
+        # (kind, bytes) to archive when a capture mode was requested, then the archived id
+        self.snapshot = snapshot
+        self.snapshot_id = None
+
+
+def hash_bcdata(raw):
+    """Content hash of a raw BCData JSON section."""
+    return hashlib.sha1(raw).hexdigest()
+
+
+class BCDataScanner:
+    """Incremental BCData finder fed one chunk of the response body at a time.
+
+    Only new bytes are searched on each feed, with enough overlap to catch a
+    marker or terminator split across a chunk boundary. When known_hash is
+    given and the BCData section hashes to it, the scanner stops without
+    decoding the JSON at all.
+    """
+
+    def __init__(self, known_hash=None):
+        self.buffer = bytearray()
+        self.bytes_seen = 0
+        self.json_start = -1
+        self.marker_search_from = 0
+        self.end_search_from = 0
+        self.known_hash = known_hash
+        self.content_hash = None
+        self.unchanged = False
+        self.bcdata = None
+        self.raw = None
+
+    def feed(self, chunk):
+        """Add a chunk; return True once BCData has been found (or matched known_hash)."""
+        if self.bcdata is not None or self.unchanged:
+            return True
+        self.buffer += chunk
+        self.bytes_seen += len(chunk)
+
+        if self.json_start == -1:
+            marker = self.buffer.find(BCDATA_MARKER, self.marker_search_from)
+            if marker == -1:
+                self.marker_search_from = max(0, len(self.buffer) - len(BCDATA_MARKER) + 1)
+                return False
+            self.json_start = marker + len(BCDATA_MARKER)
+            self.end_search_from = self.json_start
+
+        end = self.buffer.find(BCDATA_END, self.end_search_from)
+        while end != -1:
+            raw = bytes(self.buffer[self.json_start:end + 1])
+            if self.known_hash is not None and hash_bcdata(raw) == self.known_hash:
+                self.content_hash = self.known_hash
+                self.unchanged = True
+                return True
+            try:
+                self.bcdata = json.loads(raw)
+                self.raw = raw
+                self.content_hash = hash_bcdata(raw)
+                return True
+            except ValueError:
+                end = self.buffer.find(BCDATA_END, end + 1)
+        self.end_search_from = max(self.json_start, len(self.buffer) - len(BCDATA_END) + 1)
+        return False
+
+    def release(self):
+        """Drop the buffered page bytes once they are no longer needed."""
+        self.buffer = bytearray()
+
+
+def capture_snapshot(scanner, capture, fallback):
+    """The (kind, bytes) pair to archive for a page, or None when capture is off."""
+    if capture is None:
+        return None
+    if capture == 'bcdata' and scanner.raw is not None and not fallback:
+        return 'bcdata', scanner.raw
+    # Pages decided by the HTML fallback need their markup to be replayed
+    return 'html', bytes(scanner.buffer)
+
+
+def detect_stock_streaming(chunks, known_hash=None, selector_sets=(), capture=None):
+    """Run stock detection over an iterable of body chunks and return a Detection.
+
+    Stops pulling chunks as soon as BCData gives a verdict, so the caller can
+    close the connection without downloading the rest of the page. The whole
+    body is only kept when the HTML fallback ends up being needed; it is then
+    evaluated once for each of the given compiled selector sets. If the
+    BCData section hashes to known_hash the page is reported as unchanged and
+    nothing is decoded. The BCData hash is only returned when BCData gave the
+    verdict: a page decided by the HTML fallback can change outside BCData.
+
+    capture ('bcdata' or 'html') attaches a snapshot of the BCData JSON or of
+    the page bytes read to the Detection, for the snapshot archive.
+    """
+    scanner = BCDataScanner(known_hash)
+    record = None
+    for chunk in chunks:
+        if record is not None:
+            # BCData had no verdict; keep buffering for the HTML fallback
+            scanner.buffer += chunk
+            scanner.bytes_seen += len(chunk)
+            continue
+        if scanner.feed(chunk):
+            if scanner.unchanged:
+                scanner.release()
+                return Detection(bytes_read=scanner.bytes_seen, content_hash=scanner.content_hash,
+                                 unchanged=True)
+            record = StockRecord.from_bcdata(scanner.bcdata)
+            verdict = record.verdict()
+            if verdict is not None:
+                snapshot = capture_snapshot(scanner, capture, fallback=False)
+                scanner.release()
+                return Detection(verdict[0], verdict[1], record, scanner.bytes_seen,
+                                 scanner.content_hash, snapshot=snapshot)
+
+    from stock_selectors import parse_with_selectors
+
+    selector_sets = list(selector_sets)
+    # One copy of the page at a time: the scanner's buffer goes before the tree is built
+    content = bytes(scanner.buffer)
+    scanner.release()
+    verdicts = parse_with_selectors(content, selector_sets)
+    snapshot = ('html', content) if capture is not None else None
+    detection = Detection(verdicts[0][0], verdicts[0][1], record, scanner.bytes_seen, snapshot=snapshot)
+    detection.verdicts = dict(zip(selector_sets, verdicts))
+    return detection
+
+
+def detect_stock(content, known_hash=None, selector_sets=(), capture=None):
+    """Run stock detection over a fully downloaded page and return a Detection."""
+    return detect_stock_streaming((content,), known_hash, selector_sets, capture)
+
+
+def product_attributes(payload):
+    """The product_attributes object in a product-attributes endpoint response, or None."""
+    try:
+        body = json.loads(payload)
+    except ValueError:
+        return None
+    data = body.get('data') if isinstance(body, dict) else None
+    return data if isinstance(data, dict) else None
+
+
+def detect_stock_attributes(attributes, option_stock=None, known_hash=None, capture=None, bytes_read=0):
+    """Run stock detection over product_attributes from the storefront's JSON endpoint.
+
+    option_stock maps option value IDs that were queried one at a time to
+    whether that selection is in stock, and then replaces the product's own
+    lists of available values. The attributes are wrapped as BCData, so
+    content hashes, verdicts and 'bcdata' snapshots work as they do for a
+    page. Returns None when the attributes give no verdict, even if their
+    hash matches known_hash.
+    """
+    if option_stock is not None:
+        available = [value for value, in_stock in option_stock.items() if in_stock]
+        attributes = dict(attributes, instock=bool(available), available_variant_values=available,
+                          in_stock_attributes=available)
+    raw = json.dumps({'product_attributes': attributes}, separators=(',', ':'), sort_keys=True).encode()
+    record = StockRecord.from_bcdata({'product_attributes': attributes})
+    verdict = record.verdict()
+    if verdict is None:
+        return None
+    content_hash = hash_bcdata(raw)
+    if content_hash == known_hash:
+        return Detection(bytes_read=bytes_read, content_hash=content_hash, unchanged=True)
+    snapshot = ('bcdata', raw) if capture is not None else None
+    return Detection(verdict[0], verdict[1], record, bytes_read, content_hash, snapshot=snapshot)
+
+
+def parse_with_soup(content):
+    """Full BeautifulSoup parse of a product page.
+
+    This is the original detection path, kept as the baseline for
+    benchmarks/bench_parser.py; the monitor itself no longer calls it.
+    """
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(content, 'html.parser')
+
+    # Look for the BCData JavaScript object which contains stock information
+    scripts = soup.find_all('script')
+    available_variants = []
+
+    for script in scripts:
+        if script.string and 'BCData' in script.string:
+            script_content = script.string
+
+            # Extract available_modifier_values
+            values_match = re.search(r'"available_modifier_values":\[(.*?)\]', script_content)
+            if values_match and values_match.group(1).strip():
+                available_variants = [v.strip('"') for v in values_match.group(1).split(',') if v.strip()]
+
+            # Also check available_variant_values
+            values_match = re.search(r'"available_variant_values":\[(.*?)\]', script_content)
+            if values_match and values_match.group(1).strip():
+                available_variants = [v.strip('"') for v in values_match.group(1).split(',') if v.strip()]
+                return True, f"Color variants are available: {available_variants}"
+
+            # Check for positive stock indicators
+            if '"instock":true' in script_content:
+                return True, "Product is in stock"
+
+            # Check for negative stock indicators
+            if '"instock":false' in script_content:
+                return False, "Product is not in stock"
+
+            # Check purchasing message
+            if f'"purchasing_message":"{UNAVAILABLE_MESSAGE}"' in script_content:
+                return False, "Selected product combination is currently unavailable"
+
+            break
+
+    # Fallback: Look for color options in HTML
+    color_options = soup.find_all('option', string=lambda text: text and any(color in text.lower() for color in ['blue', 'gray', 'pink', 'yellow']))
+    if color_options:
+        available_colors = [option.get_text().strip() for option in color_options if option.get_text().strip()]
+        return True, f"Color variants are available: {available_colors}"
+
+    # Look for out of stock indicators in HTML
+    out_of_stock_indicators = [
+        "out of stock",
+        "sold out",
+        "unavailable",
+        "backorder",
+        "preorder",
+        "currently unavailable"
+    ]
+
+    page_text = soup.get_text().lower()
+    for indicator in out_of_stock_indicators:
+        if indicator in page_text:
+            return False, f"Product shows as {indicator}"
+
+    # If we found available variants, any of them being available is enough
+    if available_variants:
+        return True, f"Color variants are now available: {available_variants}"
+    return False, "No color variants are currently available"
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Compiled CSS selector engine for the handcuffs monitor
+Each item's in_stock / out_of_stock selector lists are translated to XPath
+once and evaluated together in a single XPath call per page. lxml and
+cssselect are only imported when a page actually needs the HTML fallback
+"""
+
+import logging
+import threading
+
+log = logging.getLogger("handcuffs.selectors")
+
+# Used for items that don't define their own selectors
+DEFAULT_SELECTORS = {
+    'out_of_stock': ".out-of-stock, .sold-out, .unavailable, .product-unavailable, [data-stock='0'], "
+                    ".stock-status.out, .backorder, .preorder, .variant-unavailable, .no-stock",
+    'in_stock': ".add-to-cart:not(:disabled), .buy-now:not(:disabled), .purchase-button:not(:disabled), "
+                ".stock-status.in, [data-stock='1'], .product-available, .in-stock, .variant-available",
+}
+
+COLORS = ('blue', 'gray', 'pink', 'yellow')
+
+# <option> elements whose text names one of the colors
+COLOR_OPTIONS = "//option[" + " or ".join(
+    f"contains(translate(., 'ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz'), '{color}')"
+    for color in COLORS) + "]"
+
+_color_options_xpath = None
+
+
+def color_options_xpath():
+    """Compiled COLOR_OPTIONS, built on first use."""
+    global _color_options_xpath
+    if _color_options_xpath is None:
+        from lxml import etree
+        _color_options_xpath = etree.XPath(COLOR_OPTIONS)
+    return _color_options_xpath
+
+
+def translate_selector_list(css, translator, prefix='descendant-or-self::'):
+    """Translate a comma-separated selector list to one XPath union, skipping bad selectors."""
+    from cssselect import SelectorError
+
+    parts = []
+    for selector in css.split(','):
+        selector = selector.strip()
+        if not selector:
+            continue
+        try:
+            parts.append(translator.css_to_xpath(selector, prefix))
+        except SelectorError as e:
+            log.warning(f"⚠️ Skipping unsupported selector '{selector}': {e}")
+    return " | ".join(parts)
+
+
+class CompiledSelectors:
+    """One item's selector lists compiled into a single XPath expression."""
+
+    def __init__(self, in_stock_css, out_of_stock_css):
+        self.in_stock_css = in_stock_css
+        self.out_of_stock_css = out_of_stock_css
+        self.xpath = None
+        self.lock = threading.Lock()
+
+    def compile(self):
+        """Translate and compile the XPath if that hasn't happened yet."""
+        with self.lock:
+            if self.xpath is None:
+                from cssselect import HTMLTranslator
+                from lxml import etree
+
+                translator = HTMLTranslator()
+                in_xpath = translate_selector_list(self.in_stock_css, translator)
+                out_xpath = translate_selector_list(self.out_of_stock_css, translator)
+                # boolean() stops at the first match; concat() keeps it to one evaluation per page
+                self.xpath = etree.XPath(
+                    f"concat(boolean({in_xpath or '/..'}), ' ', boolean({out_xpath or '/..'}))")
+        return self.xpath
+
+    def evaluate(self, tree):
+        """Return (in_stock_matched, out_of_stock_matched) for a parsed page."""
+        in_matched, out_matched = (self.xpath or self.compile())(tree).split()
+        return in_matched == 'true', out_matched == 'true'
+
+
+class SelectorEngine:
+    """Cache of CompiledSelectors shared by every item with the same selector lists."""
+
+    def __init__(self):
+        self.cache = {}
+        self.lock = threading.Lock()
+
+    def for_item(self, item):
+        selectors = item.get('selectors') or DEFAULT_SELECTORS
+        key = (selectors.get('in_stock', ''), selectors.get('out_of_stock', ''))
+        with self.lock:
+            compiled = self.cache.get(key)
+            if compiled is None:
+                compiled = self.cache[key] = CompiledSelectors(*key)
+            return compiled
+
+    def compile_items(self, items):
+        """Compile every item's selectors up front (called at config load)."""
+        for item in items:
+            self.for_item(item).compile()
+
+
+def parse_with_selectors(content, selector_sets):
+    """Parse a page with lxml and return one (in_stock, message) per selector set.
+
+    Selector matches decide first; a page matching neither list falls back to
+    the color <option> check.
+    """
+    from lxml import etree
+
+    parser = etree.HTMLParser()
+    tree = etree.fromstring(content, parser)
+    if tree is None:
+        return [(False, "No color variants are currently available")] * max(1, len(selector_sets))
+    try:
+        return evaluate_tree(tree, selector_sets)
+    finally:
+        # Free the libxml2 document now rather than whenever the last reference goes
+        tree.clear()
+
+
+def evaluate_tree(tree, selector_sets):
+    """One (in_stock, message) per selector set for a parsed page."""
+    color_verdict = None
+    verdicts = []
+    for selectors in selector_sets or (None,):
+        in_matched, out_matched = selectors.evaluate(tree) if selectors is not None else (False, False)
+        if in_matched:
+            verdicts.append((True, "Page shows in-stock indicators"))
+        elif out_matched:
+            verdicts.append((False, "Page shows out-of-stock indicators"))
+        else:
+            if color_verdict is None:
+                colors = [text for text in ("".join(option.itertext()).strip() for option in color_options_xpath()(tree)) if text]
+                if colors:
+                    color_verdict = (True, f"Color variants are available: {colors}")
+                else:
+                    color_verdict = (False, "No color variants are currently available")
+            verdicts.append(color_verdict)
+    return verdicts
@@ -4,22 +4,25 @@ Cleanup script for ASP Handcuffs Monitor
 Use this when you no longer need the monitor (e.g., after getting your handcuffs)
 """
 
+import glob
 import os
 import subprocess
 import sys
 import shutil
+import time
+
+from control import ControlUnavailable, send_command
 
 def check_monitor_status():
     """Check if the monitor is currently running."""
     print("🔍 Checking monitor status...")
     
-    # Check if process is running
-    result = subprocess.run("pgrep -f simple_handcuffs_monitor.py", shell=True, capture_output=True)
-    if result.returncode == 0:
-        pids = result.stdout.decode().strip().split('\n')
-        print(f"✅ Monitor is running (PID: {', '.join(pids)})")
+    # Ask the running monitor over its control socket
+    try:
+        response = send_command('status')
+        print(f"✅ Monitor is running (PID: {response['pid']})")
         return True
-    else:
+    except ControlUnavailable:
         print("❌ Monitor is not currently running")
         return False
 
@@ -39,11 +42,29 @@ def stop_monitor():
     """Stop the monitor process."""
     print("🛑 Stopping monitor process...")
     
-    result = subprocess.run("pkill -f simple_handcuffs_monitor.py", shell=True, capture_output=True)
-    if result.returncode == 0:
-        print("✅ Monitor process stopped")
-    else:
+    try:
+        pid = send_command('status')['pid']
+        send_command('stop')
+    except ControlUnavailable:
         print("ℹ️ No monitor process was running")
+        return
+    # State and queued emails are flushed before the process exits, retries included
+    deadline = time.monotonic() + 120
+    while process_running(pid) and time.monotonic() < deadline:
+        time.sleep(0.5)
+    if process_running(pid):
+        print(f"⚠️ Monitor (PID: {pid}) is still shutting down")
+    else:
+        print("✅ Monitor process stopped")
+
+def process_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
 
 def unload_launchagent():
     """Unload the LaunchAgent."""
@@ -85,8 +106,14 @@ def cleanup_files():
         "handcuffs_monitor.log",
         "handcuffs_monitor_error.log", 
         "previous_status.json",
+        "monitor_state.db",
+        "monitor_state.db-wal",
+        "monitor_state.db-shm",
+        "metrics_summary.json",
+        "monitor.sock",
+        "events.jsonl",
         "com.handcuffs.monitor.plist"
-    ]
+    ] + sorted(glob.glob("handcuffs_monitor.log.*"))
     
     removed_count = 0
     for file in files_to_remove:
@@ -100,6 +127,15 @@ def cleanup_files():
         else:
             print(f"ℹ️ {file} not found")
     
+    # Archived page snapshots
+    if os.path.isdir("snapshots"):
+        try:
+            shutil.rmtree("snapshots")
+            print("✅ Removed snapshots/")
+            removed_count += 1
+        except Exception as e:
+            print(f"❌ Error removing snapshots/: {e}")
+    
     return removed_count
 
 def show_remaining_files():
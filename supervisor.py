@@ -0,0 +1,440 @@
+#!/usr/bin/env python3
+"""
+Sharded multi-process mode for the handcuffs monitor
+A coordinator starts N worker processes and gives each a shard of the items by
+consistent hashing on the item key. Workers fetch and parse; the coordinator
+owns the state store and email notifications and restarts crashed workers,
+moving their shard to the survivors in the meantime
+"""
+
+import bisect
+import hashlib
+import logging
+import multiprocessing
+import queue
+import signal
+import threading
+import time
+from datetime import datetime
+
+from monitor_log import setup_logging
+from simple_handcuffs_monitor import SimpleHandcuffsMonitor, item_key
+
+log = logging.getLogger("handcuffs.supervisor")
+
+VIRTUAL_NODES = 64
+MAX_RESTART_DELAY = 60
+
+
+def ring_hash(value):
+    return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], 'big')
+
+
+class HashRing:
+    """Consistent hash ring; removing a node only moves that node's keys."""
+
+    def __init__(self, nodes=(), vnodes=VIRTUAL_NODES):
+        self.vnodes = vnodes
+        self.points = []
+        self.owners = {}
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node):
+        for i in range(self.vnodes):
+            point = ring_hash(f"{node}#{i}")
+            self.owners[point] = node
+            bisect.insort(self.points, point)
+
+    def remove(self, node):
+        self.points = [point for point in self.points if self.owners[point] != node]
+        self.owners = {point: owner for point, owner in self.owners.items() if owner != node}
+
+    def node_for(self, key):
+        if not self.points:
+            return None
+        index = bisect.bisect(self.points, ring_hash(key)) % len(self.points)
+        return self.owners[self.points[index]]
+
+
+class ShardMonitor(SimpleHandcuffsMonitor):
+    """Monitor running inside a worker process.
+
+    Sweep results, alerts and transition events are sent to the coordinator
+    instead of being written to the state store, emailed or published from here.
+    Each worker uses 1/workers of every host's politeness limits, and only
+    the worker the coordinator hands the full item list scans the catalog.
+    """
+
+    def __init__(self, config_file, worker_id, results, workers=1):
+        self.politeness_share = 1 / max(1, workers)
+        # Every configured item while this worker scans the catalog for all shards, else None
+        self.catalog_items = None
+        super().__init__(config_file)
+        self.worker_id = worker_id
+        self.results = results
+
+    def save_previous_status(self):
+        statuses, observations, validators, removed, variants, listings = self.take_pending_state()
+        # Checks are counted and timed here; the coordinator serves the metrics
+        metrics = self.metrics.take_delta()
+        if statuses or observations or validators or removed or variants or listings or metrics:
+            self.results.put(('sweep', self.worker_id, statuses, observations, validators, removed, variants,
+                              listings, metrics))
+
+    def send_notification(self, item, subject, message):
+        self.results.put(('alert', self.worker_id, item, subject, message))
+
+    def open_event_hub(self):
+        # The coordinator owns the event stream and outbox
+        pass
+
+    def publish_event(self, event):
+        self.results.put(('event', self.worker_id, event))
+
+    def assign(self, items, statuses, validators, variants, config, catalog_items=None):
+        """Take over a new shard, seeded with the coordinator's state for new items.
+
+        config is the coordinator's current config, so a reload reaches the
+        worker's schedule, fetch, politeness and catalog settings.
+        """
+        if config != self.config:
+            self.apply_config(config)
+        self.catalog_items = catalog_items
+        with self.status_lock:
+            self.previous_status.update(statuses)
+            self.variant_status.update(variants)
+            self.validators.update(validators)
+        self.schedule_items(items)
+        self.scheduler.wake()
+
+    def catalog_jobs(self, items):
+        # One worker scans for every shard, so listing requests aren't repeated per worker
+        if self.catalog_items is None:
+            return []
+        return super().catalog_jobs(self.catalog_items)
+
+    def record_listing(self, entries, kind):
+        # The coordinator holds every shard's status, so it decides which checks to bring forward
+        self.results.put(('listing', self.worker_id, entries, kind))
+        return None
+
+    def shutdown(self):
+        self.scheduler.stop()
+        if self.pool is not None:
+            self.pool.shutdown()
+        self.close_http_client()
+        self.metrics.close()
+        self.store.close()
+
+
+def run_worker(worker_id, config_file, commands, results, log_queue, workers=1):
+    """Entry point of a worker process."""
+    # Ctrl+C goes to the whole process group; let the coordinator drive shutdown
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # The coordinator owns the log file; records travel to it over log_queue
+    setup_logging(log_queue=log_queue)
+    monitor = ShardMonitor(config_file, worker_id, results, workers)
+    signal.signal(signal.SIGTERM, lambda signum, frame: monitor.scheduler.stop())
+
+    def listen():
+        while True:
+            command = commands.get()
+            if command[0] == 'assign':
+                monitor.assign(*command[1:])
+            elif command[0] == 'run_now':
+                monitor.scheduler.run_now(command[1])
+            elif command[0] == 'listings':
+                monitor.merge_listings(command[1])
+            elif command[0] == 'profile':
+                # Dumps go to the log, which the coordinator writes
+                monitor.control_profile(command[1])
+            elif command[0] == 'stop':
+                monitor.scheduler.stop()
+                return
+
+    threading.Thread(target=listen, name="commands", daemon=True).start()
+    try:
+        monitor.run_loop()
+    finally:
+        monitor.shutdown()
+        results.put(('exit', worker_id))
+
+
+class Supervisor:
+    """Coordinator for N sharded worker processes."""
+
+    def __init__(self, monitor, workers, pipeline):
+        self.monitor = monitor
+        self.count = workers
+        self.pipeline = pipeline
+        self.context = multiprocessing.get_context('spawn')
+        self.results = self.context.Queue()
+        self.log_queue = self.context.Queue()
+        self.workers = {}
+        self.ring = HashRing()
+        self.shards = {}
+        self.stopping = False
+        self.reload_requested = False
+        # Held by the coordinator loop and by control commands that touch workers or shards
+        self.lock = threading.RLock()
+        self.control = None
+        # Worker that scans the catalog for every shard
+        self.catalog_owner = None
+
+    def start_worker(self, worker_id):
+        commands = self.context.Queue()
+        process = self.context.Process(
+            target=run_worker, name=f"monitor-worker-{worker_id}",
+            args=(worker_id, self.monitor.config_file, commands, self.results, self.log_queue, self.count))
+        process.start()
+        worker = self.workers.setdefault(worker_id, {'restarts': 0, 'restart_at': None})
+        worker.update(process=process, commands=commands, restart_at=None, started=time.monotonic())
+        self.shards[worker_id] = set()
+        self.ring.add(worker_id)
+        log.info(f"👷 Worker {worker_id} started (pid {process.pid})",
+                 extra={'event': 'worker_started', 'worker': worker_id, 'pid': process.pid})
+
+    def rebalance(self, force=False):
+        """Send every live worker its shard; only items new to a worker carry state.
+
+        With force (after a reload) every worker gets its shard again so
+        changed item settings reach it.
+        """
+        shards = {worker_id: [] for worker_id in self.shards}
+        for item in self.monitor.config['items']:
+            owner = self.ring.node_for(item_key(item))
+            if owner is not None:
+                shards[owner].append(item)
+        if self.monitor.catalog is not None:
+            self.monitor.catalog.index(self.monitor.config['items'])
+        catalog_owner = min(shards) if shards and self.monitor.catalog is not None else None
+        moved = {catalog_owner, self.catalog_owner} if catalog_owner != self.catalog_owner else set()
+        self.catalog_owner = catalog_owner
+
+        for worker_id, items in shards.items():
+            keys = {item_key(item) for item in items}
+            if keys == self.shards[worker_id] and not force and worker_id not in moved:
+                continue
+            new_keys = keys - self.shards[worker_id]
+            with self.monitor.status_lock:
+                statuses = {key: self.monitor.previous_status[key] for key in new_keys
+                            if key in self.monitor.previous_status}
+                variants = {key: dict(self.monitor.variant_status[key]) for key in new_keys
+                            if key in self.monitor.variant_status}
+                validators = {item['url']: self.monitor.validators[item['url']] for item in items
+                              if item_key(item) in new_keys and item['url'] in self.monitor.validators}
+            catalog_items = self.monitor.config['items'] if worker_id == catalog_owner else None
+            self.workers[worker_id]['commands'].put(('assign', items, statuses, validators, variants,
+                                                     self.monitor.config, catalog_items))
+            self.shards[worker_id] = keys
+            log.info(f"📦 Worker {worker_id} owns {len(items)} item(s)")
+
+    def handle(self, message):
+        kind = message[0]
+        if kind == 'sweep':
+            _, worker_id, statuses, observations, validators, removed, variants, listings, metrics = message
+            if metrics is not None:
+                self.monitor.metrics.merge(metrics)
+            with self.monitor.status_lock:
+                for key, status in statuses.items():
+                    self.monitor.previous_status[key] = status
+                for key, variant in variants:
+                    self.monitor.variant_status.setdefault(key, {})[variant.variant_id] = variant
+                for entry in listings:
+                    self.monitor.listing_entries[entry.url] = entry
+                self.monitor.validators.update(validators)
+                for url in removed:
+                    self.monitor.validators.pop(url, None)
+                for observation in observations:
+                    self.monitor.last_observed[observation['item_key']] = observation
+            self.monitor.store.write_sweep(statuses, observations, validators, removed, variants, listings)
+        elif kind == 'listing':
+            _, worker_id, entries, listing_kind = message
+            escalated = [item_key(item) for item in self.monitor.apply_listing(entries, listing_kind)]
+            self.run_now(escalated)
+            if escalated:
+                log.info(f"📚 Catalog scan by worker {worker_id}: {len(escalated)} check(s) brought forward",
+                         extra={'event': 'catalog_escalated', 'worker': worker_id, 'escalated': escalated})
+            # Entries as merged with earlier scans; every worker needs them for covered_by_catalog
+            for target in self.shards:
+                self.workers[target]['commands'].put(('listings', entries))
+            self.monitor.save_previous_status()
+        elif kind == 'alert':
+            _, worker_id, item, subject, message_text = message
+            self.monitor.send_notification(item, subject, message_text)
+        elif kind == 'event':
+            self.monitor.publish_event(message[2])
+        elif kind == 'exit':
+            pass
+
+    def check_workers(self):
+        """Move a dead worker's shard to the survivors and restart it with backoff."""
+        now = time.monotonic()
+        for worker_id, worker in self.workers.items():
+            process = worker['process']
+            if worker['restart_at'] is None and not process.is_alive():
+                worker['restarts'] += 1
+                # Workers that ran for a while get restarted right away
+                if now - worker['started'] > MAX_RESTART_DELAY:
+                    worker['restarts'] = 1
+                delay = min(MAX_RESTART_DELAY, 2 ** (worker['restarts'] - 1))
+                worker['restart_at'] = now + delay
+                log.error(f"💥 Worker {worker_id} exited with code {process.exitcode}, restarting in {delay}s",
+                          extra={'event': 'worker_exited', 'worker': worker_id, 'exitcode': process.exitcode})
+                self.ring.remove(worker_id)
+                del self.shards[worker_id]
+                self.rebalance()
+            elif worker['restart_at'] is not None and now >= worker['restart_at']:
+                self.start_worker(worker_id)
+                self.rebalance()
+
+    def reload(self):
+        """Re-read the config and reshard; returns the item changes, or None on failure."""
+        config = self.monitor.load_config()
+        if not config:
+            log.error("❌ Config reload failed, keeping the current configuration")
+            return None
+        old = {item_key(item): item for item in self.monitor.config['items']}
+        new = {item_key(item): item for item in config['items']}
+        changes = {
+            'added': [key for key in new if key not in old],
+            'removed': [key for key in old if key not in new],
+            'updated': [key for key in new if key in old and new[key] != old[key]],
+            'unchanged': sum(1 for key in new if key in old and new[key] == old[key]),
+        }
+        self.monitor.apply_config(config)
+        # Every worker gets its shard and the new config
+        self.rebalance(force=True)
+        log.info("🔄 Configuration reloaded", extra={'event': 'reload', **changes})
+        return changes
+
+    def control_status(self):
+        status = self.monitor.control_status()
+        # Schedules live in the workers; estimate from the last observation
+        now = datetime.now()
+        intervals = {item_key(item): self.monitor.item_interval(item) for item in self.monitor.config['items']}
+        for item in status['items']:
+            observed = self.monitor.last_observed.get(item['key'])
+            if observed is not None:
+                elapsed = (now - datetime.fromisoformat(observed['observed_at'])).total_seconds()
+                item['next_due_seconds'] = max(0, intervals[item['key']] - elapsed)
+        return status
+
+    def control_check_now(self, name):
+        keys = self.monitor.matching_keys(name)
+        if not keys:
+            return {'ok': False, 'error': f"No monitored item named {name!r}"}
+        with self.lock:
+            self.run_now(keys)
+        return {'items': keys}
+
+    def run_now(self, keys):
+        """Ask the workers that own these item keys to check them right away."""
+        for key in keys:
+            owner = self.ring.node_for(key)
+            if owner is not None and owner in self.shards:
+                self.workers[owner]['commands'].put(('run_now', key))
+
+    def control_reload(self):
+        with self.lock:
+            changes = self.reload()
+        if changes is None:
+            return {'ok': False, 'error': "Config reload failed, keeping the current configuration"}
+        return changes
+
+    def control_stop(self):
+        self.stopping = True
+        return {}
+
+    def control_profile(self, action="dump"):
+        """Forward a profiling switch or dump request to every worker; dumps appear in the log."""
+        if action not in ('on', 'off', 'dump'):
+            return {'ok': False, 'error': f"Unknown profile action {action!r}; expected on, off or dump"}
+        with self.lock:
+            for worker_id in self.shards:
+                self.workers[worker_id]['commands'].put(('profile', action))
+        return {'workers': len(self.shards), 'profiling': action != 'off'}
+
+    def start_control_server(self):
+        path = self.monitor.config.get('control', {}).get('socket', "monitor.sock")
+        if not path:
+            return
+        from control import ControlServer
+        try:
+            self.control = ControlServer(path, {
+                'status': self.control_status,
+                'check-now': self.control_check_now,
+                'reload': self.control_reload,
+                'stop': self.control_stop,
+                'profile': self.control_profile,
+            })
+        except (OSError, RuntimeError) as e:
+            log.error(f"❌ Control socket unavailable: {e}")
+            return
+        self.control.start()
+
+    def run(self):
+        """Start the workers and coordinate them until stopped."""
+        log.info(f"🔗 Starting Simple ASP Handcuffs Monitor with {self.count} worker processes...")
+        self.pipeline.listen(self.log_queue)
+        self.monitor.start_metrics_server()
+        self.monitor.start_event_stream()
+        self.start_control_server()
+
+        def request_stop(signum, frame):
+            self.stopping = True
+
+        def request_reload(signum, frame):
+            self.reload_requested = True
+
+        signal.signal(signal.SIGTERM, request_stop)
+        signal.signal(signal.SIGINT, request_stop)
+        if hasattr(signal, 'SIGHUP'):
+            signal.signal(signal.SIGHUP, request_reload)
+
+        for worker_id in range(self.count):
+            self.start_worker(worker_id)
+        self.rebalance()
+
+        try:
+            while not self.stopping:
+                try:
+                    message = self.results.get(timeout=1)
+                except queue.Empty:
+                    message = None
+                with self.lock:
+                    if message is not None:
+                        self.handle(message)
+                    if self.reload_requested:
+                        self.reload_requested = False
+                        self.reload()
+                    self.check_workers()
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        """Stop the workers, apply their last results and flush the coordinator, then close the control socket."""
+        log.info("🛑 Stopping workers...")
+        for worker in self.workers.values():
+            if worker['restart_at'] is None and worker['process'].is_alive():
+                worker['commands'].put(('stop',))
+        deadline = time.monotonic() + 30
+        running = {worker_id for worker_id, worker in self.workers.items() if worker['process'].is_alive()}
+        while running and time.monotonic() < deadline:
+            try:
+                message = self.results.get(timeout=0.5)
+            except queue.Empty:
+                running = {worker_id for worker_id in running if self.workers[worker_id]['process'].is_alive()}
+                continue
+            self.handle(message)
+            if message[0] == 'exit':
+                running.discard(message[1])
+        for worker in self.workers.values():
+            worker['process'].join(5)
+            if worker['process'].is_alive():
+                worker['process'].terminate()
+        self.monitor.shutdown()
+        # Last, as in SimpleHandcuffsMonitor.shutdown
+        if self.control is not None:
+            self.control.close()
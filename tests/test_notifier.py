@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Tests for the email notification dispatcher against a local aiosmtpd server
+Run from the repository root with: python -m pytest -q
+"""
+
+import email
+import email.policy
+import logging
+import socket
+import time
+
+import pytest
+
+pytest.importorskip("aiosmtpd")
+from aiosmtpd.controller import Controller
+
+from notifier import NotificationDispatcher
+
+
+class RecordingHandler:
+    """Accepts messages, remembering each one and the connection it came over.
+
+    The first fail_first DATA commands are answered with a temporary error.
+    """
+
+    def __init__(self, fail_first=0):
+        self.fail_first = fail_first
+        self.attempts = 0
+        self.messages = []
+        self.peers = []
+
+    async def handle_DATA(self, server, session, envelope):
+        self.attempts += 1
+        if self.attempts <= self.fail_first:
+            return "451 Try again later"
+        self.messages.append(email.message_from_bytes(envelope.content, policy=email.policy.default))
+        self.peers.append(session.peer)
+        return "250 OK"
+
+
+@pytest.fixture
+def smtp():
+    handler = RecordingHandler()
+    controller = Controller(handler, hostname="127.0.0.1", port=free_port())
+    controller.start()
+    try:
+        yield controller
+    finally:
+        controller.stop()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def dispatcher_for(port, **settings):
+    config = {'smtp_server': "127.0.0.1", 'smtp_port': port, 'starttls': False,
+              'sender_email': "monitor@localhost", 'sender_password': "",
+              'recipient_email': "alerts@localhost", 'coalesce_seconds': 0.2, 'retry_delay_seconds': 0.05}
+    config.update(settings)
+    return NotificationDispatcher(config)
+
+
+def item(number):
+    return {'name': f"Item {number}", 'url': f"https://example.com/item-{number}"}
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out")
+        time.sleep(0.01)
+
+
+def test_alerts_close_together_become_one_digest(smtp):
+    dispatcher = dispatcher_for(smtp.port)
+    for number in range(3):
+        dispatcher.notify(item(number), "In stock", f"Item {number} is in stock")
+    dispatcher.stop()
+
+    assert len(smtp.handler.messages) == 1
+    digest = smtp.handler.messages[0]
+    assert digest['Subject'].endswith("3 items changed")
+    body = digest.get_body(('plain',)).get_content()
+    assert all(f"Item {number}" in body for number in range(3))
+
+
+def test_session_is_reused_across_alerts(smtp):
+    dispatcher = dispatcher_for(smtp.port)
+    dispatcher.notify(item(1), "In stock", "Item 1 is in stock")
+    wait_for(lambda: len(smtp.handler.messages) == 1)
+    dispatcher.notify(item(2), "In stock", "Item 2 is in stock")
+    dispatcher.stop()
+
+    assert len(smtp.handler.messages) == 2
+    assert smtp.handler.peers[0] == smtp.handler.peers[1]
+    assert not smtp.handler.messages[0]['Subject'].endswith("items changed")
+
+
+def test_failed_send_is_retried(smtp):
+    smtp.handler.fail_first = 2
+    dispatcher = dispatcher_for(smtp.port)
+    dispatcher.notify(item(1), "In stock", "Item 1 is in stock")
+    dispatcher.stop()
+
+    assert smtp.handler.attempts == 3
+    assert len(smtp.handler.messages) == 1
+
+
+def test_undelivered_alerts_are_logged_at_shutdown(caplog):
+    # Nothing listens on this port, so every attempt fails
+    dispatcher = dispatcher_for(free_port(), max_retries=50, retry_delay_seconds=0.1)
+    dispatcher.notify(item(1), "In stock", "Item 1 is in stock")
+    time.sleep(0.3)
+    dispatcher.notify(item(2), "In stock", "Item 2 is in stock")
+    with caplog.at_level(logging.ERROR, logger="handcuffs.notifier"):
+        dispatcher.stop(timeout=0.5)
+
+    lost = [record.item for record in caplog.records if getattr(record, 'event', None) == 'notification_lost']
+    assert sorted(lost) == ["Item 1", "Item 2"]